@@ -1,22 +1,180 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import json
+import atexit
+import math
 import os
 from datetime import datetime
 
+from config import (DATA_DIR, PRODUCTS_DB, ORDERS_DB, USERS_DB, ORDERS_JOURNAL, ORDERS_DIR,
+                    IDEMPOTENCY_DB, IDEMPOTENCY_JOURNAL, IDEMPOTENCY_MAX_KEYS,
+                    IDEMPOTENCY_TTL, IDEMPOTENCY_WAIT, PRODUCT_CHANGES_DB,
+                    PRODUCT_CHANGES_JOURNAL, CHANGELOG_MAX_ENTRIES, SSE_MAX_SUBSCRIBERS,
+                    SSE_MAX_PENDING, SSE_POLL_INTERVAL, SSE_HEARTBEAT, SSE_MAX_DURATION,
+                    IMPORT_CHUNK, IMPORT_MAX_ERRORS, RATE_LIMITS, RATE_LIMIT_CLIENT_HEADER,
+                    TRUST_PROXY, RATE_LIMIT_MAX_CLIENTS, MAX_CONCURRENT_REQUESTS,
+                    STORAGE_BACKEND, SQLITE_DB, FLUSH_INTERVAL, FLUSH_MAX_BATCH,
+                    FSYNC_POLICY, JOURNAL_COMPACT_THRESHOLD, RESPONSE_CACHE_SIZE,
+                    BULK_MAX_ITEMS, PASSWORD_ITERATIONS, PASSWORD_WORKERS,
+                    PASSWORD_MAX_PENDING, SLOW_REQUEST_MS, SHARED_STORAGE, INIT_MARKER,
+                    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_LEVEL)
+import admission
+import compression
+import metrics
+import serializers
+from cache import ResponseCache, versioned_response
+from catalog_io import FORMATOS, MIMETYPES, exportar_csv, exportar_jsonl, formato_de, leer_filas
+from changelog import ChangeLog
+from events import REINTENTO_MS, Broker, BrokerSaturado, EventosCatalogo, stream_eventos
+from inventory import ConflictoInventario, Inventario, ProductoNoEncontrado, StockInsuficiente
+from analytics import CRITERIOS_TOP
+from facets import BUCKETS_DEFECTO, BUCKETS_MAXIMO
+from indexes import CAMPOS_ORDEN
+from idempotency import IdempotencyStore, idempotente
+from journal import IdempotencyRepository
+from locks import FileLock
+from partitions import PartitionedOrderRepository
+from passwords import HasherSaturado, PasswordHasher
+from repository import ProductRepository, UserRepository, WriteBehindWriter
+from responses import (STREAM_CHUNK, cortar_pagina, leer_campos, leer_paginacion, proyectar,
+                       quiere_stream, stream_json_array)
+from sqlite_storage import (SqliteDatabase, SqliteIdempotencyRepository, SqliteOrderRepository,
+                            SqliteProductRepository, SqliteUserRepository, migrate_from_json)
+
 app = Flask(__name__)
 CORS(app)  # Habilitar CORS para todas las rutas
-
-# Archivo de base de datos simple (JSON)
-PRODUCTS_DB = 'data/products.json'
-ORDERS_DB = 'data/orders.json'
-USERS_DB = 'data/users.json'
+# orjson y negociación de MessagePack; las métricas envuelven este proveedor
+serializers.init_app(app)
+metrics.init_app(app, slow_request_ms=SLOW_REQUEST_MS)
+# Registrada después de las métricas: Flask ejecuta los after_request en orden
+# inverso, así la latencia medida incluye el tiempo de compresión
+if COMPRESSION_ENABLED:
+    compression.init_app(app, min_size=COMPRESSION_MIN_SIZE,
+                         gzip_level=GZIP_LEVEL, brotli_level=BROTLI_LEVEL)
+# Límites de tasa y de concurrencia; después de las métricas para que las
+# peticiones rechazadas también se midan
+admision = admission.init_app(app, limites=admission.parsear_limites(RATE_LIMITS),
+                              max_concurrentes=MAX_CONCURRENT_REQUESTS,
+                              cabecera_cliente=RATE_LIMIT_CLIENT_HEADER,
+                              confiar_proxy=TRUST_PROXY, max_claves=RATE_LIMIT_MAX_CLIENTS)
+metrics.registry.callback(
+    'tienda_admission_in_flight', "Peticiones que ocupan una plaza de concurrencia",
+    lambda: {(): admision.en_curso})
+metrics.registry.callback(
+    'tienda_admission_clients', "Clientes con límite de tasa recordados",
+    lambda: {(): len(admision.limitador)})
 
 # Crear directorio data si no existe
-os.makedirs('data', exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
+
+def json_repositories(shared=SHARED_STORAGE):
+    """
+    Repositorios en memoria persistidos en los archivos JSON de DATA_DIR.
+    Con shared=True (varios procesos worker) cada escritura se hace en el
+    momento bajo un bloqueo de archivo en lugar de forma diferida.
+    """
+    # Productos y usuarios se escriben a disco de forma diferida
+    writer = WriteBehindWriter(interval=FLUSH_INTERVAL, max_batch=FLUSH_MAX_BATCH,
+                               fsync_policy=FSYNC_POLICY)
+    diferido = None if shared else writer
+    # Registro de cambios del catálogo, anexado en cada alta, cambio o baja
+    cambios = ChangeLog(PRODUCT_CHANGES_DB, PRODUCT_CHANGES_JOURNAL,
+                        max_entries=CHANGELOG_MAX_ENTRIES,
+                        compact_threshold=JOURNAL_COMPACT_THRESHOLD,
+                        fsync_policy=FSYNC_POLICY, shared=shared)
+    productos = ProductRepository(PRODUCTS_DB, diferido, shared=shared,
+                                  fsync_policy=FSYNC_POLICY, cambios=cambios)
+    usuarios = UserRepository(USERS_DB, diferido, shared=shared,
+                              fsync_policy=FSYNC_POLICY)
+    # Los pedidos se anexan a particiones mensuales en lugar de reescribir
+    # todo el historial; leer uno solo lee su partición
+    pedidos = PartitionedOrderRepository(ORDERS_DIR, legado=(ORDERS_DB, ORDERS_JOURNAL),
+                                         compact_threshold=JOURNAL_COMPACT_THRESHOLD,
+                                         fsync_policy=FSYNC_POLICY, shared=shared)
+    # Claves de idempotencia: también un diario, se escriben en cada POST con clave
+    idempotencia = IdempotencyRepository(IDEMPOTENCY_DB, IDEMPOTENCY_JOURNAL,
+                                         compact_threshold=JOURNAL_COMPACT_THRESHOLD,
+                                         fsync_policy=FSYNC_POLICY, shared=shared)
+    return writer, productos, pedidos, usuarios, idempotencia
+
+def sqlite_repositories():
+    """Repositorios respaldados por una base SQLite en modo WAL"""
+    database = SqliteDatabase(SQLITE_DB)
+    productos = SqliteProductRepository(database, max_cambios=CHANGELOG_MAX_ENTRIES)
+    pedidos = SqliteOrderRepository(database)
+    usuarios = SqliteUserRepository(database)
+    idempotencia = SqliteIdempotencyRepository(database)
+    return database, productos, pedidos, usuarios, idempotencia
+
+if STORAGE_BACKEND == 'sqlite':
+    (storage, productos_repo, pedidos_repo, usuarios_repo,
+     idempotencia_repo) = sqlite_repositories()
+elif STORAGE_BACKEND == 'json':
+    (storage, productos_repo, pedidos_repo, usuarios_repo,
+     idempotencia_repo) = json_repositories()
+else:
+    raise ValueError(f"Backend de almacenamiento desconocido: {STORAGE_BACKEND}")
+
+# Hash de contraseñas fuera de los hilos que atienden peticiones
+hasher = PasswordHasher(iterations=PASSWORD_ITERATIONS, max_workers=PASSWORD_WORKERS,
+                        max_pending=PASSWORD_MAX_PENDING)
+atexit.register(hasher.close)
+
+# Reservas de stock sin sobreventa para los pedidos
+inventario = Inventario(productos_repo)
+
+# Cambios de precio y stock para los clientes de /api/productos/stream
+eventos = EventosCatalogo(productos_repo,
+                          Broker(max_suscriptores=SSE_MAX_SUBSCRIBERS,
+                                 max_pendientes=SSE_MAX_PENDING),
+                          intervalo=SSE_POLL_INTERVAL)
+metrics.registry.callback(
+    'tienda_sse_subscribers', "Clientes conectados a /api/productos/stream",
+    lambda: {(): len(eventos.broker)})
+metrics.registry.callback(
+    'tienda_sse_events_total', "Eventos del catálogo publicados, coalescidos y "
+    "suscriptores descartados por no leerlos a tiempo",
+    lambda: {('publicado',): eventos.broker.publicados,
+             ('coalescido',): eventos.broker.coalescidos,
+             ('descartado',): eventos.broker.descartados},
+    labels=('result',), tipo='counter')
+
+# Caché de respuestas serializadas del catálogo, invalidada por versión
+catalogo_cache = ResponseCache(max_entries=RESPONSE_CACHE_SIZE)
+metrics.registry.callback(
+    'tienda_catalog_cache_requests_total', "Consultas a la caché del catálogo por resultado",
+    lambda: {('hit',): catalogo_cache.hits, ('miss',): catalogo_cache.misses},
+    labels=('result',), tipo='counter')
+
+# Resultados de búsqueda por defecto y máximos por petición
+BUSQUEDA_LIMIT_DEFECTO = 20
+BUSQUEDA_LIMIT_MAXIMO = 100
+
+# Cambios del catálogo por defecto y máximos por petición
+CAMBIOS_LIMIT_DEFECTO = 1000
+CAMBIOS_LIMIT_MAXIMO = 10000
 
-def init_database():
-    """Inicializa la base de datos con datos de ejemplo"""
+# Estados válidos de un pedido
+ESTADOS_PEDIDO = ['pendiente', 'pagado', 'enviado', 'entregado', 'cancelado']
+
+# Productos por defecto y máximos del ranking de ventas
+TOP_N_DEFECTO = 10
+TOP_N_MAXIMO = 100
+
+# Volcar las escrituras pendientes al cerrar el proceso
+atexit.register(storage.close)
+atexit.register(pedidos_repo.close)
+atexit.register(idempotencia_repo.close)
+if STORAGE_BACKEND == 'json':
+    atexit.register(productos_repo.cambios.close)
+# Registrado al final: se ejecuta primero y cierra los streams abiertos
+atexit.register(eventos.close)
+
+# Respuestas guardadas de los POST con cabecera Idempotency-Key
+idempotencia = IdempotencyStore(idempotencia_repo, max_entries=IDEMPOTENCY_MAX_KEYS,
+                                ttl=IDEMPOTENCY_TTL, espera_maxima=IDEMPOTENCY_WAIT)
+
+def cargar_datos_ejemplo():
+    """Reemplaza el contenido de la base de datos con datos de ejemplo"""
     # Productos de ejemplo
     sample_products = [
         {
@@ -72,29 +230,62 @@ def init_database():
     ]
     
     # Guardar productos
-    with open(PRODUCTS_DB, 'w', encoding='utf-8') as f:
-        json.dump(sample_products, f, indent=2)
+    productos_repo.reset(sample_products)
     
     # Inicializar órdenes vacías
-    with open(ORDERS_DB, 'w', encoding='utf-8') as f:
-        json.dump([], f, indent=2)
+    pedidos_repo.reset([])
     
     # Inicializar usuarios vacíos
-    with open(USERS_DB, 'w', encoding='utf-8') as f:
-        json.dump([], f, indent=2)
+    usuarios_repo.reset([])
+    
+    # Las respuestas guardadas se refieren a los datos anteriores
+    idempotencia_repo.reset([])
 
-def read_json(file_path):
-    """Lee un archivo JSON y retorna los datos"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+def init_database(forzar=False):
+    """
+    Carga los datos de ejemplo solo la primera vez que arranca la API.
+    Retorna True si se cargaron. Con forzar=True reemplaza los datos existentes.
+    Es seguro llamarla desde varios procesos worker a la vez.
+    """
+    with FileLock(f"{INIT_MARKER}.lock"):
+        # Datos de una versión anterior sin marca: se conservan
+        sembrar = forzar or not (os.path.exists(INIT_MARKER) or productos_repo.count())
+        if sembrar:
+            cargar_datos_ejemplo()
+        with open(INIT_MARKER, 'w', encoding='utf-8') as f:
+            f.write(datetime.now().isoformat())
+    return sembrar
+
+@app.cli.command('reiniciar-datos')
+def reiniciar_datos():
+    """Borra los datos y vuelve a cargar los de ejemplo"""
+    init_database(forzar=True)
+    print("Datos de ejemplo cargados")
+
+@app.cli.command('migrar-sqlite')
+def migrar_sqlite():
+    """Importa los archivos data/*.json en la base SQLite"""
+    _, productos, pedidos, usuarios, idempotencia = json_repositories()
+    (database, sql_productos, sql_pedidos, sql_usuarios,
+     sql_idempotencia) = sqlite_repositories()
+    importados = migrate_from_json(database, {
+        sql_productos: productos.all(),
+        sql_pedidos: pedidos.all(),
+        sql_usuarios: usuarios.all(),
+        sql_idempotencia: idempotencia.all()
+    })
+    database.close()
+    for tabla, cantidad in importados.items():
+        print(f"{tabla}: {cantidad} registros importados en {SQLITE_DB}")
 
-def write_json(file_path, data):
-    """Escribe datos en un archivo JSON"""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+@app.cli.command('reconstruir-estadisticas')
+def reconstruir_estadisticas():
+    """Recalcula las estadísticas de ventas desde los pedidos guardados"""
+    diferencias = pedidos_repo.reconstruir_estadisticas()
+    if diferencias:
+        print("Estadísticas reconstruidas; no coincidían en:", ', '.join(diferencias))
+    else:
+        print("Estadísticas reconstruidas; coincidían con los pedidos guardados")
 
 @app.route('/')
 def home():
@@ -106,56 +297,233 @@ def home():
             "productos": {
                 "listar": "GET /api/productos",
                 "obtener": "GET /api/productos/<int:id>",
+                "buscar": "GET /api/productos/buscar?q=<texto>",
+                "facetas": "GET /api/productos/facetas",
+                "cambios": "GET /api/productos/cambios?since=<secuencia>",
+                "stream": "GET /api/productos/stream",
+                "importar": "POST /api/productos/importar?formato=csv|jsonl",
+                "exportar": "GET /api/productos/exportar?formato=csv|jsonl",
                 "crear": "POST /api/productos",
                 "actualizar": "PUT /api/productos/<int:id>",
-                "eliminar": "DELETE /api/productos/<int:id>"
+                "eliminar": "DELETE /api/productos/<int:id>",
+                "crear_lote": "POST /api/productos/bulk",
+                "actualizar_lote": "PATCH /api/productos/bulk",
+                "eliminar_lote": "DELETE /api/productos/bulk"
             },
             "pedidos": {
                 "listar": "GET /api/pedidos",
                 "crear": "POST /api/pedidos",
-                "obtener": "GET /api/pedidos/<int:id>"
+                "obtener": "GET /api/pedidos/<int:id>",
+                "cambiar_estado": "PUT /api/pedidos/<int:id>/estado",
+                "estadisticas": "GET /api/pedidos/estadisticas",
+                "ventas_por_dia": "GET /api/pedidos/estadisticas/dias",
+                "ventas_por_producto": "GET /api/pedidos/estadisticas/productos",
+                "ventas_por_categoria": "GET /api/pedidos/estadisticas/categorias",
+                "mas_vendidos": "GET /api/pedidos/estadisticas/top"
             },
             "usuarios": {
                 "registro": "POST /api/usuarios/registro",
                 "login": "POST /api/usuarios/login"
-            }
+            },
+            "metricas": "GET /metrics"
         }
     })
 
+@app.route('/metrics')
+def exportar_metricas():
+    """Métricas de la API en formato de texto de Prometheus"""
+    return Response(metrics.registry.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def error_campos():
+    return jsonify({
+        "success": False,
+        "error": "El parámetro fields debe ser una lista de campos separados por comas "
+                 "(ej. id,nombre,items.nombre)"
+    }), 400
+
+def leer_fecha(nombre):
+    """Fecha AAAA-MM-DD del query string, o None. Lanza ValueError si no es válida."""
+    valor = request.args.get(nombre)
+    if valor in (None, ''):
+        return None
+    return datetime.strptime(valor, '%Y-%m-%d').date().isoformat()
+
+# ==================== VALIDACIÓN DE PRODUCTOS ====================
+
+CAMPOS_REQUERIDOS_PRODUCTO = ['nombre', 'precio', 'categoria', 'stock']
+CAMPOS_PERMITIDOS_PRODUCTO = ['nombre', 'descripcion', 'precio', 'categoria', 'stock', 'imagen', 'rating']
+
+def numero_finito(valor, campo):
+    """Valor como float; lanza ValueError si no es un número finito (nan, inf)"""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"El campo {campo} debe ser un número") from None
+    if not math.isfinite(numero):
+        raise ValueError(f"El campo {campo} debe ser un número finito")
+    return numero
+
+def numero_entero(valor, campo):
+    """Valor como int; lanza ValueError si no es un número entero válido"""
+    try:
+        return int(valor)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"El campo {campo} debe ser un número entero") from None
+
+def validar_categoria(valor):
+    """La categoría debe ser un texto no vacío; lanza ValueError si no"""
+    if not isinstance(valor, str) or not valor.strip():
+        raise ValueError("El campo categoria debe ser un texto no vacío")
+    return valor
+
+def construir_producto(data):
+    """
+    Valida los datos de un producto nuevo y retorna el registro sin id.
+    Lanza ValueError si falta un campo o un valor no es válido.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("El producto debe ser un objeto JSON")
+    
+    for field in CAMPOS_REQUERIDOS_PRODUCTO:
+        if field not in data:
+            raise ValueError(f"Campo requerido faltante: {field}")
+    
+    return {
+        "nombre": data['nombre'],
+        "descripcion": data.get('descripcion', ''),
+        "precio": numero_finito(data['precio'], 'precio'),
+        "categoria": validar_categoria(data['categoria']),
+        "stock": numero_entero(data['stock'], 'stock'),
+        "imagen": data.get('imagen', 'default.jpg'),
+        "rating": numero_finito(data.get('rating', 0.0), 'rating')
+    }
+
+def cambios_producto(data):
+    """
+    Campos permitidos de una actualización, validados y con los mismos
+    tipos que al crear. Lanza ValueError si un valor no es válido.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("El producto debe ser un objeto JSON")
+    cambios = {campo: data[campo] for campo in CAMPOS_PERMITIDOS_PRODUCTO if campo in data}
+    
+    # Mismos tipos que al crear, para que los índices de precio sean consistentes
+    if 'precio' in cambios:
+        cambios['precio'] = numero_finito(cambios['precio'], 'precio')
+    if 'categoria' in cambios:
+        validar_categoria(cambios['categoria'])
+    if 'stock' in cambios:
+        cambios['stock'] = numero_entero(cambios['stock'], 'stock')
+    if 'rating' in cambios:
+        cambios['rating'] = numero_finito(cambios['rating'], 'rating')
+    return cambios
+
+def es_id(valor):
+    """Id entero de un registro (true/false de JSON no cuentan como 1/0)"""
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+def leer_lote(data, clave):
+    """Lista de elementos de una petición de lote, o lanza ValueError"""
+    if not isinstance(data, dict) or not isinstance(data.get(clave), list):
+        raise ValueError(f"El cuerpo debe ser un objeto con una lista '{clave}'")
+    if len(data[clave]) > BULK_MAX_ITEMS:
+        raise ValueError(f"El lote supera el máximo de {BULK_MAX_ITEMS} elementos")
+    return data[clave]
+
 # ==================== ENDPOINTS DE PRODUCTOS ====================
 
 @app.route('/api/productos', methods=['GET'])
+@versioned_response(productos_repo, catalogo_cache)
 def get_productos():
     """
     Obtener todos los productos
-    Query parameters opcionales: categoria, min_precio, max_precio
+    Query parameters opcionales: categoria, min_precio, max_precio,
+    limit, cursor (paginación por id), stream (respuesta incremental),
+    ids (lista de IDs separados por comas), sort (precio, rating o
+    stock; con "-" delante, de mayor a menor) y fields (campos a incluir)
     """
     try:
-        productos = read_json(PRODUCTS_DB)
+        try:
+            campos = leer_campos()
+        except ValueError:
+            return error_campos()
+        
+        # Varios productos por ID en una sola petición
+        if request.args.get('ids'):
+            try:
+                ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+            except ValueError:
+                return jsonify({
+                    "success": False,
+                    "error": "El parámetro ids debe ser una lista de enteros separados por comas"
+                }), 400
+            
+            productos = productos_repo.get_many(ids)
+            encontrados = {p['id'] for p in productos}
+            return jsonify({
+                "success": True,
+                "count": len(productos),
+                "productos": proyectar(productos, campos),
+                "no_encontrados": [i for i in ids if i not in encontrados]
+            }), 200
         
         # Filtros opcionales
         categoria = request.args.get('categoria')
         min_precio = request.args.get('min_precio', type=float)
         max_precio = request.args.get('max_precio', type=float)
         
-        productos_filtrados = productos
+        # Listado ordenado: los primeros `limit` según el orden pedido
+        sort = request.args.get('sort')
+        if sort:
+            campo = sort[1:] if sort.startswith('-') else sort
+            if campo not in CAMPOS_ORDEN:
+                return jsonify({
+                    "success": False,
+                    "error": f"Orden inválido. Valores permitidos: {', '.join(CAMPOS_ORDEN)}, "
+                             "con - delante para orden descendente"
+                }), 400
+            try:
+                cursor, limit = leer_paginacion()
+            except ValueError:
+                cursor, limit = None, 0
+            if cursor is not None or limit == 0:
+                return jsonify({
+                    "success": False,
+                    "error": "Con sort, limit debe ser un entero positivo y no se admite cursor"
+                }), 400
+            
+            productos_ordenados = productos_repo.ordenar(
+                campo, sort.startswith('-'), categoria, min_precio, max_precio, limit)
+            return jsonify({
+                "success": True,
+                "count": len(productos_ordenados),
+                "productos": proyectar(productos_ordenados, campos),
+                "sort": sort
+            }), 200
         
-        if categoria:
-            productos_filtrados = [p for p in productos_filtrados 
-                                 if p['categoria'].lower() == categoria.lower()]
+        if quiere_stream():
+            productos = productos_repo.iter_filtrar(categoria, min_precio, max_precio,
+                                                   chunk=STREAM_CHUNK)
+            return stream_json_array("productos", (proyectar(p, campos) for p in productos))
         
-        if min_precio is not None:
-            productos_filtrados = [p for p in productos_filtrados 
-                                 if p['precio'] >= min_precio]
+        try:
+            cursor, limit = leer_paginacion()
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Los parámetros limit y cursor deben ser enteros positivos"
+            }), 400
         
-        if max_precio is not None:
-            productos_filtrados = [p for p in productos_filtrados 
-                                 if p['precio'] <= max_precio]
+        productos_filtrados, next_cursor = cortar_pagina(productos_repo.filtrar(
+            categoria, min_precio, max_precio,
+            cursor=cursor, limit=limit + 1 if limit else None), limit)
         
         return jsonify({
             "success": True,
             "count": len(productos_filtrados),
-            "productos": productos_filtrados
+            "productos": proyectar(productos_filtrados, campos),
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
@@ -164,17 +532,207 @@ def get_productos():
             "error": f"Error al obtener productos: {str(e)}"
         }), 500
 
+@app.route('/api/productos/buscar', methods=['GET'])
+@versioned_response(productos_repo, catalogo_cache)
+def buscar_productos():
+    """
+    Buscar productos por texto en nombre y descripción.
+    Parámetros: q (texto), limit (máximo de resultados), prefijo
+    (false para no completar la última palabra) y fields (campos a incluir)
+    """
+    try:
+        try:
+            campos = leer_campos()
+        except ValueError:
+            return error_campos()
+        
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro q es requerido"
+            }), 400
+        
+        limit = request.args.get('limit', BUSQUEDA_LIMIT_DEFECTO, type=int)
+        if limit is None or limit <= 0:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro limit debe ser un entero positivo"
+            }), 400
+        limit = min(limit, BUSQUEDA_LIMIT_MAXIMO)
+        prefijo = request.args.get('prefijo', 'true').lower() not in ('0', 'false', 'no')
+        
+        resultados, total = productos_repo.buscar(q, limit=limit, prefijo=prefijo)
+        return jsonify({
+            "success": True,
+            "count": len(resultados),
+            "total": total,
+            "productos": [{**proyectar(producto, campos), "relevancia": round(relevancia, 4)}
+                          for producto, relevancia in resultados]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al buscar productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/facetas', methods=['GET'])
+@versioned_response(productos_repo, catalogo_cache)
+def facetas_productos():
+    """
+    Facetas del catálogo para los mismos filtros que GET /api/productos:
+    productos por categoría, histogramas de precio y rating y disponibilidad.
+    Query parameters opcionales: categoria, min_precio, max_precio y
+    buckets (intervalos del histograma de precio, por defecto 10, máximo 50)
+    """
+    try:
+        categoria = request.args.get('categoria')
+        min_precio = request.args.get('min_precio', type=float)
+        max_precio = request.args.get('max_precio', type=float)
+        
+        buckets = request.args.get('buckets', BUCKETS_DEFECTO, type=int)
+        if buckets is None or buckets <= 0:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro buckets debe ser un entero positivo"
+            }), 400
+        
+        facetas = productos_repo.facetas(categoria, min_precio, max_precio,
+                                         min(buckets, BUCKETS_MAXIMO))
+        return jsonify({"success": True, **facetas}), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al calcular las facetas: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/cambios', methods=['GET'])
+@versioned_response(productos_repo, catalogo_cache)
+def cambios_productos():
+    """
+    Cambios del catálogo posteriores a una secuencia (sincronización incremental).
+    Parámetros: since (última secuencia aplicada por el cliente) y limit.
+    Con resync=true el cliente debe descargar de nuevo el catálogo y seguir
+    pidiendo cambios desde ultima_secuencia.
+    """
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                since = -1
+            if since < 0:
+                return jsonify({
+                    "success": False,
+                    "error": "El parámetro since debe ser un entero no negativo"
+                }), 400
+        
+        limit = request.args.get('limit', CAMBIOS_LIMIT_DEFECTO, type=int)
+        if limit is None or limit <= 0:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro limit debe ser un entero positivo"
+            }), 400
+        limit = min(limit, CAMBIOS_LIMIT_MAXIMO)
+        
+        resync, cambios, ultima = productos_repo.cambios_desde(since, limit)
+        if resync:
+            return jsonify({
+                "success": True,
+                "resync": True,
+                "cambios": [],
+                "count": 0,
+                "ultima_secuencia": ultima,
+                "hay_mas": False
+            }), 200
+        
+        hasta = cambios[-1]['secuencia'] if cambios else since
+        return jsonify({
+            "success": True,
+            "resync": False,
+            "cambios": cambios,
+            "count": len(cambios),
+            "ultima_secuencia": hasta,
+            "hay_mas": hasta < ultima
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener cambios de productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/stream', methods=['GET'])
+def stream_productos():
+    """
+    Cambios de precio y stock en tiempo real (Server-Sent Events).
+    Query parameters opcionales: ids (lista de IDs separados por comas) y
+    categoria. Eventos: producto (alta o cambio de precio, stock o
+    categoría), eliminado, descartado (el cliente no leyó a tiempo y debe
+    volver a leer los productos antes de reconectar) y resync. Al reconectar
+    con la cabecera Last-Event-ID se reciben primero los cambios perdidos;
+    si ya no están disponibles llega un evento resync y hay que volver a
+    leer los productos.
+    """
+    try:
+        ids = None
+        if request.args.get('ids'):
+            try:
+                ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+            except ValueError:
+                return jsonify({
+                    "success": False,
+                    "error": "El parámetro ids debe ser una lista de enteros separados por comas"
+                }), 400
+
+        desde = None
+        if request.headers.get('Last-Event-ID'):
+            try:
+                desde = int(request.headers['Last-Event-ID'])
+            except ValueError:
+                return jsonify({
+                    "success": False,
+                    "error": "La cabecera Last-Event-ID debe ser una secuencia entera"
+                }), 400
+
+        try:
+            suscripcion = eventos.suscribir(ids, request.args.get('categoria'), desde)
+        except BrokerSaturado as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 503, {'Retry-After': str(REINTENTO_MS // 1000)}
+
+        return Response(stream_eventos(eventos, suscripcion, heartbeat=SSE_HEARTBEAT,
+                                       duracion_maxima=SSE_MAX_DURATION),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al abrir el stream de productos: {str(e)}"
+        }), 500
+
 @app.route('/api/productos/<int:producto_id>', methods=['GET'])
+@versioned_response(productos_repo, catalogo_cache)
 def get_producto(producto_id):
-    """Obtener un producto específico por ID"""
+    """Obtener un producto específico por ID (query parameter opcional: fields)"""
     try:
-        productos = read_json(PRODUCTS_DB)
-        producto = next((p for p in productos if p['id'] == producto_id), None)
+        try:
+            campos = leer_campos()
+        except ValueError:
+            return error_campos()
+        
+        producto = productos_repo.get(producto_id)
         
         if producto:
             return jsonify({
                 "success": True,
-                "producto": producto
+                "producto": proyectar(producto, campos)
             }), 200
         else:
             return jsonify({
@@ -189,38 +747,24 @@ def get_producto(producto_id):
         }), 500
 
 @app.route('/api/productos', methods=['POST'])
+@idempotente(idempotencia)
 def crear_producto():
-    """Crear un nuevo producto"""
+    """Crear un nuevo producto (admite la cabecera Idempotency-Key)"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Validar campos requeridos
-        required_fields = ['nombre', 'precio', 'categoria', 'stock']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    "success": False,
-                    "error": f"Campo requerido faltante: {field}"
-                }), 400
-        
-        productos = read_json(PRODUCTS_DB)
-        
-        # Generar nuevo ID
-        nuevo_id = max([p['id'] for p in productos], default=0) + 1
-        
-        nuevo_producto = {
-            "id": nuevo_id,
-            "nombre": data['nombre'],
-            "descripcion": data.get('descripcion', ''),
-            "precio": float(data['precio']),
-            "categoria": data['categoria'],
-            "stock": int(data['stock']),
-            "imagen": data.get('imagen', 'default.jpg'),
-            "rating": data.get('rating', 0.0)
-        }
+        try:
+            producto = construir_producto(data)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        productos.append(nuevo_producto)
-        write_json(PRODUCTS_DB, productos)
+        # El repositorio asigna el nuevo ID
+        nuevo_producto = productos_repo.create(producto)
+        eventos.notificar()
         
         return jsonify({
             "success": True,
@@ -238,30 +782,28 @@ def crear_producto():
 def actualizar_producto(producto_id):
     """Actualizar un producto existente"""
     try:
-        data = request.get_json()
-        productos = read_json(PRODUCTS_DB)
+        data = request.get_json(silent=True)
         
-        producto_index = next((i for i, p in enumerate(productos) 
-                             if p['id'] == producto_id), None)
+        # Actualizar campos permitidos
+        try:
+            producto = productos_repo.update(producto_id, cambios_producto(data))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        if producto_index is None:
+        if producto is None:
             return jsonify({
                 "success": False,
                 "error": "Producto no encontrado"
             }), 404
-        
-        # Actualizar campos permitidos
-        campos_permitidos = ['nombre', 'descripcion', 'precio', 'categoria', 'stock', 'imagen', 'rating']
-        for campo in campos_permitidos:
-            if campo in data:
-                productos[producto_index][campo] = data[campo]
-        
-        write_json(PRODUCTS_DB, productos)
+        eventos.notificar()
         
         return jsonify({
             "success": True,
             "message": "Producto actualizado exitosamente",
-            "producto": productos[producto_index]
+            "producto": producto
         }), 200
         
     except Exception as e:
@@ -274,16 +816,12 @@ def actualizar_producto(producto_id):
 def eliminar_producto(producto_id):
     """Eliminar un producto"""
     try:
-        productos = read_json(PRODUCTS_DB)
-        productos_filtrados = [p for p in productos if p['id'] != producto_id]
-        
-        if len(productos_filtrados) == len(productos):
+        if not productos_repo.delete(producto_id):
             return jsonify({
                 "success": False,
                 "error": "Producto no encontrado"
             }), 404
-        
-        write_json(PRODUCTS_DB, productos_filtrados)
+        eventos.notificar()
         
         return jsonify({
             "success": True,
@@ -296,17 +834,292 @@ def eliminar_producto(producto_id):
             "error": f"Error al eliminar producto: {str(e)}"
         }), 500
 
+@app.route('/api/productos/bulk', methods=['POST'])
+def crear_productos_bulk():
+    """
+    Crear varios productos en un solo lote
+    Body: {"productos": [...]}. Se valida todo el lote y se guarda en una
+    sola escritura; el resultado se informa por elemento.
+    """
+    try:
+        try:
+            items = leer_lote(request.get_json(silent=True), 'productos')
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        resultados = [None] * len(items)
+        validos = []
+        for i, data in enumerate(items):
+            try:
+                validos.append((i, construir_producto(data)))
+            except (ValueError, TypeError) as e:
+                resultados[i] = {"index": i, "success": False, "error": str(e)}
+        
+        with productos_repo.batch():
+            for i, producto in validos:
+                resultados[i] = {"index": i, "success": True,
+                                 "producto": productos_repo.create(producto)}
+        eventos.notificar()
+        
+        return jsonify({
+            "success": True,
+            "creados": len(validos),
+            "errores": len(items) - len(validos),
+            "resultados": resultados
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al crear productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/bulk', methods=['PATCH'])
+def actualizar_productos_bulk():
+    """
+    Actualizar varios productos en un solo lote
+    Body: {"productos": [{"id": 1, "precio": 10.0}, ...]}
+    """
+    try:
+        try:
+            items = leer_lote(request.get_json(silent=True), 'productos')
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        resultados = [None] * len(items)
+        validos = []
+        for i, data in enumerate(items):
+            try:
+                if not isinstance(data, dict) or not es_id(data.get('id')):
+                    raise ValueError("Cada elemento debe incluir un id entero")
+                validos.append((i, data['id'], cambios_producto(data)))
+            except (ValueError, TypeError) as e:
+                resultados[i] = {"index": i, "success": False, "error": str(e)}
+        
+        actualizados = 0
+        with productos_repo.batch():
+            for i, producto_id, cambios in validos:
+                try:
+                    producto = productos_repo.update(producto_id, cambios)
+                except ValueError as e:
+                    resultados[i] = {"index": i, "success": False, "id": producto_id,
+                                     "error": str(e)}
+                    continue
+                if producto is None:
+                    resultados[i] = {"index": i, "success": False, "id": producto_id,
+                                     "error": "Producto no encontrado"}
+                else:
+                    resultados[i] = {"index": i, "success": True, "producto": producto}
+                    actualizados += 1
+        eventos.notificar()
+        
+        return jsonify({
+            "success": True,
+            "actualizados": actualizados,
+            "errores": len(items) - actualizados,
+            "resultados": resultados
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al actualizar productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/bulk', methods=['DELETE'])
+def eliminar_productos_bulk():
+    """
+    Eliminar varios productos en un solo lote
+    Body: {"ids": [1, 2, 3]}
+    """
+    try:
+        try:
+            ids = leer_lote(request.get_json(silent=True), 'ids')
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        resultados = []
+        with productos_repo.batch():
+            for i, producto_id in enumerate(ids):
+                if not es_id(producto_id):
+                    resultados.append({"index": i, "success": False, "id": producto_id,
+                                       "error": "El id debe ser un entero"})
+                elif productos_repo.delete(producto_id):
+                    resultados.append({"index": i, "success": True, "id": producto_id})
+                else:
+                    resultados.append({"index": i, "success": False, "id": producto_id,
+                                       "error": "Producto no encontrado"})
+        eventos.notificar()
+        
+        eliminados = sum(1 for r in resultados if r['success'])
+        return jsonify({
+            "success": True,
+            "eliminados": eliminados,
+            "errores": len(ids) - eliminados,
+            "resultados": resultados
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al eliminar productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/importar', methods=['POST'])
+def importar_productos():
+    """
+    Importar productos desde un archivo CSV (con cabecera) o JSONL, en el
+    cuerpo de la petición o como archivo de un formulario (campo archivo).
+    El formato se toma del query parameter formato (csv o jsonl), del
+    Content-Type o de la extensión del archivo. Las filas se validan como
+    en la creación individual y se guardan por bloques; el resultado
+    informa los errores por número de línea.
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            archivo = request.files.get('archivo')
+            if archivo is None:
+                return jsonify({
+                    "success": False,
+                    "error": "El formulario debe incluir el archivo en el campo 'archivo'"
+                }), 400
+            stream = archivo.stream
+            formato = formato_de(archivo.mimetype, archivo.filename)
+        else:
+            stream = request.stream
+            formato = formato_de(request.mimetype)
+        formato = request.args.get('formato', formato)
+        if formato not in FORMATOS:
+            return jsonify({
+                "success": False,
+                "error": "Indique el formato del archivo: formato=csv o formato=jsonl"
+            }), 400
+        
+        importados = 0
+        errores = []
+        total_errores = 0
+        lote = []
+        
+        def guardar():
+            with productos_repo.batch():
+                for producto in lote:
+                    productos_repo.create(producto)
+            eventos.notificar()
+            lote.clear()
+        
+        for linea, data, error in leer_filas(stream, formato):
+            if error is None:
+                try:
+                    lote.append(construir_producto(data))
+                except (ValueError, TypeError) as e:
+                    error = str(e)
+            if error is not None:
+                total_errores += 1
+                if len(errores) < IMPORT_MAX_ERRORS:
+                    errores.append({"linea": linea, "error": error})
+                continue
+            if len(lote) >= IMPORT_CHUNK:
+                importados += len(lote)
+                guardar()
+        if lote:
+            importados += len(lote)
+            guardar()
+        
+        return jsonify({
+            "success": True,
+            "importados": importados,
+            "errores": total_errores,
+            "detalle_errores": errores
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al importar productos: {str(e)}"
+        }), 500
+
+@app.route('/api/productos/exportar', methods=['GET'])
+def exportar_productos():
+    """
+    Exportar el catálogo completo como archivo CSV o JSONL (query parameter
+    formato, por defecto csv). Se genera por bloques a medida que se envía.
+    """
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro formato debe ser csv o jsonl"
+            }), 400
+        
+        productos = productos_repo.iter_all(chunk=STREAM_CHUNK)
+        if formato == 'csv':
+            cuerpo = exportar_csv(productos, ['id'] + CAMPOS_PERMITIDOS_PRODUCTO)
+        else:
+            cuerpo = exportar_jsonl(productos)
+        return Response(stream_with_context(cuerpo), mimetype=MIMETYPES[formato][0],
+                        headers={'Content-Disposition':
+                                 f'attachment; filename="productos.{formato}"'})
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al exportar productos: {str(e)}"
+        }), 500
+
 # ==================== ENDPOINTS DE PEDIDOS ====================
 
 @app.route('/api/pedidos', methods=['GET'])
 def get_pedidos():
-    """Obtener todos los pedidos"""
+    """
+    Obtener todos los pedidos
+    Query parameters opcionales: desde y hasta (fecha de creación
+    AAAA-MM-DD, inclusivas), limit, cursor (paginación por id), stream
+    (respuesta incremental) y fields (campos a incluir, con puntos para
+    los anidados como items.nombre)
+    """
     try:
-        pedidos = read_json(ORDERS_DB)
+        try:
+            campos = leer_campos()
+        except ValueError:
+            return error_campos()
+        
+        try:
+            desde, hasta = leer_fecha('desde'), leer_fecha('hasta')
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Las fechas desde y hasta deben tener el formato AAAA-MM-DD"
+            }), 400
+        
+        if quiere_stream():
+            pedidos = pedidos_repo.iter_filtrar(desde, hasta, chunk=STREAM_CHUNK)
+            return stream_json_array("pedidos", (proyectar(p, campos) for p in pedidos))
+        
+        try:
+            cursor, limit = leer_paginacion()
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Los parámetros limit y cursor deben ser enteros positivos"
+            }), 400
+        
+        pedidos, next_cursor = cortar_pagina(pedidos_repo.filtrar(
+            desde, hasta, cursor=cursor, limit=limit + 1 if limit else None), limit)
         return jsonify({
             "success": True,
             "count": len(pedidos),
-            "pedidos": pedidos
+            "pedidos": proyectar(pedidos, campos),
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
@@ -317,15 +1130,19 @@ def get_pedidos():
 
 @app.route('/api/pedidos/<int:pedido_id>', methods=['GET'])
 def get_pedido(pedido_id):
-    """Obtener un pedido específico por ID"""
+    """Obtener un pedido específico por ID (query parameter opcional: fields)"""
     try:
-        pedidos = read_json(ORDERS_DB)
-        pedido = next((p for p in pedidos if p['id'] == pedido_id), None)
+        try:
+            campos = leer_campos()
+        except ValueError:
+            return error_campos()
+        
+        pedido = pedidos_repo.get(pedido_id)
         
         if pedido:
             return jsonify({
                 "success": True,
-                "pedido": pedido
+                "pedido": proyectar(pedido, campos)
             }), 200
         else:
             return jsonify({
@@ -340,8 +1157,9 @@ def get_pedido(pedido_id):
         }), 500
 
 @app.route('/api/pedidos', methods=['POST'])
+@idempotente(idempotencia)
 def crear_pedido():
-    """Crear un nuevo pedido"""
+    """Crear un nuevo pedido (admite la cabecera Idempotency-Key)"""
     try:
         data = request.get_json()
         
@@ -352,53 +1170,71 @@ def crear_pedido():
                 "error": "El pedido debe contener al menos un item"
             }), 400
         
-        pedidos = read_json(ORDERS_DB)
-        productos = read_json(PRODUCTS_DB)
+        for item in data['items']:
+            cantidad = item.get('cantidad')
+            if not isinstance(cantidad, int) or isinstance(cantidad, bool) or cantidad <= 0:
+                return jsonify({
+                    "success": False,
+                    "error": "La cantidad de cada item debe ser un entero positivo"
+                }), 400
         
-        # Generar nuevo ID
-        nuevo_id = max([p['id'] for p in pedidos], default=0) + 1
+        # Reservar el stock de todos los items de forma atómica
+        try:
+            reserva = inventario.reservar(
+                [(item['producto_id'], item['cantidad']) for item in data['items']])
+        except ProductoNoEncontrado as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 404
+        except StockInsuficiente as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        except ConflictoInventario as e:
+            # Contención pasajera sobre los mismos productos: se puede reintentar
+            return jsonify({
+                "success": False,
+                "error": f"{e}, reintente más tarde"
+            }), 503, {'Retry-After': '1'}
         
-        # Validar stock y calcular total
+        # Calcular total con los productos tal como estaban al reservar
         total = 0
         items_validados = []
         
         for item in data['items']:
-            producto = next((p for p in productos if p['id'] == item['producto_id']), None)
-            if not producto:
-                return jsonify({
-                    "success": False,
-                    "error": f"Producto con ID {item['producto_id']} no encontrado"
-                }), 404
-            
-            if producto['stock'] < item['cantidad']:
-                return jsonify({
-                    "success": False,
-                    "error": f"Stock insuficiente para {producto['nombre']}"
-                }), 400
-            
+            producto = reserva.productos[item['producto_id']]
             subtotal = producto['precio'] * item['cantidad']
             total += subtotal
             
             items_validados.append({
                 "producto_id": item['producto_id'],
                 "nombre": producto['nombre'],
+                "categoria": producto['categoria'],
                 "precio_unitario": producto['precio'],
                 "cantidad": item['cantidad'],
                 "subtotal": subtotal
             })
         
-        nuevo_pedido = {
-            "id": nuevo_id,
-            "cliente": data.get('cliente', {}),
-            "items": items_validados,
-            "total": total,
-            "estado": "pendiente",
-            "fecha_creacion": datetime.now().isoformat(),
-            "direccion_entrega": data.get('direccion_entrega', {})
-        }
-        
-        pedidos.append(nuevo_pedido)
-        write_json(ORDERS_DB, pedidos)
+        # El repositorio asigna el nuevo ID
+        try:
+            nuevo_pedido = pedidos_repo.create({
+                "cliente": data.get('cliente', {}),
+                "items": items_validados,
+                "total": total,
+                "estado": "pendiente",
+                "fecha_creacion": datetime.now().isoformat(),
+                "direccion_entrega": data.get('direccion_entrega', {})
+            })
+        except Exception:
+            # Devolver el stock si el pedido no pudo guardarse
+            reserva.release()
+            raise
+        finally:
+            # El stock cambió al reservar (y al devolverlo si hubo error)
+            eventos.notificar()
+        reserva.commit()
         
         return jsonify({
             "success": True,
@@ -412,6 +1248,157 @@ def crear_pedido():
             "error": f"Error al crear pedido: {str(e)}"
         }), 500
 
+@app.route('/api/pedidos/<int:pedido_id>/estado', methods=['PUT'])
+def actualizar_estado_pedido(pedido_id):
+    """Cambiar el estado de un pedido"""
+    try:
+        data = request.get_json()
+        
+        estado = data.get('estado')
+        if estado not in ESTADOS_PEDIDO:
+            return jsonify({
+                "success": False,
+                "error": f"Estado inválido. Valores permitidos: {', '.join(ESTADOS_PEDIDO)}"
+            }), 400
+        
+        pedido = pedidos_repo.update(pedido_id, {"estado": estado})
+        
+        if pedido is None:
+            return jsonify({
+                "success": False,
+                "error": "Pedido no encontrado"
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            "message": "Estado del pedido actualizado exitosamente",
+            "pedido": pedido
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al actualizar estado del pedido: {str(e)}"
+        }), 500
+
+# ==================== ESTADÍSTICAS DE VENTAS ====================
+
+@app.route('/api/pedidos/estadisticas', methods=['GET'])
+def estadisticas_pedidos():
+    """Totales de ventas (sin pedidos cancelados) y pedidos por estado"""
+    try:
+        return jsonify({
+            "success": True,
+            "estadisticas": pedidos_repo.resumen_ventas()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener estadísticas: {str(e)}"
+        }), 500
+
+@app.route('/api/pedidos/estadisticas/dias', methods=['GET'])
+def ventas_por_dia():
+    """
+    Ventas por día
+    Query parameters opcionales: desde, hasta (AAAA-MM-DD, inclusivos)
+    """
+    try:
+        try:
+            desde, hasta = leer_fecha('desde'), leer_fecha('hasta')
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Los parámetros desde y hasta deben tener el formato AAAA-MM-DD"
+            }), 400
+        
+        dias = pedidos_repo.ventas_por_dia(desde, hasta)
+        return jsonify({
+            "success": True,
+            "count": len(dias),
+            "dias": dias
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener ventas por día: {str(e)}"
+        }), 500
+
+@app.route('/api/pedidos/estadisticas/productos', methods=['GET'])
+def ventas_por_producto():
+    """Unidades, ingresos y pedidos por producto"""
+    try:
+        productos = pedidos_repo.ventas_por_producto()
+        return jsonify({
+            "success": True,
+            "count": len(productos),
+            "productos": productos
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener ventas por producto: {str(e)}"
+        }), 500
+
+@app.route('/api/pedidos/estadisticas/categorias', methods=['GET'])
+def ventas_por_categoria():
+    """Unidades, ingresos y pedidos por categoría"""
+    try:
+        categorias = pedidos_repo.ventas_por_categoria()
+        return jsonify({
+            "success": True,
+            "count": len(categorias),
+            "categorias": categorias
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener ventas por categoría: {str(e)}"
+        }), 500
+
+@app.route('/api/pedidos/estadisticas/top', methods=['GET'])
+def productos_mas_vendidos():
+    """
+    Productos más vendidos
+    Query parameters opcionales: n (por defecto 10, máximo 100) y
+    por (unidades o ingresos)
+    """
+    try:
+        por = request.args.get('por', 'unidades')
+        if por not in CRITERIOS_TOP:
+            return jsonify({
+                "success": False,
+                "error": f"Criterio inválido. Valores permitidos: {', '.join(CRITERIOS_TOP)}"
+            }), 400
+        
+        try:
+            n = int(request.args.get('n', TOP_N_DEFECTO))
+        except ValueError:
+            n = 0
+        if n <= 0:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro n debe ser un entero positivo"
+            }), 400
+        
+        productos = pedidos_repo.top_productos(min(n, TOP_N_MAXIMO), por)
+        return jsonify({
+            "success": True,
+            "por": por,
+            "count": len(productos),
+            "productos": productos
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Error al obtener productos más vendidos: {str(e)}"
+        }), 500
+
 # ==================== ENDPOINTS DE USUARIOS ====================
 
 @app.route('/api/usuarios/registro', methods=['POST'])
@@ -428,26 +1415,27 @@ def registrar_usuario():
                     "error": f"Campo requerido faltante: {field}"
                 }), 400
         
-        usuarios = read_json(USERS_DB)
-        
-        # Verificar si el usuario ya existe
-        if any(u['email'] == data['email'] for u in usuarios):
+        # Verificar si el usuario ya existe antes de calcular el hash
+        if usuarios_repo.find_one('email', data['email']):
             return jsonify({
                 "success": False,
                 "error": "El usuario ya existe"
             }), 409
         
-        nuevo_usuario = {
-            "id": len(usuarios) + 1,
+        # El repositorio asigna el nuevo ID y vuelve a comprobar el email
+        nuevo_usuario = usuarios_repo.create_unique({
             "email": data['email'],
-            "password": data['password'],  # En producción, esto debería estar hasheado
+            "password": hasher.hash(data['password']),
             "nombre": data['nombre'],
             "direccion": data.get('direccion', {}),
             "fecha_registro": datetime.now().isoformat()
-        }
+        })
         
-        usuarios.append(nuevo_usuario)
-        write_json(USERS_DB, usuarios)
+        if nuevo_usuario is None:
+            return jsonify({
+                "success": False,
+                "error": "El usuario ya existe"
+            }), 409
         
         return jsonify({
             "success": True,
@@ -459,6 +1447,12 @@ def registrar_usuario():
             }
         }), 201
         
+    except HasherSaturado as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 503
+        
     except Exception as e:
         return jsonify({
             "success": False,
@@ -477,11 +1471,15 @@ def login_usuario():
                 "error": "Email y password son requeridos"
             }), 400
         
-        usuarios = read_json(USERS_DB)
-        usuario = next((u for u in usuarios 
-                       if u['email'] == data['email'] and u['password'] == data['password']), None)
+        usuario = usuarios_repo.find_one('email', data['email'])
+        valida, necesita_rehash = (hasher.verify(data['password'], usuario['password'])
+                                   if usuario else (False, False))
+        
+        # Migrar contraseñas en texto plano o con otro factor de trabajo
+        if necesita_rehash:
+            usuarios_repo.update(usuario['id'], {"password": hasher.hash(data['password'])})
         
-        if usuario:
+        if valida:
             return jsonify({
                 "success": True,
                 "message": "Login exitoso",
@@ -497,6 +1495,12 @@ def login_usuario():
                 "error": "Credenciales inválidas"
             }), 401
             
+    except HasherSaturado as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 503
+        
     except Exception as e:
         return jsonify({
             "success": False,
@@ -504,19 +1508,32 @@ def login_usuario():
         }), 500
 
 if __name__ == '__main__':
-    # Inicializar base de datos con datos de ejemplo
-    init_database()
-    print("🛒 Base de datos de tienda inicializada correctamente")
-    print("📦 Productos de ejemplo cargados")
+    # Servidor de desarrollo. En producción: gunicorn -c gunicorn.conf.py wsgi:app
+    # Los datos de ejemplo solo se cargan la primera vez
+    if init_database():
+        print("🛒 Base de datos de tienda inicializada correctamente")
+        print("📦 Productos de ejemplo cargados")
+    else:
+        print("🛒 Usando los datos existentes en", DATA_DIR)
     print("🚀 Servidor iniciando en http://localhost:5000")
     print("\nEndpoints disponibles:")
     print("GET  /api/productos     - Listar productos")
     print("GET  /api/productos/:id - Obtener producto específico")
+    print("GET  /api/productos/buscar?q= - Buscar productos por texto")
+    print("GET  /api/productos/facetas - Conteos e histogramas para los filtros")
+    print("GET  /api/productos/cambios?since= - Cambios del catálogo desde una secuencia")
+    print("GET  /api/productos/stream - Cambios de precio y stock en tiempo real (SSE)")
     print("POST /api/productos     - Crear nuevo producto")
     print("PUT  /api/productos/:id - Actualizar producto")
     print("DELETE /api/productos/:id - Eliminar producto")
+    print("POST/PATCH/DELETE /api/productos/bulk - Operaciones en lote")
+    print("POST /api/productos/importar - Importar productos desde CSV o JSONL")
+    print("GET  /api/productos/exportar - Exportar el catálogo en CSV o JSONL")
     print("POST /api/pedidos       - Crear nuevo pedido")
+    print("PUT  /api/pedidos/:id/estado - Cambiar estado de un pedido")
+    print("GET  /api/pedidos/estadisticas[/dias|/productos|/categorias|/top] - Ventas")
     print("POST /api/usuarios/registro - Registrar usuario")
     print("POST /api/usuarios/login - Login de usuario")
+    print("GET  /metrics           - Métricas (Prometheus)")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Control de admisión de peticiones
+
+- Límites de tasa por ruta y cliente (token bucket): cada cliente tiene un
+  cubo por regla que se rellena a `tasa` fichas por segundo hasta `rafaga`;
+  cada petición gasta una ficha y sin fichas se responde 429 con
+  Retry-After
+- Máximo de peticiones simultáneas por proceso: por encima se responde 503
+  de inmediato en lugar de encolar la petición
+
+Los cubos se reparten en fragmentos con su propio lock, así las peticiones
+de clientes distintos casi nunca compiten por el mismo. El estado vive en
+memoria de cada proceso: con varios workers, cada uno aplica el límite por
+su cuenta.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, jsonify, request
+
+from metrics import registry
+
+# Reglas: tokens por segundo y capacidad del cubo
+Limite = namedtuple('Limite', 'tasa rafaga')
+
+UNIDADES = {'s': 1, 'm': 60, 'h': 3600}
+# Fragmentos (lock + cubos) del limitador
+FRAGMENTOS = 64
+# Rutas que nunca se limitan (monitorización)
+RUTAS_EXENTAS = ('/metrics',)
+# Retry-After de las respuestas 503 por concurrencia
+REINTENTO_SATURADO = 1
+
+RECHAZOS = registry.counter(
+    'tienda_admission_rejected_total',
+    "Peticiones rechazadas por límite de tasa (rate_limit, 429) o de concurrencia "
+    "(concurrency, 503)",
+    labels=('method', 'route', 'reason'))
+
+
+def parsear_limites(texto):
+    """
+    Lee reglas "METODO /ruta=N/s[:rafaga]" separadas por punto y coma. La
+    ruta es la de Flask (ej. /api/productos/<int:producto_id>); el método o
+    la ruta pueden ser * para cualquiera. La unidad es s, m o h y la ráfaga
+    por defecto es N. Retorna {(metodo, ruta): Limite}; lanza ValueError.
+    """
+    limites = {}
+    for regla in texto.replace('\n', ';').split(';'):
+        regla = regla.strip()
+        if not regla:
+            continue
+        try:
+            destino, valor = regla.rsplit('=', 1)
+            metodo, ruta = destino.split()
+            tasa, _, rafaga = valor.strip().partition(':')
+            cantidad, unidad = tasa.split('/')
+            cantidad = float(cantidad)
+            rafaga = float(rafaga) if rafaga else cantidad
+            segundos = UNIDADES[unidad.strip()]
+        except (ValueError, KeyError):
+            raise ValueError(f"Regla de límite inválida: {regla!r} "
+                             "(formato: METODO /ruta=N/s[:rafaga])") from None
+        if cantidad <= 0 or rafaga < 1:
+            raise ValueError(f"Regla de límite inválida: {regla!r} "
+                             "(la tasa debe ser positiva y la ráfaga al menos 1)")
+        limites[(metodo.upper(), ruta)] = Limite(cantidad / segundos, rafaga)
+    return limites
+
+
+class LimitadorTasa:
+    """
+    Cubos de fichas por clave, repartidos en fragmentos. Cada fragmento
+    guarda como máximo max_claves / FRAGMENTOS cubos y descarta el usado
+    hace más tiempo (un cubo inactivo ya estaría lleno).
+    """
+
+    def __init__(self, max_claves=100000):
+        self._fragmentos = [(threading.Lock(), OrderedDict()) for _ in range(FRAGMENTOS)]
+        self._max_por_fragmento = max(1, max_claves // FRAGMENTOS)
+
+    def __len__(self):
+        return sum(len(cubos) for _, cubos in self._fragmentos)
+
+    def consumir(self, clave, limite, ahora=None):
+        """Gasta una ficha; retorna 0 si había o los segundos hasta la siguiente"""
+        if ahora is None:
+            ahora = time.monotonic()
+        lock, cubos = self._fragmentos[hash(clave) % FRAGMENTOS]
+        with lock:
+            cubo = cubos.get(clave)
+            if cubo is None:
+                # [fichas, instante de la última recarga]
+                cubo = cubos[clave] = [limite.rafaga, ahora]
+                if len(cubos) > self._max_por_fragmento:
+                    cubos.popitem(last=False)
+            else:
+                cubos.move_to_end(clave)
+                cubo[0] = min(limite.rafaga, cubo[0] + (ahora - cubo[1]) * limite.tasa)
+                cubo[1] = ahora
+            if cubo[0] >= 1:
+                cubo[0] -= 1
+                return 0.0
+            return (1 - cubo[0]) / limite.tasa
+
+
+class ControlAdmision:
+    """Límites de tasa por regla y cliente y máximo de peticiones simultáneas"""
+
+    def __init__(self, limites=None, max_concurrentes=0, cabecera_cliente=None,
+                 confiar_proxy=False, max_claves=100000):
+        self.limites = limites or {}
+        self.max_concurrentes = max_concurrentes
+        self.cabecera_cliente = cabecera_cliente
+        self.confiar_proxy = confiar_proxy
+        self.limitador = LimitadorTasa(max_claves)
+        self._lock = threading.Lock()
+        self.en_curso = 0
+
+    def clave_cliente(self):
+        """
+        Identificador del cliente: la cabecera configurada (p. ej. un id de
+        usuario que añade el gateway de autenticación) o la IP. Detrás de un
+        proxy de confianza, la IP es la última de X-Forwarded-For.
+        """
+        if self.cabecera_cliente:
+            valor = request.headers.get(self.cabecera_cliente)
+            if valor:
+                return 'usuario:' + valor
+        if self.confiar_proxy:
+            reenviado = request.headers.get('X-Forwarded-For')
+            if reenviado:
+                return reenviado.rsplit(',', 1)[-1].strip()
+        return request.remote_addr or ''
+
+    def regla(self, metodo, ruta):
+        """(clave de la regla, Limite) que aplica a la petición, o None"""
+        for clave in ((metodo, ruta), ('*', ruta), (metodo, '*'), ('*', '*')):
+            limite = self.limites.get(clave)
+            if limite is not None:
+                return clave, limite
+        return None
+
+    def admitir(self, metodo, ruta):
+        """
+        Retorna None si la petición pasa, o (status, segundos de Retry-After,
+        motivo). Con None y max_concurrentes, la petición ocupa una plaza que
+        se devuelve con liberar().
+        """
+        regla = self.regla(metodo, ruta)
+        if regla is not None:
+            clave, limite = regla
+            espera = self.limitador.consumir((clave, self.clave_cliente()), limite)
+            if espera:
+                return 429, max(1, math.ceil(espera)), 'rate_limit'
+        if self.max_concurrentes:
+            with self._lock:
+                if self.en_curso >= self.max_concurrentes:
+                    return 503, REINTENTO_SATURADO, 'concurrency'
+                self.en_curso += 1
+        return None
+
+    def liberar(self):
+        with self._lock:
+            self.en_curso -= 1
+
+
+def init_app(app, limites=None, max_concurrentes=0, cabecera_cliente=None,
+             confiar_proxy=False, max_claves=100000):
+    """Instala el control de admisión en la aplicación y lo retorna"""
+    control = ControlAdmision(limites, max_concurrentes, cabecera_cliente,
+                              confiar_proxy, max_claves)
+
+    @app.before_request
+    def _admitir():
+        if (request.method == 'OPTIONS' or request.url_rule is None
+                or request.path in RUTAS_EXENTAS):
+            return None
+        ruta = request.url_rule.rule
+        rechazo = control.admitir(request.method, ruta)
+        if rechazo is None:
+            g._plaza_admision = bool(control.max_concurrentes)
+            return None
+        status, reintento, motivo = rechazo
+        RECHAZOS.inc(method=request.method, route=ruta, reason=motivo)
+        error = ("Demasiadas peticiones, reintente más tarde" if status == 429
+                 else "Servidor saturado, reintente más tarde")
+        return jsonify({"success": False, "error": error}), status, {
+            'Retry-After': str(reintento)}
+
+    @app.teardown_request
+    def _liberar(exc):
+        if g.pop('_plaza_admision', False):
+            control.liberar()
+
+    return control
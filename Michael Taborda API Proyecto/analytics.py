@@ -0,0 +1,234 @@
+"""
+Estadísticas de ventas sobre los pedidos
+
+Los agregados (totales por día, por producto y por categoría, ranking de
+productos y pedidos por estado) se actualizan de forma incremental en cada
+alta, cambio de estado o baja de un pedido, así que una consulta cuesta
+lo que mida su resultado y no el número de pedidos. Los pedidos cancelados
+solo cuentan en los pedidos por estado.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from indexes import normalizar_categoria
+
+# Estado cuyos pedidos no cuentan como venta
+ESTADO_EXCLUIDO = 'cancelado'
+# Criterios para ordenar el ranking de productos
+CRITERIOS_TOP = ('unidades', 'ingresos')
+# Categoría de los items de pedidos creados antes de guardarla en el item
+SIN_CATEGORIA = 'sin categoría'
+
+Aporte = namedtuple('Aporte', 'estado venta dia unidades ingresos productos categorias nombres')
+
+
+def aportes(pedido):
+    """
+    Lo que un pedido suma a los agregados. `productos` asocia cada id con
+    (nombre, categoría, unidades, ingresos) y `categorias` cada categoría
+    normalizada con (unidades, ingresos); un producto repetido en el pedido
+    se suma. `nombres` guarda, por categoría normalizada, las variantes
+    con que aparece escrita en el pedido.
+    """
+    productos = {}
+    categorias = {}
+    nombres = {}
+    for item in pedido.get('items', []):
+        nombre_categoria = item.get('categoria') or SIN_CATEGORIA
+        if not isinstance(nombre_categoria, str):
+            nombre_categoria = str(nombre_categoria)
+        # La clave normalizada solo agrupa; se muestra una de las variantes
+        categoria = normalizar_categoria(nombre_categoria)
+        cantidad = item.get('cantidad', 0)
+        subtotal = item.get('subtotal', 0)
+        _, _, unidades, ingresos = productos.get(item['producto_id'], (None, None, 0, 0))
+        productos[item['producto_id']] = (item.get('nombre'), nombre_categoria,
+                                          unidades + cantidad, ingresos + subtotal)
+        unidades, ingresos = categorias.get(categoria, (0, 0))
+        categorias[categoria] = (unidades + cantidad, ingresos + subtotal)
+        nombres.setdefault(categoria, set()).add(nombre_categoria)
+    return Aporte(
+        estado=pedido.get('estado'),
+        venta=pedido.get('estado') != ESTADO_EXCLUIDO,
+        dia=str(pedido.get('fecha_creacion') or '')[:10],
+        unidades=sum(p[2] for p in productos.values()),
+        ingresos=sum(p[3] for p in productos.values()),
+        productos=productos,
+        categorias=categorias,
+        nombres=nombres)
+
+
+def dinero(valor):
+    return round(valor, 2)
+
+
+def fila_dia(fecha, pedidos, unidades, ingresos):
+    return {"fecha": fecha, "pedidos": pedidos, "unidades": unidades,
+            "ingresos": dinero(ingresos)}
+
+
+def fila_producto(producto_id, nombre, categoria, pedidos, unidades, ingresos):
+    return {"producto_id": producto_id, "nombre": nombre, "categoria": categoria,
+            "pedidos": pedidos, "unidades": unidades, "ingresos": dinero(ingresos)}
+
+
+def fila_categoria(categoria, pedidos, unidades, ingresos):
+    return {"categoria": categoria, "pedidos": pedidos, "unidades": unidades,
+            "ingresos": dinero(ingresos)}
+
+
+def resumen(por_estado, unidades, ingresos):
+    pedidos = sum(n for estado, n in por_estado.items() if estado != ESTADO_EXCLUIDO)
+    return {
+        "pedidos": pedidos,
+        "unidades": unidades,
+        "ingresos": dinero(ingresos),
+        "ticket_promedio": dinero(ingresos / pedidos) if pedidos else 0,
+        "por_estado": dict(sorted(por_estado.items(), key=lambda x: str(x[0])))
+    }
+
+
+def diferencias(antes, despues):
+    """Secciones en que difieren dos exportaciones de los agregados"""
+    return [seccion for seccion in despues if antes.get(seccion) != despues[seccion]]
+
+
+class EstadisticasVentas:
+    """Agregados de ventas en memoria"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Cada agregado es [pedidos, unidades, ingresos]
+        self._dias = {}
+        self._fechas = []
+        self._categorias = {}
+        # Categoría normalizada -> {variante del nombre: pedidos en que aparece}
+        self._nombres = {}
+        # Productos: [pedidos, unidades, ingresos, nombre, categoría]
+        self._productos = {}
+        # Ranking ordenado de (-valor, id) por criterio
+        self._ranking = {criterio: [] for criterio in CRITERIOS_TOP}
+        self._estados = {}
+        self._unidades = 0
+        self._ingresos = 0.0
+
+    def rebuild(self, pedidos):
+        self.clear()
+        for pedido in pedidos:
+            self.add(pedido)
+
+    def add(self, pedido):
+        self._aplicar(aportes(pedido), 1)
+
+    def remove(self, pedido):
+        self._aplicar(aportes(pedido), -1)
+
+    def actualizar(self, anterior, nuevo):
+        """Sustituye la contribución de `anterior` por la de `nuevo` (None = no existe)"""
+        if anterior is not None:
+            self.remove(anterior)
+        if nuevo is not None:
+            self.add(nuevo)
+
+    @staticmethod
+    def _sumar(tabla, clave, signo, unidades, ingresos):
+        fila = tabla.get(clave)
+        if fila is None:
+            fila = tabla[clave] = [0, 0, 0.0]
+        fila[0] += signo
+        fila[1] += signo * unidades
+        fila[2] += signo * ingresos
+        if fila[0] <= 0:
+            # Sin pedidos: se elimina y con ella el error de redondeo acumulado
+            del tabla[clave]
+            return None
+        return fila
+
+    def _aplicar(self, aporte, signo):
+        n = self._estados.get(aporte.estado, 0) + signo
+        if n > 0:
+            self._estados[aporte.estado] = n
+        else:
+            self._estados.pop(aporte.estado, None)
+        if not aporte.venta:
+            return
+
+        self._unidades += signo * aporte.unidades
+        self._ingresos += signo * aporte.ingresos
+        # Sin ventas vigentes los totales vuelven a cero exacto
+        if not self._estados.keys() - {ESTADO_EXCLUIDO}:
+            self._unidades, self._ingresos = 0, 0.0
+
+        nuevo_dia = aporte.dia not in self._dias
+        if self._sumar(self._dias, aporte.dia, signo, aporte.unidades, aporte.ingresos) is None:
+            del self._fechas[bisect_left(self._fechas, aporte.dia)]
+        elif nuevo_dia:
+            insort(self._fechas, aporte.dia)
+
+        for categoria, (unidades, ingresos) in aporte.categorias.items():
+            self._sumar(self._categorias, categoria, signo, unidades, ingresos)
+        for categoria, nombres in aporte.nombres.items():
+            conteo = self._nombres.setdefault(categoria, {})
+            for nombre in nombres:
+                n = conteo.get(nombre, 0) + signo
+                if n > 0:
+                    conteo[nombre] = n
+                else:
+                    conteo.pop(nombre, None)
+            if not conteo:
+                del self._nombres[categoria]
+
+        for producto_id, (nombre, categoria, unidades, ingresos) in aporte.productos.items():
+            fila = self._productos.get(producto_id)
+            if fila is not None:
+                self._quitar_ranking(producto_id, fila)
+            fila = self._sumar(self._productos, producto_id, signo, unidades, ingresos)
+            if fila is None:
+                continue
+            if signo > 0:
+                # El nombre y la categoría son los del pedido más reciente
+                fila[3:] = [nombre, categoria]
+            insort(self._ranking['unidades'], (-fila[1], producto_id))
+            insort(self._ranking['ingresos'], (-fila[2], producto_id))
+
+    def _quitar_ranking(self, producto_id, fila):
+        for criterio, valor in (('unidades', fila[1]), ('ingresos', fila[2])):
+            ranking = self._ranking[criterio]
+            i = bisect_left(ranking, (-valor, producto_id))
+            if i < len(ranking) and ranking[i] == (-valor, producto_id):
+                del ranking[i]
+
+    def por_dia(self, desde=None, hasta=None):
+        """Totales por día (AAAA-MM-DD) en el rango inclusivo [desde, hasta]"""
+        inicio = bisect_left(self._fechas, desde) if desde else 0
+        fin = bisect_right(self._fechas, hasta) if hasta else len(self._fechas)
+        return [fila_dia(fecha, *self._dias[fecha]) for fecha in self._fechas[inicio:fin]]
+
+    def por_producto(self):
+        return [fila_producto(pid, fila[3], fila[4], *fila[:3])
+                for pid, fila in sorted(self._productos.items())]
+
+    def por_categoria(self):
+        """Totales por categoría; el nombre es la primera variante en orden alfabético"""
+        return [fila_categoria(min(self._nombres.get(categoria) or [categoria]), *fila)
+                for categoria, fila in sorted(self._categorias.items())]
+
+    def top(self, n=10, por='unidades'):
+        """Los n productos con más unidades vendidas o más ingresos"""
+        return [fila_producto(pid, self._productos[pid][3], self._productos[pid][4],
+                              *self._productos[pid][:3])
+                for _, pid in self._ranking[por][:n]]
+
+    def resumen(self):
+        return resumen(self._estados, self._unidades, self._ingresos)
+
+    def exportar(self):
+        """Todos los agregados, para compararlos con una reconstrucción"""
+        return {
+            "resumen": self.resumen(),
+            "dias": self.por_dia(),
+            "productos": self.por_producto(),
+            "categorias": self.por_categoria()
+        }
@@ -0,0 +1,8 @@
+"""
+Suite de benchmarks reproducibles para la API de Tienda Web
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks run --scale 1k --mode client --output base.json
+    python -m benchmarks run --scale 100k --mode http --workers 8 --output nuevo.json
+    python -m benchmarks compare base.json nuevo.json --threshold 0.10
+"""
@@ -0,0 +1,72 @@
+"""
+Línea de comandos de la suite de benchmarks
+
+    python -m benchmarks run --scale 1k --mode client --output base.json
+    python -m benchmarks compare base.json nuevo.json --threshold 0.10
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.compare import compare, formatear
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Benchmarks de la API de Tienda Web")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    run = sub.add_parser('run', help="Sembrar datos y medir todos los endpoints")
+    run.add_argument('--scale', default='1k',
+                     help="Registros por colección: 1k, 100k, 1m o un número")
+    run.add_argument('--mode', choices=['client', 'http'], default='client',
+                     help="client: cliente de pruebas de Flask; http: servidor local")
+    run.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    run.add_argument('--workers', type=int, default=4, help="Peticiones concurrentes")
+    run.add_argument('--requests', type=int, default=200, help="Peticiones por endpoint")
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--full-listings', action='store_true',
+                     help="Incluir listados completos sin paginar")
+    run.add_argument('--only', nargs='*', help="Solo endpoints que contengan estos textos")
+    run.add_argument('--data-dir', help="Directorio de datos (por defecto uno temporal)")
+    run.add_argument('--output', help="Archivo JSON de resultados (por defecto stdout)")
+
+    cmp = sub.add_parser('compare', help="Comparar dos resultados y marcar regresiones")
+    cmp.add_argument('base')
+    cmp.add_argument('nuevo')
+    cmp.add_argument('--threshold', type=float, default=0.10,
+                     help="Cambio relativo tolerado (0.10 = 10%%)")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'run':
+        from benchmarks.runner import run as ejecutar
+        # El progreso va a stderr para que stdout quede con el JSON
+        resultado = ejecutar(scale=args.scale, mode=args.mode, workers=args.workers,
+                             requests=args.requests, storage=args.storage, seed=args.seed,
+                             full_listings=args.full_listings, only=args.only,
+                             data_dir=args.data_dir,
+                             log=lambda msg: print(msg, file=sys.stderr))
+        salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(salida)
+        else:
+            print(salida)
+        return 0
+
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding='utf-8') as f:
+        nuevo = json.load(f)
+    filas = compare(base, nuevo, args.threshold)
+    print(formatear(filas))
+    regresiones = [f['endpoint'] for f in filas if f['regresion']]
+    if regresiones:
+        print(f"\n{len(regresiones)} endpoint(s) con regresión", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
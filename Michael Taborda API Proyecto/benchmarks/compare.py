@@ -0,0 +1,50 @@
+"""
+Comparación de dos ejecuciones del benchmark
+
+Un endpoint se marca como regresión si su p95 empeora, o sus peticiones
+por segundo bajan, más que el umbral relativo indicado.
+"""
+
+
+def _cambio(base, nuevo):
+    if not base or nuevo is None:
+        return None
+    return (nuevo - base) / base
+
+
+def compare(base, nuevo, threshold=0.10):
+    """Retorna una lista de filas por endpoint con los cambios relativos"""
+    filas = []
+    for endpoint, b in base['endpoints'].items():
+        n = nuevo['endpoints'].get(endpoint)
+        if n is None:
+            continue
+        cambio_p95 = _cambio(b['p95_ms'], n['p95_ms'])
+        cambio_rps = _cambio(b['rps'], n['rps'])
+        regresion = ((cambio_p95 is not None and cambio_p95 > threshold) or
+                     (cambio_rps is not None and cambio_rps < -threshold) or
+                     n['errors'] > b['errors'])
+        filas.append({
+            "endpoint": endpoint,
+            "p95_base_ms": b['p95_ms'],
+            "p95_nuevo_ms": n['p95_ms'],
+            "cambio_p95": cambio_p95,
+            "rps_base": b['rps'],
+            "rps_nuevo": n['rps'],
+            "cambio_rps": cambio_rps,
+            "errores_nuevo": n['errors'],
+            "regresion": regresion,
+        })
+    return filas
+
+
+def formatear(filas):
+    lineas = [f"{'endpoint':45s} {'p95 base':>10s} {'p95 nuevo':>10s} {'Δp95':>8s} "
+              f"{'rps base':>10s} {'rps nuevo':>10s} {'Δrps':>8s}"]
+    for f in filas:
+        marca = '  << REGRESIÓN' if f['regresion'] else ''
+        lineas.append(
+            f"{f['endpoint']:45s} {f['p95_base_ms']:10.2f} {f['p95_nuevo_ms']:10.2f} "
+            f"{(f['cambio_p95'] or 0):+8.1%} {f['rps_base']:10.1f} {f['rps_nuevo']:10.1f} "
+            f"{(f['cambio_rps'] or 0):+8.1%}{marca}")
+    return '\n'.join(lineas)
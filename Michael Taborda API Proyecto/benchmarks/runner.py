@@ -0,0 +1,218 @@
+"""
+Ejecución de los escenarios contra la aplicación
+
+Dos modos:
+- client: las peticiones pasan por el cliente de pruebas de Flask
+- http: se levanta un servidor WSGI local con hilos y se le envían
+  peticiones HTTP reales desde varios workers concurrentes
+"""
+import atexit
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.scenarios import ESCENARIOS, Contexto
+from benchmarks.seed import parse_scale, sembrar
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not valores_ordenados:
+        return None
+    k = math.ceil(p / 100 * len(valores_ordenados)) - 1
+    return valores_ordenados[max(0, min(len(valores_ordenados) - 1, k))]
+
+
+def cargar_app(data_dir, storage):
+    """
+    Importa APP con un directorio de datos temporal. La configuración se
+    lee al importar, así que las variables de entorno van primero.
+    """
+    os.environ['TIENDA_DATA_DIR'] = data_dir
+    os.environ['TIENDA_STORAGE'] = storage
+    proyecto = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if proyecto not in sys.path:
+        sys.path.insert(0, proyecto)
+    import APP
+    return APP
+
+
+class ClienteFlask:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, metodo, ruta, cuerpo, cabeceras=None):
+        with self.app.test_client() as cliente:
+            if isinstance(cuerpo, bytes):
+                # Cuerpo ya codificado (CSV, JSONL): el tipo va en las cabeceras
+                resp = cliente.open(ruta, method=metodo, data=cuerpo, headers=cabeceras)
+            else:
+                resp = cliente.open(ruta, method=metodo, json=cuerpo, headers=cabeceras)
+            # Consumir el cuerpo completo, también en respuestas en streaming
+            return resp.status_code, resp.get_data()
+
+
+class ClienteHTTP:
+    """Una conexión keep-alive por hilo worker"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def __call__(self, metodo, ruta, cuerpo, cabeceras=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port)
+        cabeceras = dict(cabeceras or {})
+        if isinstance(cuerpo, bytes):
+            datos = cuerpo
+        elif cuerpo is not None:
+            datos = json.dumps(cuerpo).encode('utf-8')
+            cabeceras['Content-Type'] = 'application/json'
+        else:
+            datos = None
+        try:
+            conn.request(metodo, ruta, body=datos, headers=cabeceras)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+class ServidorLocal:
+    """Servidor WSGI con hilos en un puerto libre de localhost"""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class SinLog(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server('127.0.0.1', 0, app, threaded=True,
+                                   request_handler=SinLog)
+        self.host, self.port = '127.0.0.1', self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def medir_escenario(enviar, escenario, ctx, requests, workers, seed):
+    """Ejecuta `requests` peticiones del escenario con `workers` hilos"""
+    rng = random.Random(f"{seed}:{escenario.nombre}")
+    peticiones = [escenario.peticion(i, rng, ctx) for i in range(requests)]
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+
+    def ejecutar(peticion):
+        metodo, ruta, cuerpo = peticion
+        inicio = time.perf_counter()
+        try:
+            status, datos = enviar(metodo, ruta, cuerpo, escenario.cabeceras)
+        except Exception:
+            status, datos = None, b''
+        duracion = time.perf_counter() - inicio
+        ok = status in escenario.esperado
+        if ok and escenario.al_responder is not None:
+            try:
+                escenario.al_responder(ctx, json.loads(datos))
+            except Exception:
+                # Cuerpo inesperado (p. ej. no es JSON): cuenta como error
+                # sin abortar la ejecución
+                ok = False
+        with lock:
+            latencias.append(duracion)
+            if not ok:
+                errores[0] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(ejecutar, peticiones))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "count": len(latencias),
+        "errors": errores[0],
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "rps": len(latencias) / total if total > 0 else None,
+    }
+
+
+def run(scale='1k', mode='client', workers=4, requests=200, storage='json',
+        seed=42, full_listings=False, only=None, data_dir=None, log=print):
+    """
+    Siembra los datos, ejecuta todos los escenarios y retorna el resultado
+    como un diccionario serializable a JSON
+    """
+    n = parse_scale(scale)
+    if data_dir is None:
+        data_dir = tempfile.mkdtemp(prefix='tienda-bench-')
+        # Registrado antes de importar APP: atexit ejecuta en orden inverso,
+        # así el directorio se borra después de que APP vuelque sus datos
+        atexit.register(shutil.rmtree, data_dir, True)
+
+    app_module = cargar_app(data_dir, storage)
+    log(f"Sembrando {n} productos, usuarios y pedidos en {data_dir}...")
+    sembrado = sembrar(app_module, n, seed)
+    ctx = Contexto(n=n, password=sembrado['password'])
+
+    escenarios = [e for e in ESCENARIOS
+                  if (full_listings or not e.completo)
+                  and (not only or any(o in e.nombre for o in only))]
+
+    resultados = {}
+
+    def ejecutar_todos(enviar):
+        for escenario in escenarios:
+            resultados[escenario.nombre] = medir_escenario(
+                enviar, escenario, ctx, requests, workers, seed)
+            r = resultados[escenario.nombre]
+            log(f"{escenario.nombre:45s} p50={r['p50_ms']:8.2f}ms "
+                f"p95={r['p95_ms']:8.2f}ms rps={r['rps']:9.1f} errores={r['errors']}")
+
+    if mode == 'http':
+        with ServidorLocal(app_module.app) as servidor:
+            ejecutar_todos(ClienteHTTP(servidor.host, servidor.port))
+    elif mode == 'client':
+        ejecutar_todos(ClienteFlask(app_module.app))
+    else:
+        raise ValueError(f"Modo desconocido: {mode}")
+
+    return {
+        "meta": {
+            "scale": scale,
+            "records": n,
+            "mode": mode,
+            "storage": storage,
+            "workers": workers,
+            "requests_per_endpoint": requests,
+            "seed": seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(),
+        },
+        "endpoints": resultados,
+    }
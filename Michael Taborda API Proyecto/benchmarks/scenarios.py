@@ -0,0 +1,205 @@
+"""
+Escenarios del benchmark: una petición representativa por ruta de APP.py
+
+Cada escenario genera la i-ésima petición a partir de un generador
+aleatorio con semilla fija y del contexto compartido de la ejecución.
+Los escenarios se ejecutan en orden, de modo que los que eliminan
+productos consumen los ids creados por los escenarios anteriores.
+
+GET /api/productos/stream (Server-Sent Events) queda fuera: es una
+conexión de larga duración que no termina hasta `duracion_maxima`, así
+que no tiene una latencia por petición que medir.
+"""
+import csv
+import io
+import json
+import collections
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from benchmarks.seed import CATEGORIAS
+
+# Consultas de búsqueda: palabras completas, prefijos y varias palabras
+TERMINOS_BUSQUEDA = ['laptop', 'auri', 'zapatos deportivo', 'lampara', 'premium',
+                     'inalambrico', 'teclado comp', 'garantia']
+
+
+@dataclass
+class Escenario:
+    nombre: str
+    # (i, rng, ctx) -> (método, ruta, cuerpo JSON, bytes ya codificados o None)
+    peticion: Callable
+    esperado: Tuple[int, ...] = (200,)
+    # Escenarios que recorren colecciones completas: solo con --full-listings
+    completo: bool = False
+    # (ctx, respuesta JSON) -> None, para registrar ids creados
+    al_responder: Optional[Callable] = None
+    # Cabeceras adicionales de cada petición (p. ej. Accept)
+    cabeceras: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Contexto:
+    n: int
+    password: str
+    creados: collections.deque = field(default_factory=collections.deque)
+    creados_lote: collections.deque = field(default_factory=collections.deque)
+
+    def id_aleatorio(self, rng):
+        # Solo la mitad inferior: los ids altos se reservan para eliminaciones
+        return rng.randint(1, max(1, self.n // 2))
+
+
+def _producto(i, rng):
+    return {
+        "nombre": f"Producto benchmark {i}",
+        "precio": round(rng.uniform(1, 2000), 2),
+        "categoria": rng.choice(CATEGORIAS),
+        "stock": 1000,
+        "descripcion": "Creado por el benchmark"
+    }
+
+
+def _importar(formato, filas=10):
+    """Petición de importación con `filas` productos en CSV o JSONL"""
+    def peticion(i, rng, ctx):
+        productos = [_producto(i, rng) for _ in range(filas)]
+        if formato == 'jsonl':
+            cuerpo = ''.join(json.dumps(p, ensure_ascii=False) + '\n' for p in productos)
+        else:
+            salida = io.StringIO()
+            escritor = csv.DictWriter(salida, fieldnames=list(productos[0]), lineterminator='\n')
+            escritor.writeheader()
+            escritor.writerows(productos)
+            cuerpo = salida.getvalue()
+        return 'POST', f"/api/productos/importar?formato={formato}", cuerpo.encode('utf-8')
+    return peticion
+
+
+def _eliminar_creado(i, rng, ctx):
+    return 'DELETE', f"/api/productos/{ctx.creados.popleft()}", None
+
+
+def _eliminar_lote(i, rng, ctx):
+    ids = [ctx.creados_lote.popleft() for _ in range(min(10, len(ctx.creados_lote)))]
+    return 'DELETE', '/api/productos/bulk', {"ids": ids}
+
+
+ESCENARIOS = [
+    Escenario('GET /', lambda i, rng, ctx: ('GET', '/', None)),
+    Escenario('GET /api/productos', lambda i, rng, ctx: (
+        'GET', '/api/productos', None), completo=True),
+    Escenario('GET /api/productos [gzip]', lambda i, rng, ctx: (
+        'GET', '/api/productos', None), completo=True,
+        cabeceras={'Accept-Encoding': 'gzip'}),
+    Escenario('GET /api/productos?fields', lambda i, rng, ctx: (
+        'GET', '/api/productos?fields=id,nombre,precio,imagen', None), completo=True),
+    Escenario('GET /api/productos?stream', lambda i, rng, ctx: (
+        'GET', '/api/productos?stream=true', None), completo=True),
+    Escenario('GET /api/productos?limit', lambda i, rng, ctx: (
+        'GET', f"/api/productos?limit=100&cursor={ctx.id_aleatorio(rng)}", None)),
+    Escenario('GET /api/productos?categoria', lambda i, rng, ctx: (
+        'GET', f"/api/productos?categoria={quote(rng.choice(CATEGORIAS))}&limit=100", None)),
+    Escenario('GET /api/productos?sort&categoria', lambda i, rng, ctx: (
+        'GET', f"/api/productos?sort=-rating&categoria={quote(rng.choice(CATEGORIAS))}"
+               "&limit=20", None)),
+    Escenario('GET /api/productos?sort=precio', lambda i, rng, ctx: (
+        'GET', '/api/productos?sort=precio&limit=20', None)),
+    Escenario('GET /api/productos?min_precio&max_precio', lambda i, rng, ctx: (
+        'GET', f"/api/productos?min_precio={rng.randint(1, 1900)}"
+               f"&max_precio={rng.randint(1900, 2000)}&limit=100", None)),
+    Escenario('GET /api/productos?ids', lambda i, rng, ctx: (
+        'GET', "/api/productos?ids=" + ','.join(
+            str(ctx.id_aleatorio(rng)) for _ in range(20)), None)),
+    Escenario('GET /api/productos/buscar', lambda i, rng, ctx: (
+        'GET', f"/api/productos/buscar?q={quote(rng.choice(TERMINOS_BUSQUEDA))}", None)),
+    Escenario('GET /api/productos/facetas', lambda i, rng, ctx: (
+        'GET', '/api/productos/facetas', None)),
+    Escenario('GET /api/productos/facetas?categoria&min_precio', lambda i, rng, ctx: (
+        'GET', f"/api/productos/facetas?categoria={quote(rng.choice(CATEGORIAS))}"
+               f"&min_precio={rng.randint(1, 1000)}", None)),
+    Escenario('GET /api/productos/cambios', lambda i, rng, ctx: (
+        'GET', '/api/productos/cambios?since=0&limit=100', None)),
+    Escenario('GET /api/productos/exportar?formato=csv', lambda i, rng, ctx: (
+        'GET', '/api/productos/exportar?formato=csv', None), completo=True),
+    Escenario('GET /api/productos/exportar?formato=jsonl', lambda i, rng, ctx: (
+        'GET', '/api/productos/exportar?formato=jsonl', None), completo=True),
+    Escenario('GET /api/productos/<id>', lambda i, rng, ctx: (
+        'GET', f"/api/productos/{ctx.id_aleatorio(rng)}", None)),
+    Escenario('POST /api/productos', lambda i, rng, ctx: (
+        'POST', '/api/productos', _producto(i, rng)), esperado=(201,),
+        al_responder=lambda ctx, r: ctx.creados.append(r['producto']['id'])),
+    Escenario('PUT /api/productos/<id>', lambda i, rng, ctx: (
+        'PUT', f"/api/productos/{ctx.id_aleatorio(rng)}",
+        {"precio": round(rng.uniform(1, 2000), 2)})),
+    Escenario('DELETE /api/productos/<id>', _eliminar_creado),
+    Escenario('POST /api/productos/bulk', lambda i, rng, ctx: (
+        'POST', '/api/productos/bulk', {"productos": [_producto(i, rng) for _ in range(10)]}),
+        al_responder=lambda ctx, r: ctx.creados_lote.extend(
+            x['producto']['id'] for x in r['resultados'] if x['success'])),
+    Escenario('PATCH /api/productos/bulk', lambda i, rng, ctx: (
+        'PATCH', '/api/productos/bulk', {"productos": [
+            {"id": ctx.id_aleatorio(rng), "stock": 10 ** 9} for _ in range(10)]})),
+    Escenario('DELETE /api/productos/bulk', _eliminar_lote),
+    Escenario('POST /api/productos/importar?formato=csv', _importar('csv'),
+              cabeceras={'Content-Type': 'text/csv'}),
+    Escenario('POST /api/productos/importar?formato=jsonl', _importar('jsonl'),
+              cabeceras={'Content-Type': 'application/x-ndjson'}),
+    Escenario('GET /api/pedidos', lambda i, rng, ctx: (
+        'GET', '/api/pedidos', None), completo=True),
+    Escenario('GET /api/pedidos?limit', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos?limit=100&cursor={ctx.id_aleatorio(rng)}", None)),
+    Escenario('GET /api/pedidos?desde&hasta', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos?desde=2024-{rng.randint(1, 12):02d}-01"
+               "&hasta=2024-12-31&limit=100", None)),
+    Escenario('GET /api/pedidos?limit&fields', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos?limit=100&cursor={ctx.id_aleatorio(rng)}"
+               "&fields=id,total,estado,items.nombre", None)),
+    Escenario('GET /api/pedidos?limit [msgpack]', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos?limit=100&cursor={ctx.id_aleatorio(rng)}", None),
+        cabeceras={'Accept': 'application/msgpack'}),
+    Escenario('GET /api/pedidos?limit [gzip]', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos?limit=100&cursor={ctx.id_aleatorio(rng)}", None),
+        cabeceras={'Accept-Encoding': 'gzip'}),
+    Escenario('GET /api/pedidos/estadisticas', lambda i, rng, ctx: (
+        'GET', '/api/pedidos/estadisticas', None)),
+    Escenario('GET /api/pedidos/estadisticas/dias', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos/estadisticas/dias?desde=2024-{rng.randint(1, 12):02d}-01"
+               "&hasta=2024-12-31", None)),
+    # Una fila por producto vendido: crece con el catálogo
+    Escenario('GET /api/pedidos/estadisticas/productos', lambda i, rng, ctx: (
+        'GET', '/api/pedidos/estadisticas/productos', None), completo=True),
+    Escenario('GET /api/pedidos/estadisticas/categorias', lambda i, rng, ctx: (
+        'GET', '/api/pedidos/estadisticas/categorias', None)),
+    Escenario('GET /api/pedidos/estadisticas/top', lambda i, rng, ctx: (
+        'GET', '/api/pedidos/estadisticas/top?n=10', None)),
+    Escenario('GET /api/pedidos/<id>', lambda i, rng, ctx: (
+        'GET', f"/api/pedidos/{ctx.id_aleatorio(rng)}", None)),
+    Escenario('POST /api/pedidos', lambda i, rng, ctx: (
+        'POST', '/api/pedidos', {
+            "cliente": {"nombre": f"Cliente {i}", "email": f"cliente{i}@example.com"},
+            "items": [{"producto_id": ctx.id_aleatorio(rng), "cantidad": rng.randint(1, 3)}
+                      for _ in range(rng.randint(1, 3))],
+            "direccion_entrega": {"calle": "Calle 1", "ciudad": "Bogotá"}
+        }), esperado=(201,)),
+    # Todos los pedidos sobre el mismo producto: mide la contención del inventario
+    Escenario('POST /api/pedidos [mismo producto]', lambda i, rng, ctx: (
+        'POST', '/api/pedidos', {"items": [{"producto_id": 1, "cantidad": 1}]}),
+        esperado=(201,)),
+    Escenario('PUT /api/pedidos/<id>/estado', lambda i, rng, ctx: (
+        'PUT', f"/api/pedidos/{ctx.id_aleatorio(rng)}/estado",
+        {"estado": rng.choice(['pagado', 'enviado', 'entregado'])})),
+    Escenario('POST /api/usuarios/registro', lambda i, rng, ctx: (
+        'POST', '/api/usuarios/registro', {
+            "email": f"benchmark{i}-{rng.getrandbits(48):x}@example.com",
+            "password": ctx.password,
+            "nombre": f"Benchmark {i}"
+        }), esperado=(201,)),
+    Escenario('POST /api/usuarios/login', lambda i, rng, ctx: (
+        'POST', '/api/usuarios/login', {
+            "email": f"usuario{ctx.id_aleatorio(rng)}@example.com",
+            "password": ctx.password
+        })),
+    Escenario('GET /metrics', lambda i, rng, ctx: ('GET', '/metrics', None)),
+]
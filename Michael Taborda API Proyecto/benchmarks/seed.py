@@ -0,0 +1,106 @@
+"""
+Generación de datos sintéticos: catálogo, usuarios y pedidos
+
+Los datos se generan con una semilla fija, así dos ejecuciones a la misma
+escala trabajan exactamente con los mismos registros.
+"""
+import random
+from datetime import datetime, timedelta
+
+ESCALAS = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+CATEGORIAS = ['Tecnología', 'Audio', 'Ropa', 'Calzado', 'Hogar', 'Deportes',
+              'Juguetes', 'Libros', 'Belleza', 'Jardín']
+NOMBRES = ['Laptop', 'Auriculares', 'Camiseta', 'Zapatos', 'Lámpara', 'Balón',
+           'Muñeca', 'Novela', 'Crema', 'Maceta', 'Teclado', 'Altavoz']
+ADJETIVOS = ['Básico', 'Pro', 'Inalámbrico', 'Deportivo', 'Clásico', 'Compacto',
+             'Premium', 'Ecológico']
+
+# Stock muy alto para que los pedidos del benchmark no lo agoten
+STOCK_BENCHMARK = 10 ** 9
+
+
+def parse_scale(scale):
+    """Acepta '1k', '100k', '1m' o un número de registros"""
+    if scale.lower() in ESCALAS:
+        return ESCALAS[scale.lower()]
+    return int(scale)
+
+
+def generar_productos(n, rng):
+    productos = []
+    for i in range(1, n + 1):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(ADJETIVOS)} {i}"
+        productos.append({
+            "id": i,
+            "nombre": nombre,
+            "descripcion": f"{nombre} con garantía y envío rápido",
+            "precio": round(rng.uniform(1, 2000), 2),
+            "categoria": rng.choice(CATEGORIAS),
+            "stock": STOCK_BENCHMARK,
+            "imagen": f"producto{i}.jpg",
+            "rating": round(rng.uniform(1, 5), 1)
+        })
+    return productos
+
+
+def generar_usuarios(n, password_hash):
+    """Todos los usuarios comparten el mismo hash para no pagar n hashes al sembrar"""
+    inicio = datetime(2024, 1, 1)
+    return [{
+        "id": i,
+        "email": f"usuario{i}@example.com",
+        "password": password_hash,
+        "nombre": f"Usuario {i}",
+        "direccion": {"calle": f"Calle {i}", "ciudad": "Bogotá"},
+        "fecha_registro": (inicio + timedelta(minutes=i)).isoformat()
+    } for i in range(1, n + 1)]
+
+
+def generar_pedidos(n, productos, rng):
+    inicio = datetime(2024, 1, 1)
+    segundos = int(timedelta(days=730).total_seconds())
+    pedidos = []
+    for i in range(1, n + 1):
+        items = []
+        for producto in rng.sample(productos, k=min(len(productos), rng.randint(1, 3))):
+            cantidad = rng.randint(1, 4)
+            items.append({
+                "producto_id": producto['id'],
+                "nombre": producto['nombre'],
+                "precio_unitario": producto['precio'],
+                "cantidad": cantidad,
+                "subtotal": producto['precio'] * cantidad
+            })
+        pedidos.append({
+            "id": i,
+            "cliente": {"nombre": f"Cliente {i}", "email": f"cliente{i}@example.com"},
+            "items": items,
+            "total": sum(item['subtotal'] for item in items),
+            "estado": rng.choice(['pendiente', 'pagado', 'enviado', 'entregado']),
+            "fecha_creacion": (inicio + timedelta(seconds=rng.randrange(segundos))).isoformat(),
+            "direccion_entrega": {"calle": f"Carrera {i}", "ciudad": "Medellín"}
+        })
+    return pedidos
+
+
+def sembrar(app_module, n, seed=42):
+    """
+    Reemplaza el contenido de los repositorios de la aplicación con n
+    productos, n usuarios y n pedidos sintéticos. Retorna el contexto que
+    usan los escenarios (tamaños, contraseña de los usuarios).
+    """
+    rng = random.Random(seed)
+    productos = generar_productos(n, rng)
+    password = 'benchmark'
+    usuarios = generar_usuarios(n, app_module.hasher.hash(password))
+    pedidos = generar_pedidos(n, productos, rng)
+
+    app_module.productos_repo.reset(productos)
+    app_module.usuarios_repo.reset(usuarios)
+    app_module.pedidos_repo.reset(pedidos)
+    return {"n": n, "password": password, "seed": seed}
@@ -0,0 +1,141 @@
+"""
+GET condicional (ETag / Last-Modified) y caché de respuestas del catálogo
+
+Las respuestas se identifican por la versión de la colección de la que
+provienen. Una petición con If-None-Match igual a la versión actual
+recibe 304 sin tocar los datos; el resto se sirve desde una caché LRU
+acotada de cuerpos ya serializados, que se invalida al cambiar la versión.
+Cada entrada guarda también sus variantes comprimidas (gzip, br), que
+crea la compresión de respuestas la primera vez que se piden.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, g, make_response, request
+
+from serializers import MIMETYPES, formato_respuesta
+
+# Identificador de este arranque: evita que una versión de un proceso
+# anterior coincida por casualidad con la actual
+_ARRANQUE = os.urandom(4).hex()
+
+
+class ResponseCache:
+    """Caché LRU de cuerpos serializados asociados a una versión"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is None or entrada[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entrada[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body, {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_variant(self, key, version, encoding):
+        """Cuerpo comprimido con `encoding`, si ya se creó para esta versión"""
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is None or entrada[0] != version:
+                return None
+            return entrada[2].get(encoding)
+
+    def put_variant(self, key, version, encoding, body):
+        """Guarda una variante comprimida si la entrada sigue vigente"""
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None and entrada[0] == version:
+                entrada[2][encoding] = body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Parámetros cuyo valor es una lista separada por comas sin orden propio
+PARAMETROS_CONJUNTO = ('fields',)
+
+
+def _canonico(nombre, valor):
+    if nombre in PARAMETROS_CONJUNTO:
+        return ','.join(sorted({parte.strip() for parte in valor.split(',')}))
+    return valor
+
+
+def cache_key(formato='json'):
+    """
+    Formato, ruta y parámetros ordenados: el orden en la URL no importa,
+    tampoco el de los campos de fields (las proyecciones se guardan junto
+    a las respuestas completas)
+    """
+    parametros = sorted((k, _canonico(k, v)) for k, v in request.args.items(multi=True))
+    return f"{formato}:{request.path}?{urlencode(parametros)}"
+
+
+def etag_for(version, formato='json'):
+    """Cada formato de respuesta es una representación distinta con su propio ETag"""
+    etag = f"{_ARRANQUE}-{version}"
+    return etag if formato == 'json' else f"{etag}-{formato}"
+
+
+def _con_validadores(resp, etag, last_modified):
+    resp.set_etag(etag, weak=True)
+    resp.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    return resp
+
+
+def versioned_response(repo, cache):
+    """
+    Decorador para endpoints GET cuyo resultado depende solo de la URL y
+    de la versión de `repo`: añade ETag y Last-Modified, responde 304 a
+    If-None-Match y guarda los cuerpos 200 en `cache`
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Leer la versión antes de generar la respuesta: si hay una
+            # mutación concurrente, como mucho se invalida de más
+            version = repo.version
+            last_modified = repo.last_modified
+            formato = formato_respuesta()
+            etag = etag_for(version, formato)
+
+            if request.if_none_match.contains_weak(etag):
+                return _con_validadores(Response(status=304), etag, last_modified)
+
+            key = cache_key(formato)
+            # La compresión de respuestas reutiliza las variantes de esta entrada
+            g.cache_variantes = (cache, key, version)
+            body = cache.get(key, version)
+            if body is not None:
+                resp = Response(body, status=200, mimetype=MIMETYPES[formato])
+                resp.vary.add('Accept')
+                return _con_validadores(resp, etag, last_modified)
+
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            if not resp.is_streamed:
+                cache.put(key, version, resp.get_data())
+            return _con_validadores(resp, etag, last_modified)
+        return wrapper
+    return decorator
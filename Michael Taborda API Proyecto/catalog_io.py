@@ -0,0 +1,132 @@
+"""
+Importación y exportación del catálogo en CSV y JSONL
+
+La importación lee el cuerpo de la petición línea a línea, sin cargarlo
+entero en memoria; la exportación recorre el catálogo por bloques y envía
+el archivo a medida que se genera.
+"""
+import csv
+import io
+
+from responses import STREAM_BUFFER
+from serializers import dumps_str, loads
+
+FORMATOS = ('csv', 'jsonl')
+# Tipos de contenido de cada formato (el primero es el de la exportación)
+MIMETYPES = {
+    'csv': ('text/csv',),
+    'jsonl': ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'),
+}
+
+
+def formato_de(mimetype, nombre_archivo=None):
+    """Formato según el tipo de contenido o la extensión del archivo, o None"""
+    for formato, tipos in MIMETYPES.items():
+        if mimetype in tipos:
+            return formato
+    if nombre_archivo:
+        extension = nombre_archivo.rsplit('.', 1)[-1].lower()
+        if extension in ('jsonl', 'ndjson'):
+            return 'jsonl'
+        if extension == 'csv':
+            return 'csv'
+    return None
+
+
+def _lineas(stream):
+    """Líneas en bytes de un stream binario, leído por bloques"""
+    if isinstance(stream, io.RawIOBase):
+        # El cuerpo de la petición: sin buffer, readline leería byte a byte
+        stream = io.BufferedReader(stream, STREAM_BUFFER)
+    return iter(stream)
+
+
+def leer_filas(stream, formato):
+    """
+    Recorre las filas de un archivo CSV (con cabecera) o JSONL y genera
+    (numero_de_linea, datos, error): `datos` es el diccionario de la fila o
+    None si la línea no se pudo leer, con el motivo en `error`. Si el
+    archivo deja de ser legible (por ejemplo, no es UTF-8) se genera un
+    último error y el recorrido termina.
+    """
+    if formato == 'jsonl':
+        yield from _filas_jsonl(stream)
+    else:
+        yield from _filas_csv(stream)
+
+
+def _filas_jsonl(stream):
+    for numero, linea in enumerate(_lineas(stream), start=1):
+        if not linea.strip():
+            continue
+        try:
+            datos = loads(linea)
+        except ValueError as e:
+            yield numero, None, f"JSON inválido: {e}"
+            continue
+        yield numero, datos, None
+
+
+def _filas_csv(stream):
+    # Cada línea se decodifica por separado: en UTF-8 un salto de línea
+    # nunca forma parte de otro carácter
+    numero = 0
+
+    def texto():
+        nonlocal numero
+        for linea in _lineas(stream):
+            numero += 1
+            yield linea.decode('utf-8-sig' if numero == 1 else 'utf-8')
+
+    lector = csv.reader(texto())
+    try:
+        cabecera = [columna.strip() for columna in next(lector, [])]
+        for fila in lector:
+            if not any(fila):
+                continue
+            if len(fila) > len(cabecera):
+                yield numero, None, "La fila tiene más columnas que la cabecera"
+                continue
+            # Las columnas vacías cuentan como ausentes (toman su valor por defecto)
+            yield numero, {columna: valor for columna, valor in zip(cabecera, fila)
+                           if columna and valor != ''}, None
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield numero, None, f"No se pudo leer el archivo: {e}"
+
+
+def _en_bloques(partes):
+    """Agrupa las partes en fragmentos de al menos STREAM_BUFFER caracteres"""
+    buffer, tamano = [], 0
+    for parte in partes:
+        buffer.append(parte)
+        tamano += len(parte)
+        if tamano >= STREAM_BUFFER:
+            yield ''.join(buffer)
+            buffer, tamano = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def exportar_jsonl(registros):
+    """Texto JSONL de los registros, un objeto por línea, por fragmentos"""
+    return _en_bloques(dumps_str(registro) + '\n' for registro in registros)
+
+
+def exportar_csv(registros, columnas):
+    """Texto CSV con cabecera de las columnas dadas, por fragmentos"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator='\n')
+
+    def fila(valores):
+        escritor.writerow(valores)
+        texto = salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+        return texto
+
+    def filas():
+        yield fila(columnas)
+        for registro in registros:
+            yield fila([registro.get(columna) for columna in columnas])
+
+    return _en_bloques(filas())
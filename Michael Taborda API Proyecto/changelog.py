@@ -0,0 +1,83 @@
+"""
+Registro de cambios del catálogo para sincronización incremental
+
+Cada alta, cambio o baja de un producto se anota con un número de
+secuencia creciente; las bajas quedan como lápidas (producto nulo). El
+registro está acotado: al superar el máximo se descartan las entradas más
+antiguas y en su lugar queda una marca de inicio con la última secuencia
+descartada. Un cliente que pide cambios anteriores a esa marca (o
+posteriores a la última secuencia) debe descargar de nuevo el catálogo.
+"""
+from datetime import datetime
+
+from journal import JournaledRepository
+
+OP_UPSERT = 'upsert'
+OP_DELETE = 'delete'
+# Marca con la secuencia desde la que el historial está completo
+OP_INICIO = 'inicio'
+# Margen sobre el máximo antes de recortar, para no recortar en cada cambio
+MARGEN_RECORTE = 1.1
+
+
+def requiere_resync(since, base, ultima):
+    """
+    El cliente debe descargar de nuevo el catálogo: no indicó desde dónde,
+    pidió cambios ya descartados (anteriores a `base`) o una secuencia que
+    aún no existe (por ejemplo, tras reiniciar los datos)
+    """
+    return since is None or since < base or since > ultima
+
+
+def formato_cambio(secuencia, op, producto_id, producto, fecha):
+    return {"secuencia": secuencia, "op": op, "id": producto_id,
+            "producto": producto, "fecha": fecha}
+
+
+class ChangeLog(JournaledRepository):
+    """
+    Registro de cambios persistido como diario. El id de cada entrada es
+    su número de secuencia, así que page(since) da los cambios posteriores.
+    """
+
+    def __init__(self, file_path, journal_path, max_entries=10000, compact_threshold=1000,
+                 fsync_policy='always', shared=False):
+        super().__init__(file_path, journal_path, compact_threshold, fsync_policy, shared)
+        self.max_entries = max_entries
+
+    def registrar(self, op, producto_id, producto=None):
+        """Anota un cambio y retorna su número de secuencia"""
+        with self._escritura():
+            entrada = self.create({"op": op, "producto_id": producto_id, "producto": producto,
+                                   "fecha": datetime.now().isoformat()})
+            if len(self._by_id) > self.max_entries * MARGEN_RECORTE:
+                self._recortar()
+        return entrada['id']
+
+    def _recortar(self):
+        retenidas = [self._by_id[i] for i in self._ids[-self.max_entries:]]
+        inicio = {"id": retenidas[0]['id'] - 1, "op": OP_INICIO}
+        self.reset([inicio, *retenidas])
+
+    def reiniciar(self):
+        """Descarta el historial: todos los clientes deberán resincronizar"""
+        with self._escritura():
+            self.reset([{"id": self._max_id + 1, "op": OP_INICIO}])
+
+    def desde(self, since, limit):
+        """
+        Retorna (resync, cambios, ultima): los cambios con secuencia mayor
+        que `since` (hasta `limit`) y la última secuencia registrada. Con
+        resync=True el historial pedido ya no está disponible.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            ultima = self._max_id
+            primera = self._by_id[self._ids[0]] if self._ids else None
+            base = primera['id'] if primera is not None and primera['op'] == OP_INICIO else 0
+            if requiere_resync(since, base, ultima):
+                return True, [], ultima
+            cambios = [formato_cambio(e['id'], e['op'], e['producto_id'], e['producto'],
+                                      e['fecha'])
+                       for e in self.page(since, limit)]
+            return False, cambios, ultima
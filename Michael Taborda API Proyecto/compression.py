@@ -0,0 +1,137 @@
+"""
+Compresión de respuestas según Accept-Encoding
+
+- gzip siempre; brotli si el paquete brotli está instalado y el cliente
+  lo acepta
+- Solo se comprimen cuerpos de al menos `min_size` bytes con un tipo de
+  contenido comprimible; los listados en streaming se comprimen por partes
+  (salvo los Server-Sent Events, que se envían sin comprimir)
+- Las respuestas servidas desde la caché del catálogo guardan su variante
+  comprimida junto al cuerpo original, así no se recomprimen en cada petición
+"""
+import gzip
+import zlib
+
+from flask import g, request
+
+from metrics import registry
+
+try:
+    import brotli
+except ImportError:  # Sin brotli: solo gzip
+    brotli = None
+
+TIPOS_COMPRIMIBLES = ('application/json', 'application/msgpack', 'application/x-ndjson', 'text/')
+# Server-Sent Events: cada evento debe llegar en cuanto se envía y son
+# demasiado pequeños para ganar algo comprimiéndolos por partes
+TIPOS_SIN_COMPRIMIR = ('text/event-stream',)
+
+COMPRESSION_BYTES = registry.counter(
+    'tienda_compression_bytes_total',
+    "Bytes antes (in) y después (out) de comprimir las respuestas",
+    labels=('encoding', 'stage'))
+
+
+def codificaciones_disponibles():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def elegir_codificacion():
+    """Mejor codificación aceptada por el cliente, o None"""
+    aceptadas = request.accept_encodings
+    mejor = aceptadas.best_match(codificaciones_disponibles())
+    if mejor is None or aceptadas[mejor] <= 0:
+        return None
+    return mejor
+
+
+def comprimir(datos, codificacion, gzip_level=6, brotli_level=4):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=brotli_level)
+    return gzip.compress(datos, compresslevel=gzip_level, mtime=0)
+
+
+class _CompresorGzip:
+    def __init__(self, nivel):
+        self._z = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def parte(self, datos):
+        # SYNC_FLUSH: el cliente puede descomprimir cada parte al recibirla
+        return self._z.compress(datos) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def fin(self):
+        return self._z.flush()
+
+
+class _CompresorBrotli:
+    def __init__(self, nivel):
+        self._b = brotli.Compressor(quality=nivel)
+
+    def parte(self, datos):
+        return self._b.process(datos) + self._b.flush()
+
+    def fin(self):
+        return self._b.finish()
+
+
+def _comprimir_stream(partes, compresor, codificacion):
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        COMPRESSION_BYTES.inc(len(parte), encoding=codificacion, stage='in')
+        datos = compresor.parte(parte)
+        COMPRESSION_BYTES.inc(len(datos), encoding=codificacion, stage='out')
+        if datos:
+            yield datos
+    datos = compresor.fin()
+    COMPRESSION_BYTES.inc(len(datos), encoding=codificacion, stage='out')
+    yield datos
+
+
+def init_app(app, min_size=1024, gzip_level=6, brotli_level=4):
+    """Instala la compresión de respuestas en la aplicación"""
+
+    @app.after_request
+    def _comprimir(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers
+                or response.direct_passthrough
+                or not (response.mimetype or '').startswith(TIPOS_COMPRIMIBLES)
+                or response.mimetype in TIPOS_SIN_COMPRIMIR):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        codificacion = elegir_codificacion()
+        if codificacion is None:
+            return response
+
+        if response.is_streamed:
+            nivel = brotli_level if codificacion == 'br' else gzip_level
+            compresor = (_CompresorBrotli(nivel) if codificacion == 'br'
+                         else _CompresorGzip(nivel))
+            response.response = _comprimir_stream(response.response, compresor, codificacion)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = codificacion
+            return response
+
+        datos = response.get_data()
+        if len(datos) < min_size:
+            return response
+
+        # Respuesta de la caché del catálogo: reutilizar la variante comprimida
+        variantes = g.get('cache_variantes')
+        comprimido = None
+        if variantes is not None:
+            cache, key, version = variantes
+            comprimido = cache.get_variant(key, version, codificacion)
+        if comprimido is None:
+            comprimido = comprimir(datos, codificacion, gzip_level, brotli_level)
+            COMPRESSION_BYTES.inc(len(datos), encoding=codificacion, stage='in')
+            COMPRESSION_BYTES.inc(len(comprimido), encoding=codificacion, stage='out')
+            if variantes is not None:
+                cache.put_variant(key, version, codificacion, comprimido)
+
+        response.set_data(comprimido)
+        response.headers['Content-Encoding'] = codificacion
+        return response
@@ -0,0 +1,116 @@
+"""
+Configuración de la API de Tienda Web
+Cada valor puede sobreescribirse con una variable de entorno TIENDA_*
+"""
+import os
+
+# Archivos de base de datos simple (JSON)
+DATA_DIR = os.environ.get('TIENDA_DATA_DIR', 'data')
+PRODUCTS_DB = os.path.join(DATA_DIR, 'products.json')
+ORDERS_DB = os.path.join(DATA_DIR, 'orders.json')
+USERS_DB = os.path.join(DATA_DIR, 'users.json')
+IDEMPOTENCY_DB = os.path.join(DATA_DIR, 'idempotency.json')
+PRODUCT_CHANGES_DB = os.path.join(DATA_DIR, 'product_changes.json')
+
+# Backend de almacenamiento: 'json' (archivos en DATA_DIR) o 'sqlite'
+STORAGE_BACKEND = os.environ.get('TIENDA_STORAGE', 'json')
+SQLITE_DB = os.environ.get('TIENDA_SQLITE_DB', os.path.join(DATA_DIR, 'tienda.db'))
+
+# Pedidos particionados por mes de creación (data/orders/AAAA-MM.jsonl)
+ORDERS_DIR = os.path.join(DATA_DIR, 'orders')
+# Formato anterior (instantánea orders.json más diario orders.jsonl): se
+# importa en las particiones la primera vez que se crean
+ORDERS_JOURNAL = os.path.join(DATA_DIR, 'orders.jsonl')
+# Número de entradas del diario (o de líneas obsoletas de una partición de
+# pedidos) que disparan su compactación
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('TIENDA_JOURNAL_COMPACT', '1000'))
+# Diario de las claves de idempotencia
+IDEMPOTENCY_JOURNAL = os.path.join(DATA_DIR, 'idempotency.jsonl')
+# Diario del registro de cambios del catálogo (sincronización incremental)
+PRODUCT_CHANGES_JOURNAL = os.path.join(DATA_DIR, 'product_changes.jsonl')
+
+# Número máximo de respuestas del catálogo guardadas en la caché LRU
+RESPONSE_CACHE_SIZE = int(os.environ.get('TIENDA_RESPONSE_CACHE_SIZE', '256'))
+
+# Máximo de elementos aceptados en una sola petición de lote (/bulk)
+BULK_MAX_ITEMS = int(os.environ.get('TIENDA_BULK_MAX_ITEMS', '10000'))
+
+# Hash de contraseñas: iteraciones de PBKDF2 y tamaño del grupo de hilos
+PASSWORD_ITERATIONS = int(os.environ.get('TIENDA_PASSWORD_ITERATIONS', '200000'))
+PASSWORD_WORKERS = int(os.environ.get('TIENDA_PASSWORD_WORKERS', '2'))
+PASSWORD_MAX_PENDING = int(os.environ.get('TIENDA_PASSWORD_MAX_PENDING', '32'))
+
+# Persistencia diferida (write-behind)
+# Intervalo máximo en segundos entre dos escrituras a disco
+FLUSH_INTERVAL = float(os.environ.get('TIENDA_FLUSH_INTERVAL', '0.5'))
+# Número de mutaciones pendientes que fuerzan una escritura inmediata
+FLUSH_MAX_BATCH = int(os.environ.get('TIENDA_FLUSH_MAX_BATCH', '100'))
+# Política de fsync: 'always' (cada escritura), 'shutdown' (solo al cerrar) o 'never'
+FSYNC_POLICY = os.environ.get('TIENDA_FSYNC', 'always')
+
+# Registro de peticiones lentas: umbral en milisegundos (0 = desactivado)
+SLOW_REQUEST_MS = float(os.environ.get('TIENDA_SLOW_REQUEST_MS', '0'))
+
+# Servidor de producción: gunicorn -c gunicorn.conf.py wsgi:app
+SERVER_BIND = os.environ.get('TIENDA_BIND', '0.0.0.0:5000')
+# Procesos worker e hilos por worker
+WORKERS = int(os.environ.get('TIENDA_WORKERS', '1'))
+THREADS = int(os.environ.get('TIENDA_THREADS', '4'))
+# Segundos que un worker tiene para terminar sus peticiones al apagarse
+GRACEFUL_TIMEOUT = int(os.environ.get('TIENDA_GRACEFUL_TIMEOUT', '30'))
+# Con varios workers, los archivos JSON se coordinan con bloqueos entre procesos
+SHARED_STORAGE = WORKERS > 1 or os.environ.get('TIENDA_SHARED_STORAGE') == '1'
+# Marca de que los datos de ejemplo ya se cargaron (solo se siembran una vez)
+INIT_MARKER = os.path.join(DATA_DIR, '.inicializado')
+
+# Sangría de los archivos JSON de datos (vacío = compactos, p. ej. 2 para legibles)
+JSON_INDENT = int(os.environ.get('TIENDA_JSON_INDENT') or 0) or None
+
+# Compresión de respuestas (gzip, y brotli si está instalado)
+COMPRESSION_ENABLED = os.environ.get('TIENDA_COMPRESSION', '1') != '0'
+# Tamaño mínimo en bytes para comprimir un cuerpo
+COMPRESSION_MIN_SIZE = int(os.environ.get('TIENDA_COMPRESSION_MIN_SIZE', '1024'))
+# Niveles: gzip 1-9, brotli 0-11
+GZIP_LEVEL = int(os.environ.get('TIENDA_GZIP_LEVEL', '6'))
+BROTLI_LEVEL = int(os.environ.get('TIENDA_BROTLI_LEVEL', '4'))
+
+# Claves de idempotencia (cabecera Idempotency-Key): máximo guardado,
+# segundos de validez y espera máxima de un duplicado concurrente
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('TIENDA_IDEMPOTENCY_MAX_KEYS', '10000'))
+IDEMPOTENCY_TTL = int(os.environ.get('TIENDA_IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_WAIT = float(os.environ.get('TIENDA_IDEMPOTENCY_WAIT', '10'))
+
+# Registro de cambios del catálogo: entradas que se conservan antes de
+# descartar las más antiguas (los clientes más atrasados deben resincronizar)
+CHANGELOG_MAX_ENTRIES = int(os.environ.get('TIENDA_CHANGELOG_MAX', '10000'))
+
+# Eventos de precio y stock (/api/productos/stream): clientes conectados a
+# la vez por worker (cada uno ocupa un hilo mientras dure la conexión),
+# productos pendientes por cliente antes de descartarlo, segundos entre
+# lecturas del registro de cambios, entre comentarios de keep-alive y
+# duración máxima de una conexión antes de que el cliente reconecte
+SSE_MAX_SUBSCRIBERS = int(os.environ.get('TIENDA_SSE_MAX_SUBSCRIBERS', '100'))
+SSE_MAX_PENDING = int(os.environ.get('TIENDA_SSE_MAX_PENDING', '1000'))
+SSE_POLL_INTERVAL = float(os.environ.get('TIENDA_SSE_POLL_INTERVAL', '0.5'))
+SSE_HEARTBEAT = float(os.environ.get('TIENDA_SSE_HEARTBEAT', '15'))
+SSE_MAX_DURATION = float(os.environ.get('TIENDA_SSE_MAX_DURATION', '300'))
+
+# Importación del catálogo (POST /api/productos/importar): productos por
+# escritura y errores por fila detallados como máximo en la respuesta
+IMPORT_CHUNK = int(os.environ.get('TIENDA_IMPORT_CHUNK', '1000'))
+IMPORT_MAX_ERRORS = int(os.environ.get('TIENDA_IMPORT_MAX_ERRORS', '1000'))
+
+# Control de admisión. Límites de tasa por ruta y cliente, separados por
+# punto y coma: "METODO /ruta=N/s[:rafaga]" (unidad s, m o h; * para
+# cualquier método o ruta), p. ej.
+# TIENDA_RATE_LIMITS="POST /api/pedidos=5/s:10;POST /api/productos=2/s:5"
+RATE_LIMITS = os.environ.get('TIENDA_RATE_LIMITS', '')
+# El cliente es la IP; con esta cabecera (p. ej. X-User-Id, añadida por un
+# gateway de autenticación) el límite se aplica por usuario
+RATE_LIMIT_CLIENT_HEADER = os.environ.get('TIENDA_RATE_LIMIT_CLIENT_HEADER') or None
+# Detrás de un único proxy inverso: tomar la IP de X-Forwarded-For
+TRUST_PROXY = os.environ.get('TIENDA_TRUST_PROXY') == '1'
+# Clientes con límite de tasa recordados por worker
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('TIENDA_RATE_LIMIT_MAX_CLIENTS', '100000'))
+# Peticiones simultáneas por worker antes de responder 503 (0 = sin máximo)
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('TIENDA_MAX_CONCURRENT', '0'))
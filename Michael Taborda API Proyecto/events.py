@@ -0,0 +1,378 @@
+"""
+Cambios de stock y precio en tiempo real (Server-Sent Events)
+
+Un hilo por proceso lee el registro de cambios del catálogo y publica en
+un broker los productos cuyo precio, stock o categoría cambiaron, y las
+bajas. Como lee el registro compartido, también ve los cambios hechos por
+otros workers; los endpoints que escriben en este proceso lo despiertan
+con notificar() para no esperar al siguiente sondeo.
+
+Cada evento lleva como id la secuencia del registro de cambios. Al
+reconectar, el navegador la envía en la cabecera Last-Event-ID y el
+suscriptor recibe primero los cambios que se perdió; si esa parte del
+historial ya se descartó, recibe un evento 'resync' y debe volver a leer
+los productos.
+
+Cada suscriptor tiene una cola acotada con un evento pendiente por
+producto: si llega un cambio de un producto que aún no se envió, se
+reemplaza (el cliente recibe solo el último estado). Si un suscriptor
+lento acumula más productos pendientes que el máximo, se descarta: recibe
+un evento 'descartado' y se cierra su stream, y el cliente debe volver a
+leer los productos antes de reconectar.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from changelog import OP_DELETE, OP_UPSERT
+from indexes import normalizar_categoria
+from serializers import dumps_str
+
+EVENTO_PRODUCTO = 'producto'
+EVENTO_ELIMINADO = 'eliminado'
+EVENTO_DESCARTADO = 'descartado'
+EVENTO_RESYNC = 'resync'
+# Cambios leídos del registro en cada consulta
+LOTE_CAMBIOS = 1000
+# Milisegundos que el navegador espera antes de reconectar (campo retry)
+REINTENTO_MS = 3000
+
+log = logging.getLogger('tienda.eventos')
+
+
+class BrokerSaturado(Exception):
+    """Se alcanzó el máximo de suscriptores"""
+
+
+def estado_producto(producto):
+    """Campos que se publican de un producto"""
+    return (producto.get('precio'), producto.get('stock'), producto['categoria'])
+
+
+def formato_sse(evento, datos, secuencia=None):
+    """Mensaje en el formato text/event-stream"""
+    cabecera = f"id: {secuencia}\n" if secuencia is not None else ""
+    return f"{cabecera}event: {evento}\ndata: {dumps_str(datos)}\n\n"
+
+
+def mensaje_producto(producto_id, estado, secuencia):
+    precio, stock, categoria = estado
+    return formato_sse(EVENTO_PRODUCTO, {
+        "id": producto_id, "categoria": categoria, "precio": precio,
+        "stock": stock, "secuencia": secuencia
+    }, secuencia)
+
+
+def mensaje_baja(producto_id, categoria, secuencia):
+    return formato_sse(EVENTO_ELIMINADO, {
+        "id": producto_id, "categoria": categoria, "secuencia": secuencia
+    }, secuencia)
+
+
+class Suscripcion:
+    """
+    Suscriptor del broker, opcionalmente filtrado por ids de producto o
+    por categoría. Guarda como máximo `max_pendientes` productos sin enviar.
+    """
+
+    def __init__(self, ids=None, categoria=None, max_pendientes=1000):
+        self.ids = frozenset(ids) if ids else None
+        self.categoria = normalizar_categoria(categoria) if categoria else None
+        self.max_pendientes = max_pendientes
+        self.descartada = False
+        self.cerrada = False
+        self._cond = threading.Condition()
+        # id de producto -> mensaje, en orden de llegada del último cambio
+        self._pendientes = OrderedDict()
+
+    def interesa_id(self, producto_id):
+        return self.ids is None or producto_id in self.ids
+
+    def interesa(self, producto_id, categoria):
+        if not self.interesa_id(producto_id):
+            return False
+        if self.categoria is None:
+            return True
+        # Un producto cargado sin categoría válida no pertenece a ninguna
+        return isinstance(categoria, str) and normalizar_categoria(categoria) == self.categoria
+
+    def entregar(self, producto_id, mensaje):
+        """
+        Encola el mensaje. Retorna 'coalescido' si reemplazó uno pendiente
+        del mismo producto, 'descartada' si la cola se desbordó o None
+        """
+        with self._cond:
+            if self.cerrada:
+                return None
+            resultado = None
+            if producto_id in self._pendientes:
+                self._pendientes.move_to_end(producto_id)
+                resultado = 'coalescido'
+            elif len(self._pendientes) >= self.max_pendientes:
+                self._pendientes.clear()
+                self.descartada = self.cerrada = True
+                self._cond.notify_all()
+                return 'descartada'
+            self._pendientes[producto_id] = mensaje
+            self._cond.notify_all()
+            return resultado
+
+    def esperar(self, timeout):
+        """Mensajes pendientes, esperando hasta `timeout` segundos si no hay"""
+        with self._cond:
+            if not self._pendientes and not self.cerrada:
+                self._cond.wait(timeout)
+            mensajes = list(self._pendientes.values())
+            self._pendientes.clear()
+            return mensajes
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrada = True
+            self._cond.notify_all()
+
+
+class Broker:
+    """Publicación de mensajes a un número acotado de suscriptores"""
+
+    def __init__(self, max_suscriptores=100, max_pendientes=1000):
+        self.max_suscriptores = max_suscriptores
+        self.max_pendientes = max_pendientes
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self.publicados = 0
+        self.coalescidos = 0
+        self.descartados = 0
+
+    def __len__(self):
+        return len(self._suscripciones)
+
+    def suscribir(self, ids=None, categoria=None):
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise BrokerSaturado(
+                    f"Se alcanzó el máximo de {self.max_suscriptores} suscriptores")
+            suscripcion = Suscripcion(ids, categoria, self.max_pendientes)
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        suscripcion.cerrar()
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, producto_id, categoria, mensaje):
+        """Entrega el mensaje a los suscriptores interesados sin bloquearse"""
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+            self.publicados += 1
+        for suscripcion in suscripciones:
+            if not suscripcion.interesa(producto_id, categoria):
+                continue
+            resultado = suscripcion.entregar(producto_id, mensaje)
+            if resultado == 'coalescido':
+                with self._lock:
+                    self.coalescidos += 1
+            elif resultado == 'descartada':
+                with self._lock:
+                    self.descartados += 1
+                    self._suscripciones.discard(suscripcion)
+
+    def cerrar(self):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+            self._suscripciones.clear()
+        for suscripcion in suscripciones:
+            suscripcion.cerrar()
+
+
+class EventosCatalogo:
+    """
+    Publica en `broker` los cambios de precio y stock leídos del registro
+    de cambios de `productos` (ProductRepository o SqliteProductRepository)
+    """
+
+    def __init__(self, productos, broker, intervalo=0.5):
+        self.productos = productos
+        self.broker = broker
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._cerrado = False
+        # Última secuencia leída y estado publicado de cada producto; None
+        # mientras no hay suscriptores
+        self._ultima = None
+        self._estado = None
+
+    def suscribir(self, ids=None, categoria=None, desde=None):
+        """
+        Nueva suscripción; lanza BrokerSaturado si no quedan plazas. Con
+        `desde` (el Last-Event-ID del cliente) recibe antes los cambios
+        posteriores a esa secuencia.
+        """
+        suscripcion = self.broker.suscribir(ids, categoria)
+        try:
+            with self._lock:
+                if self._estado is None:
+                    self._sincronizar()
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._ciclo, daemon=True,
+                                                  name='eventos-catalogo')
+                    self._hilo.start()
+                # Con el lock tomado el hilo no publica: lo posterior a
+                # _ultima llegará a la suscripción por el broker
+                if desde is not None:
+                    self._ponerse_al_dia(suscripcion, desde, self._ultima)
+        except BaseException:
+            self.broker.cancelar(suscripcion)
+            raise
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        self.broker.cancelar(suscripcion)
+
+    def notificar(self):
+        """Hubo una escritura en el catálogo: leer el registro sin esperar"""
+        self._despertar.set()
+
+    def close(self):
+        self._cerrado = True
+        self._despertar.set()
+        self.broker.cerrar()
+
+    def _sincronizar(self):
+        """Toma la última secuencia y, después, el estado de todos los productos"""
+        _, _, ultima = self.productos.cambios_desde(None, 0)
+        estado = {p['id']: estado_producto(p) for p in self.productos.iter_all()}
+        self._ultima, self._estado = ultima, estado
+
+    def _ciclo(self):
+        while not self._cerrado:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            with self._lock:
+                if self._cerrado:
+                    return
+                if not len(self.broker):
+                    # Sin suscriptores no se sigue el registro; se vuelve a
+                    # tomar el estado con la siguiente suscripción
+                    self._ultima = self._estado = None
+                    continue
+                if self._estado is None:
+                    # Una suscripción nueva aún no tomó el estado
+                    continue
+                try:
+                    self._leer_cambios()
+                except Exception:
+                    # Se reintenta en el siguiente ciclo desde la misma secuencia
+                    log.exception("Error al leer el registro de cambios del catálogo")
+
+    def _leer_cambios(self):
+        while True:
+            resync, cambios, ultima = self.productos.cambios_desde(self._ultima, LOTE_CAMBIOS)
+            if resync:
+                # Historial recortado o datos reiniciados: comparar con el estado actual
+                anterior = self._estado
+                self._sincronizar()
+                self._publicar_diferencias(anterior, ultima)
+                return
+            for cambio in cambios:
+                self._aplicar(cambio)
+                self._ultima = cambio['secuencia']
+            if not cambios or self._ultima >= ultima:
+                return
+
+    def _aplicar(self, cambio):
+        producto_id, secuencia = cambio['id'], cambio['secuencia']
+        if cambio['op'] == OP_UPSERT:
+            nuevo = estado_producto(cambio['producto'])
+            if self._estado.get(producto_id) != nuevo:
+                self._estado[producto_id] = nuevo
+                self._publicar_producto(producto_id, nuevo, secuencia)
+        elif cambio['op'] == OP_DELETE:
+            anterior = self._estado.pop(producto_id, None)
+            if anterior is not None:
+                self._publicar_baja(producto_id, anterior, secuencia)
+
+    def _ponerse_al_dia(self, suscripcion, desde, hasta):
+        """Entrega a `suscripcion` los cambios del registro en (desde, hasta]"""
+        # Categoría de los productos vistos, para filtrar sus bajas
+        categorias = {}
+        while True:
+            resync, cambios, _ = self.productos.cambios_desde(desde, LOTE_CAMBIOS)
+            if resync:
+                suscripcion.entregar(None, formato_sse(EVENTO_RESYNC, {
+                    "error": "Los cambios desde el último evento ya no están disponibles; "
+                             "vuelva a leer los productos"
+                }, hasta))
+                return
+            for cambio in cambios:
+                producto_id, secuencia = cambio['id'], cambio['secuencia']
+                if secuencia > hasta:
+                    return
+                if cambio['op'] == OP_UPSERT:
+                    estado = estado_producto(cambio['producto'])
+                    categorias[producto_id] = estado[2]
+                    if suscripcion.interesa(producto_id, estado[2]):
+                        suscripcion.entregar(producto_id, mensaje_producto(
+                            producto_id, estado, secuencia))
+                elif cambio['op'] == OP_DELETE:
+                    categoria = categorias.get(producto_id)
+                    # Sin categoría conocida (el último cambio es anterior a
+                    # `desde`) solo se filtra por id: una baja de más no afecta
+                    if (suscripcion.interesa(producto_id, categoria) if categoria is not None
+                            else suscripcion.interesa_id(producto_id)):
+                        suscripcion.entregar(producto_id, mensaje_baja(
+                            producto_id, categoria, secuencia))
+            if len(cambios) < LOTE_CAMBIOS:
+                return
+            desde = cambios[-1]['secuencia']
+
+    def _publicar_diferencias(self, anterior, secuencia):
+        for producto_id in anterior.keys() - self._estado.keys():
+            self._publicar_baja(producto_id, anterior[producto_id], secuencia)
+        for producto_id, nuevo in self._estado.items():
+            if anterior.get(producto_id) != nuevo:
+                self._publicar_producto(producto_id, nuevo, secuencia)
+
+    def _publicar_producto(self, producto_id, estado, secuencia):
+        self.broker.publicar(producto_id, estado[2],
+                             mensaje_producto(producto_id, estado, secuencia))
+
+    def _publicar_baja(self, producto_id, estado, secuencia):
+        categoria = estado[2]
+        self.broker.publicar(producto_id, categoria,
+                             mensaje_baja(producto_id, categoria, secuencia))
+
+
+def stream_eventos(eventos, suscripcion, heartbeat=15, duracion_maxima=300):
+    """
+    Generador del cuerpo text/event-stream de una suscripción. Envía un
+    comentario cada `heartbeat` segundos sin cambios (así se detecta que el
+    cliente se fue) y termina tras `duracion_maxima` segundos para liberar
+    el hilo; el navegador reconecta solo.
+    """
+    fin = time.monotonic() + duracion_maxima
+    try:
+        yield f"retry: {REINTENTO_MS}\n\n"
+        while True:
+            restante = fin - time.monotonic()
+            if restante <= 0:
+                return
+            mensajes = suscripcion.esperar(min(heartbeat, restante))
+            if suscripcion.descartada:
+                yield formato_sse(EVENTO_DESCARTADO, {
+                    "error": "El cliente no leyó los eventos a tiempo; "
+                             "vuelva a leer los productos y reconecte"
+                })
+                return
+            if mensajes:
+                yield ''.join(mensajes)
+            elif suscripcion.cerrada:
+                return
+            else:
+                yield ": ping\n\n"
+    finally:
+        eventos.cancelar(suscripcion)
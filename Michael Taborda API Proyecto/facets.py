@@ -0,0 +1,232 @@
+"""
+Facetas del catálogo para la barra lateral de la tienda: productos por
+categoría, histogramas de precio y rating y disponibilidad
+
+Los campos numéricos de cada producto se guardan en columnas compactas
+(módulo array) que se actualizan en cada alta, cambio o baja. Con NumPy
+instalado los conteos se calculan de forma vectorizada sobre esas mismas
+columnas, sin copiarlas; sin NumPy, con un recorrido en Python.
+
+Cada faceta ignora su propio filtro: los conteos por categoría solo
+aplican el rango de precio y el histograma de precio solo la categoría,
+así la barra lateral muestra las alternativas al filtro actual. El rating
+y la disponibilidad aplican todos los filtros.
+"""
+import math
+from array import array
+
+from indexes import normalizar_categoria, valor_orden
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy: conteos con un recorrido en Python
+    np = None
+
+# Intervalos del histograma de precio por defecto y máximos
+BUCKETS_DEFECTO = 10
+BUCKETS_MAXIMO = 50
+# El rating se agrupa en intervalos de ancho 1 entre 0 y RATING_MAXIMO; los
+# valores fuera de ese rango cuentan en el intervalo del extremo
+RATING_MAXIMO = 5
+
+NAN = float('nan')
+
+
+def factor_intervalo(minimo, maximo, buckets):
+    """
+    Multiplicador que lleva un valor de [minimo, maximo] a su intervalo:
+    int((valor - minimo) * factor), con el máximo en el último intervalo.
+    Todos los backends usan la misma fórmula para obtener los mismos conteos.
+    """
+    return buckets / (maximo - minimo)
+
+
+def histograma_precio(minimo, maximo, conteos):
+    """Respuesta de la faceta de precio; `conteos` por intervalo, vacío sin precios"""
+    if minimo is None:
+        return {"min": None, "max": None, "histograma": []}
+    ancho = (maximo - minimo) / len(conteos)
+    filas = [{"desde": round(minimo + ancho * i, 2),
+              "hasta": round(maximo if i == len(conteos) - 1 else minimo + ancho * (i + 1), 2),
+              "count": n}
+             for i, n in enumerate(conteos)]
+    return {"min": minimo, "max": maximo, "histograma": filas}
+
+
+def respuesta(total, categorias, precio, rating, sin_rating, en_stock):
+    """Facetas en el formato común a los dos backends"""
+    return {
+        "total": total,
+        "categorias": [{"categoria": nombre, "count": n}
+                       for nombre, n in sorted(categorias.items(), key=lambda x: (-x[1], x[0]))],
+        "precio": precio,
+        "rating": {
+            "histograma": [{"desde": i, "hasta": i + 1, "count": n}
+                           for i, n in enumerate(rating)],
+            "sin_rating": sin_rating
+        },
+        "disponibilidad": {"en_stock": en_stock, "agotado": total - en_stock}
+    }
+
+
+class ColumnasProductos:
+    """
+    Columnas de precio, rating, stock y código de categoría, una fila por
+    producto. Los valores ausentes o no numéricos se guardan como NaN.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._ids = array('q')
+        self._precio = array('d')
+        self._rating = array('d')
+        self._stock = array('d')
+        self._categoria = array('q')
+        self._columnas = (self._ids, self._precio, self._rating, self._stock, self._categoria)
+        # id de producto -> fila
+        self._fila = {}
+        # categoría normalizada -> código, y código -> nombre tal como se dio de alta
+        self._codigos = {}
+        self._nombres = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def rebuild(self, productos):
+        self.clear()
+        for producto in productos:
+            self.put(producto)
+
+    def _codigo(self, categoria):
+        clave = normalizar_categoria(categoria)
+        codigo = self._codigos.get(clave)
+        if codigo is None:
+            codigo = self._codigos[clave] = len(self._nombres)
+            self._nombres.append(categoria)
+        return codigo
+
+    @staticmethod
+    def _numero(producto, campo):
+        valor = valor_orden(producto, campo)
+        return NAN if valor is None else float(valor)
+
+    def put(self, producto):
+        """Alta o cambio de un producto"""
+        valores = (producto['id'], self._numero(producto, 'precio'),
+                   self._numero(producto, 'rating'), self._numero(producto, 'stock'),
+                   self._codigo(producto['categoria']))
+        fila = self._fila.get(producto['id'])
+        if fila is None:
+            self._fila[producto['id']] = len(self._ids)
+            for columna, valor in zip(self._columnas, valores):
+                columna.append(valor)
+        else:
+            for columna, valor in zip(self._columnas, valores):
+                columna[fila] = valor
+
+    def remove(self, producto_id):
+        """Baja de un producto: la última fila ocupa su lugar"""
+        fila = self._fila.pop(producto_id, None)
+        if fila is None:
+            return
+        ultima = len(self._ids) - 1
+        if fila != ultima:
+            self._fila[self._ids[ultima]] = fila
+            for columna in self._columnas:
+                columna[fila] = columna[ultima]
+        for columna in self._columnas:
+            columna.pop()
+
+    def facetas(self, categoria=None, min_precio=None, max_precio=None,
+                buckets=BUCKETS_DEFECTO):
+        """Facetas de los productos que cumplen los filtros (ver el docstring del módulo)"""
+        # Código de la categoría pedida; -1 si no existe (ningún producto la tiene)
+        codigo = None
+        if categoria:
+            codigo = self._codigos.get(normalizar_categoria(categoria), -1)
+        if np is not None:
+            return self._facetas_numpy(codigo, min_precio, max_precio, buckets)
+        return self._facetas_python(codigo, min_precio, max_precio, buckets)
+
+    def _facetas_numpy(self, codigo, min_precio, max_precio, buckets):
+        # Vistas sobre las columnas sin copiarlas. No deben sobrevivir a la
+        # llamada: mientras existen, las columnas no pueden crecer
+        precio = np.frombuffer(self._precio, dtype=np.float64)
+        rating = np.frombuffer(self._rating, dtype=np.float64)
+        stock = np.frombuffer(self._stock, dtype=np.float64)
+        categorias = np.frombuffer(self._categoria, dtype=np.int64)
+
+        en_precio = np.ones(len(precio), dtype=bool)
+        if min_precio is not None:
+            en_precio &= precio >= min_precio
+        if max_precio is not None:
+            en_precio &= precio <= max_precio
+        en_categoria = (categorias == codigo) if codigo is not None else np.ones_like(en_precio)
+        seleccion = en_precio & en_categoria
+
+        conteos = np.bincount(categorias[en_precio], minlength=len(self._nombres))
+        por_categoria = {self._nombres[c]: int(n) for c, n in enumerate(conteos) if n}
+
+        precios = precio[en_categoria & ~np.isnan(precio)]
+        if len(precios) == 0:
+            faceta_precio = histograma_precio(None, None, [])
+        else:
+            minimo, maximo = float(precios.min()), float(precios.max())
+            if minimo == maximo:
+                por_intervalo = [len(precios)]
+            else:
+                factor = factor_intervalo(minimo, maximo, buckets)
+                indices = np.minimum(((precios - minimo) * factor).astype(np.int64), buckets - 1)
+                por_intervalo = np.bincount(indices, minlength=buckets).tolist()
+            faceta_precio = histograma_precio(minimo, maximo, por_intervalo)
+
+        ratings = rating[seleccion]
+        con_rating = ratings[~np.isnan(ratings)]
+        indices = np.clip(np.floor(con_rating), 0, RATING_MAXIMO - 1).astype(np.int64)
+        por_rating = np.bincount(indices, minlength=RATING_MAXIMO).tolist()
+
+        return respuesta(int(np.count_nonzero(seleccion)), por_categoria, faceta_precio,
+                         por_rating, int(len(ratings) - len(con_rating)),
+                         int(np.count_nonzero(stock[seleccion] > 0)))
+
+    def _facetas_python(self, codigo, min_precio, max_precio, buckets):
+        total = en_stock = sin_rating = 0
+        por_codigo = {}
+        precios = []
+        por_rating = [0] * RATING_MAXIMO
+        for precio, rating, stock, categoria in zip(self._precio, self._rating,
+                                                    self._stock, self._categoria):
+            en_precio = ((min_precio is None or precio >= min_precio) and
+                         (max_precio is None or precio <= max_precio))
+            en_categoria = codigo is None or categoria == codigo
+            if en_precio:
+                por_codigo[categoria] = por_codigo.get(categoria, 0) + 1
+            if en_categoria and not math.isnan(precio):
+                precios.append(precio)
+            if not (en_precio and en_categoria):
+                continue
+            total += 1
+            if stock > 0:
+                en_stock += 1
+            if math.isnan(rating):
+                sin_rating += 1
+            else:
+                por_rating[min(max(math.floor(rating), 0), RATING_MAXIMO - 1)] += 1
+
+        if not precios:
+            faceta_precio = histograma_precio(None, None, [])
+        else:
+            minimo, maximo = min(precios), max(precios)
+            if minimo == maximo:
+                por_intervalo = [len(precios)]
+            else:
+                factor = factor_intervalo(minimo, maximo, buckets)
+                por_intervalo = [0] * buckets
+                for precio in precios:
+                    por_intervalo[min(int((precio - minimo) * factor), buckets - 1)] += 1
+            faceta_precio = histograma_precio(minimo, maximo, por_intervalo)
+
+        por_categoria = {self._nombres[c]: n for c, n in por_codigo.items()}
+        return respuesta(total, por_categoria, faceta_precio, por_rating, sin_rating, en_stock)
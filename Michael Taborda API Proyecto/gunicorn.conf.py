@@ -0,0 +1,26 @@
+"""
+Configuración de gunicorn para la API de Tienda Web
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Los valores se leen de config.py (variables de entorno TIENDA_*).
+Con TIENDA_WORKERS > 1 los repositorios JSON se coordinan mediante
+bloqueos de archivo; con TIENDA_STORAGE=sqlite la coordinación la hace
+SQLite (modo WAL).
+"""
+from config import GRACEFUL_TIMEOUT, SERVER_BIND, THREADS, WORKERS
+
+bind = SERVER_BIND
+workers = WORKERS
+threads = THREADS
+worker_class = 'gthread'
+
+# La aplicación se importa en cada worker, no en el proceso maestro: el
+# escritor diferido y el grupo de hilos de contraseñas no sobreviven a un fork
+preload_app = False
+
+# Apagado ordenado: con SIGTERM cada worker deja de aceptar conexiones,
+# termina las peticiones en curso y, al salir, vuelca las escrituras
+# pendientes (manejadores atexit de APP.py)
+graceful_timeout = GRACEFUL_TIMEOUT
+timeout = max(30, GRACEFUL_TIMEOUT)
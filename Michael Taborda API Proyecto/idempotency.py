@@ -0,0 +1,235 @@
+"""
+Claves de idempotencia (cabecera Idempotency-Key) para los POST que crean
+recursos
+
+La primera petición con una clave reserva la clave, se ejecuta y guarda su
+respuesta; las repeticiones reciben la respuesta guardada sin volver a
+ejecutar el endpoint. Un duplicado que llega mientras la primera petición
+sigue en curso espera a que termine. Las claves se guardan en la capa de
+almacenamiento (sobreviven a reinicios y se comparten entre workers) y se
+descartan por antigüedad (TTL) y por uso (LRU) al superar el máximo.
+"""
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+
+CABECERA = 'Idempotency-Key'
+MAX_LONGITUD_CLAVE = 255
+# Segundos tras los que una reserva sin completar se considera abandonada
+# (por ejemplo, si el proceso que la tenía terminó a mitad de la petición)
+RESERVA_MAXIMA = 60
+# Intervalo de sondeo cuando la petición original está en otro proceso
+INTERVALO_SONDEO = 0.05
+# Segundos entre dos barridos de claves caducadas
+INTERVALO_PURGA = 60
+
+
+class ClaveReutilizada(Exception):
+    """La clave ya se usó con otra petición (otra ruta o cuerpo distinto)"""
+
+
+class EsperaAgotada(Exception):
+    """La petición original con la misma clave sigue en curso"""
+
+
+def huella_peticion():
+    """Identifica la petición: método, ruta y cuerpo"""
+    h = hashlib.sha256(f"{request.method} {request.path}\n".encode('utf-8'))
+    h.update(request.get_data())
+    return h.hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Claves de idempotencia persistidas en `repo` (IdempotencyRepository o
+    SqliteIdempotencyRepository) con un índice LRU en memoria
+    """
+
+    def __init__(self, repo, max_entries=10000, ttl=86400, espera_maxima=10.0):
+        self.repo = repo
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        # clave -> id del registro, de menos a más recientemente usada
+        self._lru = None
+        # clave -> Event de las peticiones en curso en este proceso
+        self._en_curso = {}
+        self._ultima_purga = time.monotonic()
+
+    def _cargar(self):
+        if self._lru is None:
+            registros = sorted(self.repo.all(), key=lambda r: r['usado'])
+            self._lru = OrderedDict((r['clave'], r['id']) for r in registros)
+
+    def _vigente(self, registro):
+        ahora = time.time()
+        if registro['estado'] == 'en_curso':
+            return ahora - registro['creado'] < RESERVA_MAXIMA
+        return ahora - registro['creado'] < self.ttl
+
+    def _recordar(self, clave, registro_id):
+        """Marca la clave como la más reciente y descarta las que sobran"""
+        with self._lock:
+            self._cargar()
+            self._lru[clave] = registro_id
+            self._lru.move_to_end(clave)
+            descartar = []
+            while len(self._lru) > self.max_entries:
+                descartar.append(self._lru.popitem(last=False)[1])
+        for registro_id in descartar:
+            self.repo.delete(registro_id)
+        if time.monotonic() - self._ultima_purga >= INTERVALO_PURGA:
+            self._ultima_purga = time.monotonic()
+            self.purgar()
+
+    def purgar(self, maximo=100):
+        """Elimina hasta `maximo` claves caducadas entre las menos usadas"""
+        with self._lock:
+            self._cargar()
+            candidatas = list(self._lru.items())[:maximo]
+        for clave, registro_id in candidatas:
+            registro = self.repo.get(registro_id)
+            if registro is not None and self._vigente(registro):
+                continue
+            with self._lock:
+                if self._lru.get(clave) == registro_id:
+                    del self._lru[clave]
+            if registro is not None:
+                self.repo.delete(registro_id)
+
+    def comenzar(self, clave, huella):
+        """
+        Retorna (registro, propia). Con propia=True la petición reservó la
+        clave y debe ejecutarse y llamar a completar() o abandonar(); si no,
+        `registro` tiene la respuesta guardada de la petición original.
+        """
+        limite = time.monotonic() + self.espera_maxima
+        while True:
+            with self._lock:
+                evento = self._en_curso.get(clave)
+                propia = evento is None
+                if propia:
+                    evento = self._en_curso[clave] = threading.Event()
+            if not propia:
+                # Duplicado en este mismo proceso: esperar a la original
+                if not evento.wait(max(0.0, limite - time.monotonic())):
+                    raise EsperaAgotada(clave)
+                continue
+
+            ahora = time.time()
+            try:
+                registro, creado = self.repo.reservar({
+                    "clave": clave, "huella": huella, "estado": "en_curso",
+                    "creado": ahora, "usado": ahora
+                }, self._vigente)
+            except BaseException:
+                self._liberar(clave)
+                raise
+            if creado:
+                self._recordar(clave, registro['id'])
+                return registro, True
+
+            self._liberar(clave)
+            if registro['huella'] != huella:
+                raise ClaveReutilizada(clave)
+            if registro['estado'] == 'completa':
+                self._recordar(clave, registro['id'])
+                return registro, False
+            # La petición original está en curso en otro proceso
+            if time.monotonic() >= limite:
+                raise EsperaAgotada(clave)
+            time.sleep(INTERVALO_SONDEO)
+
+    def _liberar(self, clave):
+        with self._lock:
+            evento = self._en_curso.pop(clave, None)
+        if evento is not None:
+            evento.set()
+
+    def completar(self, registro, response):
+        """Guarda la respuesta de la petición que reservó la clave"""
+        datos = response.get_data()
+        cambios = {"estado": "completa", "status": response.status_code,
+                   "content_type": response.content_type, "usado": time.time()}
+        if response.mimetype == 'application/json':
+            cambios["cuerpo"] = datos.decode('utf-8')
+        else:
+            cambios["cuerpo_b64"] = base64.b64encode(datos).decode('ascii')
+        try:
+            self.repo.update(registro['id'], cambios)
+        finally:
+            self._liberar(registro['clave'])
+
+    def abandonar(self, registro):
+        """Libera la clave sin guardar respuesta: un reintento volverá a ejecutarse"""
+        try:
+            self.repo.delete(registro['id'])
+        finally:
+            with self._lock:
+                if self._lru is not None and self._lru.get(registro['clave']) == registro['id']:
+                    del self._lru[registro['clave']]
+            self._liberar(registro['clave'])
+
+
+def respuesta_guardada(registro):
+    if 'cuerpo' in registro:
+        cuerpo = registro['cuerpo']
+    else:
+        cuerpo = base64.b64decode(registro['cuerpo_b64'])
+    resp = Response(cuerpo, status=registro['status'], content_type=registro['content_type'])
+    resp.headers['Idempotent-Replayed'] = 'true'
+    return resp
+
+
+def idempotente(store):
+    """
+    Decorador para endpoints POST: con la cabecera Idempotency-Key, las
+    repeticiones reciben la respuesta original. Las respuestas 5xx no se
+    guardan, así un reintento vuelve a ejecutar el endpoint.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            clave = request.headers.get(CABECERA)
+            if clave is None:
+                return view(*args, **kwargs)
+            if not clave or len(clave) > MAX_LONGITUD_CLAVE:
+                return jsonify({
+                    "success": False,
+                    "error": f"La cabecera {CABECERA} debe tener entre 1 y "
+                             f"{MAX_LONGITUD_CLAVE} caracteres"
+                }), 400
+
+            try:
+                registro, propia = store.comenzar(clave, huella_peticion())
+            except ClaveReutilizada:
+                return jsonify({
+                    "success": False,
+                    "error": f"La clave {CABECERA} ya se usó con otra petición"
+                }), 422
+            except EsperaAgotada:
+                return jsonify({
+                    "success": False,
+                    "error": f"Hay una petición en curso con la misma {CABECERA}"
+                }), 409, {'Retry-After': '1'}
+            if not propia:
+                return respuesta_guardada(registro)
+
+            try:
+                resp = make_response(view(*args, **kwargs))
+            except BaseException:
+                store.abandonar(registro)
+                raise
+            if resp.status_code >= 500 or resp.is_streamed:
+                store.abandonar(registro)
+            else:
+                store.completar(registro, resp)
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,187 @@
+"""
+Índices secundarios en memoria sobre el catálogo de productos
+
+- Índice hash por categoría (sin distinguir mayúsculas/minúsculas)
+- Índice ordenado por precio para consultas de rango con búsqueda binaria
+- Listas ordenadas por precio, rating y stock, globales y por categoría,
+  para listados ordenados y top-k sin ordenar el catálogo en cada petición
+
+Ambos se actualizan de forma incremental en cada alta, cambio o baja,
+así que el coste de un listado filtrado depende del número de
+coincidencias y no del tamaño del catálogo.
+"""
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain
+
+# Campos por los que se puede ordenar un listado de productos
+CAMPOS_ORDEN = ('precio', 'rating', 'stock')
+
+
+def normalizar_categoria(categoria):
+    """Clave de índice de una categoría; lanza ValueError si no es texto"""
+    if not isinstance(categoria, str):
+        raise ValueError("La categoría debe ser un texto")
+    return categoria.casefold()
+
+
+def valor_orden(producto, campo):
+    """Valor numérico de un campo de ordenación, o None si falta o no es un número"""
+    valor = producto.get(campo)
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return valor
+    return None
+
+
+def _descendente(lista, inicio, fin):
+    """Recorre lista[inicio:fin] de (valor, id) de mayor a menor valor, con empates por id"""
+    while fin > inicio:
+        valor = lista[fin - 1][0]
+        # (valor,) queda antes de cualquier (valor, id)
+        grupo = bisect_left(lista, (valor,), inicio, fin)
+        yield from lista[grupo:fin]
+        fin = grupo
+
+
+class ProductIndex:
+    """Índices de categoría, precio y orden sobre los ids de producto"""
+
+    def __init__(self):
+        self.clear()
+
+    @property
+    def _por_precio(self):
+        return self._orden['precio'][None]
+
+    def _add_orden(self, campo, clave, producto):
+        valor = valor_orden(producto, campo)
+        if valor is None:
+            self._sin_valor[campo].add(producto['id'])
+            return
+        # Lista global (clave None) y lista de la categoría
+        for lista in (self._orden[campo][None], self._orden[campo].setdefault(clave, [])):
+            insort(lista, (valor, producto['id']))
+
+    def _remove_orden(self, campo, clave, producto):
+        valor = valor_orden(producto, campo)
+        if valor is None:
+            self._sin_valor[campo].discard(producto['id'])
+            return
+        entrada = (valor, producto['id'])
+        for k in (None, clave):
+            lista = self._orden[campo].get(k)
+            if lista is None:
+                continue
+            i = bisect_left(lista, entrada)
+            if i < len(lista) and lista[i] == entrada:
+                del lista[i]
+            if not lista and k is not None:
+                del self._orden[campo][k]
+
+    def add(self, producto):
+        clave = normalizar_categoria(producto['categoria'])
+        self._por_categoria.setdefault(clave, set()).add(producto['id'])
+        for campo in CAMPOS_ORDEN:
+            self._add_orden(campo, clave, producto)
+        self._precios[producto['id']] = valor_orden(producto, 'precio')
+
+    def remove(self, producto):
+        clave = normalizar_categoria(producto['categoria'])
+        ids = self._por_categoria.get(clave)
+        if ids is not None:
+            ids.discard(producto['id'])
+            if not ids:
+                del self._por_categoria[clave]
+        for campo in CAMPOS_ORDEN:
+            self._remove_orden(campo, clave, producto)
+        self._precios.pop(producto['id'], None)
+
+    def update(self, anterior, nuevo):
+        """
+        Reemplaza `anterior` por `nuevo` tocando solo las listas de los
+        campos que cambiaron (una reserva de stock no mueve precio ni rating)
+        """
+        clave = normalizar_categoria(anterior['categoria'])
+        if clave != normalizar_categoria(nuevo['categoria']):
+            self.remove(anterior)
+            self.add(nuevo)
+            return
+        for campo in CAMPOS_ORDEN:
+            if valor_orden(anterior, campo) != valor_orden(nuevo, campo):
+                self._remove_orden(campo, clave, anterior)
+                self._add_orden(campo, clave, nuevo)
+        self._precios[nuevo['id']] = valor_orden(nuevo, 'precio')
+
+    def clear(self):
+        self._por_categoria = {}
+        self._precios = {}
+        # campo -> {clave de categoría (None = todas): [(valor, id)] ordenada}
+        self._orden = {campo: {None: []} for campo in CAMPOS_ORDEN}
+        # campo -> ids de productos sin valor numérico en ese campo
+        self._sin_valor = {campo: set() for campo in CAMPOS_ORDEN}
+
+    def _rango_precio(self, min_precio, max_precio):
+        inicio = 0
+        fin = len(self._por_precio)
+        if min_precio is not None:
+            inicio = bisect_left(self._por_precio, (min_precio,))
+        if max_precio is not None:
+            # (max_precio, inf) queda después de cualquier (max_precio, id)
+            fin = bisect_right(self._por_precio, (max_precio, float('inf')))
+        return inicio, max(inicio, fin)
+
+    def query(self, categoria=None, min_precio=None, max_precio=None):
+        """
+        Ids que cumplen todos los filtros, ordenados por id. Se recorre el
+        conjunto de candidatos más pequeño y se comprueba el otro filtro.
+        """
+        por_precio = min_precio is not None or max_precio is not None
+        if categoria:
+            ids_categoria = self._por_categoria.get(normalizar_categoria(categoria), set())
+            if not por_precio:
+                return sorted(ids_categoria)
+            inicio, fin = self._rango_precio(min_precio, max_precio)
+            if len(ids_categoria) <= fin - inicio:
+                return sorted(i for i in ids_categoria
+                              if self._en_rango(i, min_precio, max_precio))
+            return sorted(pid for _, pid in self._por_precio[inicio:fin]
+                          if pid in ids_categoria)
+        if por_precio:
+            inicio, fin = self._rango_precio(min_precio, max_precio)
+            return sorted(pid for _, pid in self._por_precio[inicio:fin])
+        return None
+
+    def _en_rango(self, producto_id, min_precio, max_precio):
+        precio = self._precios[producto_id]
+        if precio is None:
+            return False
+        return ((min_precio is None or precio >= min_precio) and
+                (max_precio is None or precio <= max_precio))
+
+    def ordenados(self, campo, descendente=False, categoria=None,
+                  min_precio=None, max_precio=None):
+        """
+        Recorre los ids que cumplen los filtros ordenados por `campo`, con
+        empates por id. Los productos sin valor en el campo van al final.
+        Es perezoso: pedir los k primeros cuesta O(k), no O(catálogo).
+        """
+        clave = normalizar_categoria(categoria) if categoria else None
+        lista = self._orden[campo].get(clave, [])
+        inicio, fin = 0, len(lista)
+        if campo == 'precio':
+            # El propio orden resuelve el filtro de precio con búsqueda binaria
+            if min_precio is not None:
+                inicio = bisect_left(lista, (min_precio,))
+            if max_precio is not None:
+                fin = max(inicio, bisect_right(lista, (max_precio, float('inf'))))
+            min_precio = max_precio = None
+        if descendente:
+            entradas = _descendente(lista, inicio, fin)
+        else:
+            entradas = (lista[i] for i in range(inicio, fin))
+        sin_valor = self._sin_valor[campo]
+        if clave is not None:
+            sin_valor = sin_valor & self._por_categoria.get(clave, set())
+        ids = chain((pid for _, pid in entradas), sorted(sin_valor))
+        if min_precio is None and max_precio is None:
+            return ids
+        return (i for i in ids if self._en_rango(i, min_precio, max_precio))
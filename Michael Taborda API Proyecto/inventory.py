@@ -0,0 +1,105 @@
+"""
+Motor de inventario: reserva y descuento de stock sin sobreventa
+
+Las reservas usan compare-and-swap sobre el repositorio de productos:
+se leen los productos del pedido (búsqueda O(1) por id), se calcula el
+stock resultante y se aplican todos los cambios de una sola vez solo si
+ningún producto cambió mientras tanto. Si hubo un cambio concurrente se
+reintenta con los datos nuevos.
+"""
+
+
+class InventarioError(Exception):
+    """Error base del motor de inventario"""
+
+
+class ProductoNoEncontrado(InventarioError):
+    def __init__(self, producto_id):
+        super().__init__(f"Producto con ID {producto_id} no encontrado")
+        self.producto_id = producto_id
+
+
+class StockInsuficiente(InventarioError):
+    def __init__(self, producto):
+        super().__init__(f"Stock insuficiente para {producto['nombre']}")
+        self.producto = producto
+
+
+class ConflictoInventario(InventarioError):
+    """No se pudo aplicar la reserva tras agotar los reintentos"""
+
+
+class Reserva:
+    """
+    Stock descontado para un pedido. Se confirma con commit() una vez
+    guardado el pedido, o se devuelve al inventario con release().
+    """
+
+    def __init__(self, inventario, cantidades, productos):
+        self._inventario = inventario
+        self.cantidades = cantidades
+        # Productos tal como estaban al reservar (precio y nombre del pedido)
+        self.productos = productos
+        self.activa = True
+
+    def commit(self):
+        self.activa = False
+
+    def release(self):
+        if self.activa:
+            self.activa = False
+            self._inventario.reponer(self.cantidades)
+
+
+class Inventario:
+    def __init__(self, productos_repo, max_reintentos=50):
+        self.productos_repo = productos_repo
+        self.max_reintentos = max_reintentos
+
+    def _aplicar(self, calcular):
+        """
+        Ejecuta un ciclo leer-calcular-CAS. `calcular` recibe los productos
+        actuales y retorna la lista de pares (esperado, nuevo).
+        """
+        for _ in range(self.max_reintentos):
+            cambios = calcular()
+            if self.productos_repo.compare_and_swap(cambios):
+                return cambios
+        raise ConflictoInventario("Demasiados cambios concurrentes sobre el inventario")
+
+    def reservar(self, items):
+        """
+        Descuenta de forma atómica el stock de todos los items
+        [(producto_id, cantidad), ...]. Las líneas repetidas de un mismo
+        producto se suman antes de comprobar el stock.
+        """
+        cantidades = {}
+        for producto_id, cantidad in items:
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+
+        def calcular():
+            cambios = []
+            for producto_id, cantidad in cantidades.items():
+                producto = self.productos_repo.get(producto_id)
+                if producto is None:
+                    raise ProductoNoEncontrado(producto_id)
+                if producto['stock'] < cantidad:
+                    raise StockInsuficiente(producto)
+                cambios.append((producto, {**producto, "stock": producto['stock'] - cantidad}))
+            return cambios
+
+        cambios = self._aplicar(calcular)
+        productos = {esperado['id']: esperado for esperado, _ in cambios}
+        return Reserva(self, cantidades, productos)
+
+    def reponer(self, cantidades):
+        """Devuelve stock al inventario; ignora productos ya eliminados"""
+        def calcular():
+            cambios = []
+            for producto_id, cantidad in cantidades.items():
+                producto = self.productos_repo.get(producto_id)
+                if producto is not None:
+                    cambios.append((producto, {**producto, "stock": producto['stock'] + cantidad}))
+            return cambios
+
+        self._aplicar(calcular)
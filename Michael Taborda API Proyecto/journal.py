@@ -0,0 +1,292 @@
+"""
+Diario de solo-anexado (JSONL) para colecciones con escrituras frecuentes
+(claves de idempotencia, registro de cambios del catálogo)
+
+Cada alta, cambio o baja se anexa como una línea al diario en lugar de
+reescribir todo el archivo. La compactación pliega el diario en la
+instantánea JSON y lo vacía. Al arrancar se recupera el estado leyendo la
+instantánea y reproduciendo el diario.
+"""
+import os
+import time
+from bisect import bisect_left, insort
+
+from metrics import record_io
+from repository import Repository, write_json
+from serializers import dumps, loads
+
+
+class JournalCorruptError(Exception):
+    """El diario contiene una línea ilegible que no es la última"""
+
+
+def replay_journal(journal_path):
+    """
+    Lee las entradas del diario. Si la última línea quedó cortada por una
+    caída a mitad de escritura, se descarta y se trunca el archivo.
+    """
+    entradas = []
+    try:
+        f = open(journal_path, 'rb')
+    except FileNotFoundError:
+        return entradas
+
+    with f:
+        offset_valido = 0
+        for linea in f:
+            try:
+                if not linea.endswith(b'\n'):
+                    raise ValueError("línea incompleta")
+                entradas.append(loads(linea))
+            except ValueError:
+                if f.read(1):
+                    raise JournalCorruptError(
+                        f"Entrada corrupta en {journal_path} (byte {offset_valido})")
+                break
+            offset_valido += len(linea)
+        tamano = f.seek(0, os.SEEK_END)
+
+    if offset_valido < tamano:
+        with open(journal_path, 'r+b') as f:
+            f.truncate(offset_valido)
+    return entradas
+
+
+def read_journal_from(journal_path, offset):
+    """
+    Entradas completas anexadas al diario a partir de `offset`. Retorna
+    (entradas, offset tras la última línea completa).
+    """
+    try:
+        f = open(journal_path, 'rb')
+    except FileNotFoundError:
+        return [], 0
+    with f:
+        f.seek(offset)
+        datos = f.read()
+    completas = datos[:datos.rfind(b'\n') + 1]
+    entradas = [loads(linea) for linea in completas.splitlines() if linea.strip()]
+    return entradas, offset + len(completas)
+
+
+class JournaledRepository(Repository):
+    """
+    Repositorio persistido como instantánea JSON más diario JSONL.
+
+    En modo compartido (varios procesos), cada proceso aplica solo las
+    líneas que otros anexaron al diario desde su última lectura; la
+    instantánea completa se relee únicamente tras una compactación.
+    """
+
+    def __init__(self, file_path, journal_path, compact_threshold=1000,
+                 fsync_policy='always', shared=False):
+        super().__init__(file_path, shared=shared, fsync_policy=fsync_policy)
+        self.journal_path = journal_path
+        self.compact_threshold = compact_threshold
+        self._journal = None
+        self._journal_entries = 0
+        # Bytes del diario ya aplicados en memoria
+        self._offset = 0
+        # Líneas de un lote (batch) aún sin escribir: se anexan juntas al
+        # terminar el lote, con un solo fsync
+        self._lineas_lote = []
+
+    def _load(self):
+        super()._load()
+        entradas = replay_journal(self.journal_path)
+        for entrada in entradas:
+            self._apply(entrada)
+        if entradas:
+            self._set_records(list(self._by_id.values()))
+        self._journal_entries = len(entradas)
+        self._offset = self._tamano_diario()
+
+    def _tamano_diario(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _refrescar(self):
+        contadores = self._file_lock.read_counters()
+        if (contadores is None or self._contadores is None
+                or contadores[1] != self._contadores[1]):
+            # Otro proceso compactó el diario: releer la instantánea
+            super()._refrescar()
+            return
+        entradas, self._offset = read_journal_from(self.journal_path, self._offset)
+        for entrada in entradas:
+            self._aplicar_incremental(entrada)
+        self._journal_entries += len(entradas)
+        self._contadores = contadores
+        self._bump_version()
+
+    def _aplicar_incremental(self, entrada):
+        """Aplica una entrada manteniendo la lista ordenada de ids"""
+        if entrada['op'] == 'insert':
+            registro_id = entrada['registro']['id']
+            if registro_id not in self._by_id:
+                insort(self._ids, registro_id)
+                self._max_id = max(self._max_id, registro_id)
+        elif entrada['op'] == 'delete' and entrada['id'] in self._by_id:
+            del self._ids[bisect_left(self._ids, entrada['id'])]
+        self._apply(entrada)
+
+    def _persistir(self):
+        # Las mutaciones se persisten anexando al diario, no reescribiendo
+        # la instantánea
+        pass
+
+    def _guardar(self):
+        # Fin de un lote: anexar sus líneas
+        if self._lineas_lote:
+            lineas, self._lineas_lote = self._lineas_lote, []
+            self._anexar(lineas)
+
+    def _apply(self, entrada):
+        op = entrada['op']
+        if op == 'insert':
+            registro = entrada['registro']
+            self._by_id[registro['id']] = registro
+        elif op == 'update':
+            actual = self._by_id.get(entrada['id'])
+            if actual is not None:
+                self._by_id[entrada['id']] = {**actual, **entrada['cambios']}
+        elif op == 'delete':
+            self._by_id.pop(entrada['id'], None)
+
+    def _append(self, entrada):
+        linea = dumps(entrada) + b'\n'
+        if self._batch_depth:
+            self._lineas_lote.append(linea)
+        else:
+            self._anexar([linea])
+
+    def _anexar(self, lineas):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        inicio = time.perf_counter()
+        datos = b''.join(lineas)
+        self._journal.write(datos)
+        self._journal.flush()
+        if self.fsync_policy == 'always':
+            os.fsync(self._journal.fileno())
+        record_io('append', os.path.basename(self.journal_path),
+                  time.perf_counter() - inicio, len(datos))
+        if self._file_lock is not None:
+            self._offset = os.fstat(self._journal.fileno()).st_size
+            self._avanzar_contadores()
+        self._journal_entries += len(lineas)
+        if self._journal_entries >= self.compact_threshold:
+            self.compact()
+
+    def insert(self, registro):
+        with self._escritura():
+            super().insert(registro)
+            self._append({"op": "insert", "registro": registro})
+        return registro
+
+    def update(self, record_id, cambios):
+        with self._escritura():
+            nuevo = super().update(record_id, cambios)
+            if nuevo is not None:
+                self._append({"op": "update", "id": record_id, "cambios": cambios})
+        return nuevo
+
+    def delete(self, record_id):
+        with self._escritura():
+            eliminado = super().delete(record_id)
+            if eliminado:
+                self._append({"op": "delete", "id": record_id})
+        return eliminado
+
+    def reset(self, registros):
+        with self._escritura():
+            self._set_records(registros)
+            self.compact()
+
+    def compact(self):
+        """Pliega el diario en la instantánea y lo vacía"""
+        with self._escritura():
+            write_json(self.file_path, self.snapshot(),
+                       fsync=self.fsync_policy != 'never')
+            # La instantánea ya incluye las líneas pendientes del lote
+            self._lineas_lote = []
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            # Si el proceso cae aquí, reproducir el diario sobre la nueva
+            # instantánea es seguro: todas las operaciones son idempotentes
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+            self._journal_entries = 0
+            self._offset = 0
+            if self._file_lock is not None:
+                self._avanzar_contadores(nueva_epoca=True)
+
+    def close(self):
+        """Compacta el diario al cerrar el proceso"""
+        if self._by_id is not None:
+            self.compact()
+
+
+class IdempotencyRepository(JournaledRepository):
+    """Claves de idempotencia con índice único por clave"""
+
+    def __init__(self, file_path, journal_path, compact_threshold=1000,
+                 fsync_policy='always', shared=False):
+        super().__init__(file_path, journal_path, compact_threshold, fsync_policy, shared)
+        self._por_clave = {}
+
+    def _set_records(self, registros):
+        super()._set_records(registros)
+        self._por_clave = {r['clave']: r['id'] for r in self._by_id.values()}
+
+    def _aplicar_incremental(self, entrada):
+        registro_id = entrada['registro']['id'] if entrada['op'] == 'insert' else entrada['id']
+        anterior = self._by_id.get(registro_id)
+        super()._aplicar_incremental(entrada)
+        if anterior is not None:
+            self._por_clave.pop(anterior['clave'], None)
+        nuevo = self._by_id.get(registro_id)
+        if nuevo is not None:
+            self._por_clave[nuevo['clave']] = registro_id
+
+    def find_one(self, campo, valor):
+        if campo != 'clave':
+            return super().find_one(campo, valor)
+        self._ensure_loaded()
+        with self._lock:
+            registro_id = self._por_clave.get(valor)
+            return self._by_id.get(registro_id) if registro_id is not None else None
+
+    def insert(self, registro):
+        with self._escritura():
+            anterior = self._by_id.get(registro['id'])
+            if anterior is not None:
+                self._por_clave.pop(anterior['clave'], None)
+            super().insert(registro)
+            self._por_clave[registro['clave']] = registro['id']
+        return registro
+
+    def delete(self, record_id):
+        with self._escritura():
+            anterior = self._by_id.get(record_id)
+            if not super().delete(record_id):
+                return False
+            self._por_clave.pop(anterior['clave'], None)
+        return True
+
+    def reservar(self, data, vigente):
+        """
+        Crea el registro de `data['clave']` salvo que ya exista uno para el
+        que vigente(registro) sea verdadero. Retorna (registro, creado).
+        """
+        with self._escritura():
+            registro_id = self._por_clave.get(data['clave'])
+            if registro_id is not None:
+                actual = self._by_id[registro_id]
+                if vigente(actual):
+                    return actual, False
+                self.delete(registro_id)
+            return self.create(data), True
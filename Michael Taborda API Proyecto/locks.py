@@ -0,0 +1,120 @@
+"""
+Bloqueos de archivo entre procesos (fcntl.flock)
+
+Cuando la API corre con varios procesos worker, cada uno tiene su propia
+copia en memoria de las colecciones. Un bloqueo exclusivo por archivo de
+datos serializa las escrituras entre procesos, y uno compartido protege
+las recargas. En sistemas sin fcntl (Windows) el bloqueo solo coordina
+los hilos del proceso actual.
+
+El archivo de bloqueo guarda además dos contadores: la generación, que
+aumenta con cada escritura, y la época, que aumenta cuando se reescribe
+la instantánea completa. Comparándolos, un proceso sabe si sus datos en
+memoria siguen al día sin releer los archivos de datos. Se leen y
+escriben con lseek + read/write (os.pread y os.pwrite no existen en
+Windows).
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+# Bytes reservados al inicio del archivo de bloqueo para los contadores
+TAMANO_CONTADORES = 64
+
+
+class FileLock:
+    """
+    Bloqueo sobre `path` (se crea si no existe). Es reentrante dentro del
+    mismo proceso: solo la adquisición más externa toca el archivo, así que
+    un bloqueo compartido pedido mientras se tiene el exclusivo no lo rebaja.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        # Posición del descriptor compartida: lseek + read/write van juntos
+        self._io_lock = threading.Lock()
+
+    def _abrir(self):
+        with self._lock:
+            if self._fd is None:
+                # O_BINARY solo existe (y hace falta) en Windows
+                flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+                self._fd = os.open(self.path, flags, 0o644)
+        return self._fd
+
+    def acquire(self, shared=False):
+        self._lock.acquire()
+        try:
+            if self._depth == 0:
+                self._abrir()
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._depth += 1
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def release(self):
+        self._depth -= 1
+        try:
+            if self._depth == 0 and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @contextmanager
+    def shared(self):
+        """Bloqueo compartido: varios procesos lectores a la vez"""
+        self.acquire(shared=True)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def read_counters(self):
+        """
+        Contadores (generación, época) guardados en el archivo de bloqueo.
+        Se leen sin tomar el bloqueo; una lectura a medio escribir retorna
+        None, que nunca coincide con los valores conocidos y fuerza una recarga.
+        """
+        fd = self._abrir()
+        with self._io_lock:
+            os.lseek(fd, 0, os.SEEK_SET)
+            datos = os.read(fd, TAMANO_CONTADORES).split()
+        if not datos:
+            return (0, 0)
+        try:
+            generacion, epoca = (int(x) for x in datos)
+        except ValueError:
+            return None
+        return (generacion, epoca)
+
+    def write_counters(self, generacion, epoca):
+        """Guarda los contadores; requiere tener el bloqueo exclusivo"""
+        texto = f"{generacion} {epoca}".ljust(TAMANO_CONTADORES).encode('ascii')
+        fd = self._abrir()
+        with self._io_lock:
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, texto)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
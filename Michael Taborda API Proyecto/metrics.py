@@ -0,0 +1,282 @@
+"""
+Métricas de la API en formato de texto de Prometheus
+
+- Latencia por ruta (histograma), peticiones y errores por estado,
+  peticiones en curso
+- Tiempo y bytes de E/S de almacenamiento (lectura/escritura de JSON,
+  anexos al diario) y tiempo de serialización de respuestas
+- Registro opcional de peticiones lentas con el desglose de tiempos
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger('tienda.slow')
+
+
+def _escape(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(nombres, valores, extra=()):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(nombres, valores)]
+    pares += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class _Metric:
+    tipo = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.label_names)
+
+    def render(self):
+        lineas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.tipo}"]
+        with self._lock:
+            valores = list(self._values.items())
+        for key, valor in sorted(valores):
+            lineas.append(f"{self.name}{_labels(self.label_names, key)} {valor}")
+        return lineas
+
+
+class Counter(_Metric):
+    tipo = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    tipo = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, valor, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = valor
+
+
+class CallbackMetric(_Metric):
+    """Métrica cuyo valor se calcula al exportar: fn() -> {tupla de labels: valor}"""
+
+    def __init__(self, name, help, fn, labels=(), tipo='gauge'):
+        super().__init__(name, help, labels)
+        self._fn = fn
+        self.tipo = tipo
+
+    def render(self):
+        with self._lock:
+            self._values = dict(self._fn())
+        return super().render()
+
+
+class Histogram(_Metric):
+    tipo = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, valor, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            estado = self._values.get(key)
+            if estado is None:
+                estado = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            estado[0][i] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def render(self):
+        lineas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.tipo}"]
+        with self._lock:
+            valores = [(k, ([*v[0]], v[1], v[2])) for k, v in self._values.items()]
+        for key, (conteos, suma, total) in sorted(valores):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                lineas.append(f"{self.name}_bucket"
+                              f"{_labels(self.label_names, key, [('le', limite)])} {acumulado}")
+            lineas.append(f"{self.name}_bucket"
+                          f"{_labels(self.label_names, key, [('le', '+Inf')])} {total}")
+            lineas.append(f"{self.name}_sum{_labels(self.label_names, key)} {suma}")
+            lineas.append(f"{self.name}_count{_labels(self.label_names, key)} {total}")
+        return lineas
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def callback(self, name, help, fn, labels=(), tipo='gauge'):
+        return self._add(CallbackMetric(name, help, fn, labels, tipo))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lineas = []
+        for metric in self._metrics:
+            lineas.extend(metric.render())
+        return '\n'.join(lineas) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'tienda_request_duration_seconds', "Latencia de las peticiones por ruta",
+    labels=('method', 'route'))
+REQUESTS = registry.counter(
+    'tienda_requests_total', "Peticiones atendidas por ruta y código de estado",
+    labels=('method', 'route', 'status'))
+ERRORS = registry.counter(
+    'tienda_request_errors_total', "Peticiones con estado 4xx o 5xx por ruta",
+    labels=('method', 'route', 'status'))
+IN_FLIGHT = registry.gauge(
+    'tienda_requests_in_flight', "Peticiones en curso")
+STORAGE_SECONDS = registry.histogram(
+    'tienda_storage_io_seconds', "Tiempo de E/S de almacenamiento por operación y archivo",
+    labels=('op', 'file'))
+STORAGE_BYTES = registry.counter(
+    'tienda_storage_io_bytes_total', "Bytes leídos o escritos por operación y archivo",
+    labels=('op', 'file'))
+SERIALIZATION_SECONDS = registry.histogram(
+    'tienda_serialization_seconds', "Tiempo de serialización (JSON o MessagePack) de las respuestas")
+
+
+def _desglose():
+    """Acumulador de tiempos de la petición en curso, o None fuera de una petición"""
+    if not has_request_context():
+        return None
+    desglose = g.get('_desglose')
+    if desglose is None:
+        desglose = g._desglose = {'storage_io': 0.0, 'serialization': 0.0}
+    return desglose
+
+
+def record_io(op, archivo, segundos, nbytes):
+    """Registra una operación de E/S de almacenamiento"""
+    STORAGE_SECONDS.observe(segundos, op=op, file=archivo)
+    STORAGE_BYTES.inc(nbytes, op=op, file=archivo)
+    desglose = _desglose()
+    if desglose is not None:
+        desglose['storage_io'] += segundos
+
+
+def _medir_serializacion(inicio):
+    segundos = time.perf_counter() - inicio
+    SERIALIZATION_SECONDS.observe(segundos)
+    desglose = _desglose()
+    if desglose is not None:
+        desglose['serialization'] += segundos
+
+
+class MedicionSerializacion:
+    """
+    Se combina con la clase del proveedor JSON instalado en la aplicación
+    (ver init_app) para medir el tiempo de serialización sin reemplazarlo
+    """
+
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _medir_serializacion(inicio)
+
+    def dumps_msgpack(self, obj):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps_msgpack(obj)
+        finally:
+            _medir_serializacion(inicio)
+
+
+def medir_proveedor_json(app):
+    """Envuelve el proveedor JSON actual de la aplicación para medir la serialización"""
+    base = type(app.json)
+    if issubclass(base, MedicionSerializacion):
+        return
+    medido = type(f"Medido{base.__name__}", (MedicionSerializacion, base), {})(app)
+    # Conserva la configuración del proveedor original (sort_keys, etc.)
+    vars(medido).update(vars(app.json))
+    app.json = medido
+
+
+def init_app(app, slow_request_ms=0):
+    """
+    Instala los hooks de medición en la aplicación. El proveedor JSON debe
+    estar instalado antes (serializers.init_app) para que se mida.
+    """
+    medir_proveedor_json(app)
+
+    @app.before_request
+    def _inicio():
+        g._inicio = time.perf_counter()
+        g._en_curso = True
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def _fin(response):
+        inicio = g.get('_inicio')
+        if inicio is None:
+            return response
+        segundos = time.perf_counter() - inicio
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        REQUEST_LATENCY.observe(segundos, method=request.method, route=ruta)
+        REQUESTS.inc(method=request.method, route=ruta, status=response.status_code)
+        if response.status_code >= 400:
+            ERRORS.inc(method=request.method, route=ruta, status=response.status_code)
+
+        if slow_request_ms and segundos * 1000 >= slow_request_ms:
+            desglose = g.get('_desglose') or {}
+            slow_log.warning(json.dumps({
+                "method": request.method,
+                "route": ruta,
+                "path": request.path,
+                "params": request.args.to_dict(flat=False),
+                "status": response.status_code,
+                "total_ms": round(segundos * 1000, 3),
+                "storage_io_ms": round(desglose.get('storage_io', 0.0) * 1000, 3),
+                "serialization_ms": round(desglose.get('serialization', 0.0) * 1000, 3),
+            }, ensure_ascii=False))
+        return response
+
+    @app.teardown_request
+    def _salida(exc):
+        if g.pop('_en_curso', False):
+            IN_FLIGHT.dec()
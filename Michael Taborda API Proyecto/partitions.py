@@ -0,0 +1,549 @@
+"""
+Pedidos particionados por mes de creación
+
+Cada partición (data/orders/AAAA-MM.jsonl) es un diario de solo-anexado:
+el alta o el cambio de un pedido anexa una línea con el pedido completo y
+la baja, una lápida. Un índice compacto en memoria guarda, por id, la
+partición y la posición de la última línea del pedido, así que leer un
+pedido lee una sola línea de una sola partición y un listado por fechas
+solo abre las particiones de los meses pedidos. Las particiones se leen
+con mmap: el sistema operativo carga y mantiene en caché solo las páginas
+consultadas, y los meses antiguos, que casi no cambian, no se reescriben.
+
+Una partición con muchas líneas obsoletas (cambios de estado, bajas) se
+compacta reescribiéndola solo con sus pedidos vigentes.
+"""
+import mmap
+import os
+import shutil
+import time
+from array import array
+from datetime import date, timedelta
+
+from analytics import EstadisticasVentas, diferencias
+from journal import JournalCorruptError, replay_journal
+from metrics import record_io
+from repository import Repository, read_json
+from serializers import dumps, loads
+
+EXTENSION = '.jsonl'
+# Partición de los pedidos sin una fecha de creación AAAA-MM-DD
+SIN_FECHA = 'sin-fecha'
+# Etiqueta de las métricas de E/S: una sola serie para todas las particiones
+ARCHIVO_METRICAS = 'orders'
+
+
+def particion_de(pedido):
+    """Mes AAAA-MM de la fecha de creación del pedido"""
+    fecha = str(pedido.get('fecha_creacion') or '')
+    if len(fecha) >= 7 and fecha[4] == '-' and fecha[:4].isdigit() and fecha[5:7].isdigit():
+        return fecha[:7]
+    return SIN_FECHA
+
+
+def en_fechas(pedido, desde, hasta):
+    """
+    La fecha de creación (AAAA-MM-DD) está en el rango inclusivo [desde,
+    hasta]. Un pedido sin fecha no está en ningún rango.
+    """
+    if desde is None and hasta is None:
+        return True
+    dia = str(pedido.get('fecha_creacion') or '')[:10]
+    return bool(dia) and (desde is None or dia >= desde) and (hasta is None or dia <= hasta)
+
+
+def dia_siguiente(dia):
+    return (date.fromisoformat(dia) + timedelta(days=1)).isoformat()
+
+
+def leer_legado(snapshot_path, journal_path):
+    """Pedidos del formato anterior: instantánea orders.json más su diario"""
+    por_id = {r['id']: r for r in read_json(snapshot_path)}
+    for entrada in replay_journal(journal_path):
+        if entrada['op'] == 'insert':
+            por_id[entrada['registro']['id']] = entrada['registro']
+        elif entrada['op'] == 'update' and entrada['id'] in por_id:
+            por_id[entrada['id']] = {**por_id[entrada['id']], **entrada['cambios']}
+        elif entrada['op'] == 'delete':
+            por_id.pop(entrada['id'], None)
+    return list(por_id.values())
+
+
+class Particion:
+    """Archivo de una partición, leído a través de mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mapa = None
+        # Bytes del archivo ya aplicados al índice
+        self.leido = 0
+        # Líneas del archivo y pedidos vigentes: su diferencia son líneas obsoletas
+        self.lineas = 0
+        self.vigentes = 0
+        # Ids mínimo y máximo guardados en la partición (cotas del rango de ids)
+        self.min_id = None
+        self.max_id = None
+
+    def _mapear(self, tamano):
+        """mmap de al menos `tamano` bytes (se rehace si el archivo creció)"""
+        if self._mapa is None or len(self._mapa) < tamano:
+            self.cerrar()
+            with open(self.path, 'rb') as f:
+                self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mapa
+
+    def linea(self, offset):
+        """Bytes de la línea completa que empieza en `offset`, con su salto de línea"""
+        mapa = self._mapear(offset + 1)
+        return mapa[offset:mapa.find(b'\n', offset) + 1]
+
+    def leer(self, offset):
+        return loads(self.linea(offset))
+
+    def recorrer(self):
+        """
+        (offset, entrada) de las líneas completas anexadas desde la última
+        lectura. Una línea final sin salto de línea (escritura en curso o
+        cortada por una caída) se deja para más adelante.
+        """
+        try:
+            tamano = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if tamano <= self.leido:
+            return
+        inicio = time.perf_counter()
+        # Se mapea el tamaño actual: un mapa más largo de lo que mide el
+        # archivo no debe leerse más allá de su final
+        if self._mapa is not None and len(self._mapa) != tamano:
+            self.cerrar()
+        mapa = self._mapear(tamano)
+        offset = self.leido
+        while True:
+            fin = mapa.find(b'\n', offset, tamano)
+            if fin < 0:
+                break
+            linea = mapa[offset:fin]
+            if linea.strip():
+                try:
+                    entrada = loads(linea)
+                except ValueError:
+                    raise JournalCorruptError(
+                        f"Entrada corrupta en {self.path} (byte {offset})") from None
+                yield offset, entrada
+            offset = fin + 1
+        record_io('read', ARCHIVO_METRICAS, time.perf_counter() - inicio,
+                  offset - self.leido)
+        self.leido = offset
+
+    def acotar(self, registro_id):
+        if self.min_id is None or registro_id < self.min_id:
+            self.min_id = registro_id
+        if self.max_id is None or registro_id > self.max_id:
+            self.max_id = registro_id
+
+    def cerrar(self):
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
+
+
+class PartitionedOrderRepository(Repository):
+    """
+    Pedidos en particiones mensuales con un índice id -> (partición, offset)
+    y estadísticas de ventas mantenidas en cada alta, cambio o baja,
+    incluidas las escrituras de otros procesos leídas de las particiones.
+
+    El índice usa dos arrays indexados por id (2 + 8 bytes por pedido),
+    pensados para los ids consecutivos que asigna create().
+    """
+
+    def __init__(self, directory, legado=None, compact_threshold=1000,
+                 fsync_policy='always', shared=False):
+        super().__init__(directory, shared=shared, fsync_policy=fsync_policy)
+        self.directory = directory
+        # (orders.json, orders.jsonl) del formato anterior, a importar la primera vez
+        self.legado = legado
+        self.compact_threshold = compact_threshold
+        self.estadisticas = EstadisticasVentas()
+        self._cargado = False
+        self._escritor = None
+        self._limpiar()
+
+    def _limpiar(self):
+        # Particiones por código (desde 1; 0 = sin partición) y código por nombre
+        self._particiones = {}
+        self._codigos = {}
+        self._codigo_de = array('H')
+        self._offset_de = array('Q')
+        self._cantidad = 0
+        self._max_id = 0
+
+    def _cargada(self):
+        return self._cargado
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directory, nombre + EXTENSION)
+
+    def _codigo(self, nombre):
+        codigo = self._codigos.get(nombre)
+        if codigo is None:
+            codigo = self._codigos[nombre] = len(self._codigos) + 1
+            self._particiones[codigo] = Particion(self._ruta(nombre))
+        return codigo
+
+    def _nombres_en_disco(self):
+        return sorted(n[:-len(EXTENSION)] for n in os.listdir(self.directory)
+                      if n.endswith(EXTENSION))
+
+    # ---- Índice ----
+
+    def _ubicar(self, registro_id, codigo, offset):
+        """Apunta el id a (codigo, offset); codigo 0 lo da de baja"""
+        if registro_id >= len(self._codigo_de):
+            faltan = registro_id + 1 - len(self._codigo_de)
+            self._codigo_de.frombytes(bytes(faltan * self._codigo_de.itemsize))
+            self._offset_de.frombytes(bytes(faltan * self._offset_de.itemsize))
+        anterior = self._codigo_de[registro_id]
+        if anterior:
+            self._particiones[anterior].vigentes -= 1
+            self._cantidad -= 1
+        if codigo:
+            particion = self._particiones[codigo]
+            particion.vigentes += 1
+            particion.acotar(registro_id)
+            self._cantidad += 1
+            self._max_id = max(self._max_id, registro_id)
+        self._codigo_de[registro_id] = codigo
+        self._offset_de[registro_id] = offset
+
+    def _ubicacion(self, registro_id):
+        if not isinstance(registro_id, int) or not 0 <= registro_id < len(self._codigo_de):
+            return 0
+        return self._codigo_de[registro_id]
+
+    def _aplicar_linea(self, codigo, offset, entrada):
+        self._particiones[codigo].lineas += 1
+        if entrada['op'] == 'upsert':
+            self._ubicar(entrada['registro']['id'], codigo, offset)
+        elif self._ubicacion(entrada['id']) == codigo:
+            self._ubicar(entrada['id'], 0, 0)
+
+    def _leer(self, registro_id):
+        codigo = self._ubicacion(registro_id)
+        if not codigo:
+            return None
+        return self._particiones[codigo].leer(self._offset_de[registro_id])['registro']
+
+    def _ids_vigentes(self, codigos=None, cursor=None):
+        """Ids vigentes mayores que `cursor` en orden, solo de `codigos` si se indica"""
+        if codigos is None:
+            rangos = [(1, len(self._codigo_de) - 1)]
+        else:
+            rangos = sorted((p.min_id, p.max_id) for c, p in self._particiones.items()
+                            if c in codigos and p.min_id is not None)
+        siguiente = cursor + 1 if cursor is not None else 1
+        for menor, mayor in rangos:
+            for registro_id in range(max(menor, siguiente), mayor + 1):
+                codigo = self._codigo_de[registro_id]
+                if codigo and (codigos is None or codigo in codigos):
+                    yield registro_id
+            siguiente = max(siguiente, mayor + 1)
+
+    def _codigos_en_fechas(self, desde, hasta):
+        """Particiones de los meses del rango, o None si no hay filtro de fecha"""
+        if desde is None and hasta is None:
+            return None
+        return {codigo for nombre, codigo in self._codigos.items()
+                if nombre != SIN_FECHA
+                and (desde is None or nombre >= desde[:7])
+                and (hasta is None or nombre <= hasta[:7])}
+
+    # ---- Carga y sincronización entre procesos ----
+
+    def _importar_legado(self):
+        """
+        Crea el directorio de particiones, con los pedidos del formato
+        anterior si existen. Se construye aparte y se renombra: si otro
+        proceso lo crea a la vez, queda el primero.
+        """
+        registros = leer_legado(*self.legado) if self.legado else []
+        temporal = f"{self.directory}.tmp-{os.getpid()}"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        self._escribir_particiones(temporal, registros)
+        try:
+            os.rename(temporal, self.directory)
+        except OSError:
+            shutil.rmtree(temporal, ignore_errors=True)
+            if not os.path.isdir(self.directory):
+                raise
+
+    def _escribir_particiones(self, directory, registros):
+        por_particion = {}
+        for registro in sorted(registros, key=lambda r: r['id']):
+            por_particion.setdefault(particion_de(registro), []).append(registro)
+        for nombre, pedidos in por_particion.items():
+            ruta = os.path.join(directory, nombre + EXTENSION)
+            with open(ruta, 'wb') as f:
+                for pedido in pedidos:
+                    f.write(dumps({"op": "upsert", "registro": pedido}) + b'\n')
+                if self.fsync_policy != 'never':
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def _load(self):
+        if self._file_lock is not None:
+            self._contadores = self._file_lock.read_counters()
+        self._cerrar_archivos()
+        self._limpiar()
+        if not os.path.isdir(self.directory):
+            self._importar_legado()
+        for nombre in self._nombres_en_disco():
+            codigo = self._codigo(nombre)
+            for offset, entrada in self._particiones[codigo].recorrer():
+                self._aplicar_linea(codigo, offset, entrada)
+        self.estadisticas.rebuild(map(self._leer, self._ids_vigentes()))
+        self._cargado = True
+
+    def _refrescar(self):
+        contadores = self._file_lock.read_counters()
+        if (contadores is None or self._contadores is None
+                or contadores[1] != self._contadores[1]):
+            # Otro proceso reescribió particiones: volver a leerlas
+            super()._refrescar()
+            return
+        for nombre in self._nombres_en_disco():
+            self._codigo(nombre)
+        for codigo, particion in list(self._particiones.items()):
+            for offset, entrada in list(particion.recorrer()):
+                registro_id = (entrada['registro']['id'] if entrada['op'] == 'upsert'
+                               else entrada['id'])
+                anterior = self._leer(registro_id)
+                self._aplicar_linea(codigo, offset, entrada)
+                self.estadisticas.actualizar(anterior, self._leer(registro_id))
+        self._contadores = contadores
+        self._bump_version()
+
+    def _persistir(self):
+        # Cada mutación ya se anexó a su partición
+        pass
+
+    # ---- Escritura ----
+
+    def _append(self, codigo, entrada):
+        """Anexa una entrada a la partición y retorna su offset"""
+        particion = self._particiones[codigo]
+        if self._escritor is None or self._escritor[0] != codigo:
+            self._cerrar_escritor()
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(particion.path, 'ab')
+            # Descarta una línea final cortada por una caída a mitad de escritura
+            if f.tell() > particion.leido:
+                f.truncate(particion.leido)
+            self._escritor = (codigo, f)
+        f = self._escritor[1]
+        inicio = time.perf_counter()
+        linea = dumps(entrada) + b'\n'
+        offset = particion.leido
+        f.write(linea)
+        f.flush()
+        if self.fsync_policy == 'always':
+            os.fsync(f.fileno())
+        record_io('append', ARCHIVO_METRICAS, time.perf_counter() - inicio, len(linea))
+        particion.leido = offset + len(linea)
+        if self._file_lock is not None:
+            self._avanzar_contadores()
+        return offset
+
+    def insert(self, registro):
+        with self._escritura():
+            anterior = self._leer(registro['id'])
+            # Un pedido se queda en la partición en que se creó
+            codigo = (self._codigo_de[registro['id']] if anterior is not None
+                      else self._codigo(particion_de(registro)))
+            offset = self._append(codigo, {"op": "upsert", "registro": registro})
+            self._aplicar_linea(codigo, offset, {"op": "upsert", "registro": registro})
+            self.estadisticas.actualizar(anterior, registro)
+            self._changed()
+            self._compactar_si_conviene(codigo)
+        return registro
+
+    def update(self, record_id, cambios):
+        with self._escritura():
+            actual = self._leer(record_id)
+            if actual is None:
+                return None
+            nuevo = {**actual, **cambios}
+            self.insert(nuevo)
+        return nuevo
+
+    def compare_and_swap(self, cambios):
+        with self._escritura():
+            if any(self._leer(esperado['id']) != esperado for esperado, _ in cambios):
+                return False
+            for _, nuevo in cambios:
+                self.insert(nuevo)
+        return True
+
+    def delete(self, record_id):
+        with self._escritura():
+            anterior = self._leer(record_id)
+            if anterior is None:
+                return False
+            codigo = self._codigo_de[record_id]
+            offset = self._append(codigo, {"op": "delete", "id": record_id})
+            self._aplicar_linea(codigo, offset, {"op": "delete", "id": record_id})
+            self.estadisticas.remove(anterior)
+            self._changed()
+            self._compactar_si_conviene(codigo)
+        return True
+
+    def reset(self, registros):
+        with self._escritura():
+            self._cerrar_archivos()
+            os.makedirs(self.directory, exist_ok=True)
+            for nombre in self._nombres_en_disco():
+                os.remove(self._ruta(nombre))
+            self._escribir_particiones(self.directory, registros)
+            if self._file_lock is not None:
+                self._avanzar_contadores(nueva_epoca=True)
+            self._load()
+            self._changed()
+
+    def _compactar_si_conviene(self, codigo):
+        particion = self._particiones[codigo]
+        obsoletas = particion.lineas - particion.vigentes
+        if obsoletas >= self.compact_threshold and obsoletas > particion.vigentes:
+            self.compactar(codigo)
+
+    def compactar(self, codigo):
+        """Reescribe la partición solo con sus pedidos vigentes"""
+        with self._escritura():
+            particion = self._particiones[codigo]
+            if self._escritor is not None and self._escritor[0] == codigo:
+                self._cerrar_escritor()
+            inicio = time.perf_counter()
+            temporal = f"{particion.path}.tmp"
+            offsets = {}
+            with open(temporal, 'wb') as f:
+                for registro_id in self._ids_vigentes({codigo}):
+                    offsets[registro_id] = f.tell()
+                    # Las líneas se copian tal cual, sin volver a serializarlas
+                    f.write(particion.linea(self._offset_de[registro_id]))
+                tamano = f.tell()
+                if self.fsync_policy != 'never':
+                    f.flush()
+                    os.fsync(f.fileno())
+            particion.cerrar()
+            os.replace(temporal, particion.path)
+            record_io('write', ARCHIVO_METRICAS, time.perf_counter() - inicio, tamano)
+            for registro_id, offset in offsets.items():
+                self._offset_de[registro_id] = offset
+            particion.leido = tamano
+            particion.lineas = particion.vigentes = len(offsets)
+            if self._file_lock is not None:
+                self._avanzar_contadores(nueva_epoca=True)
+
+    def _cerrar_escritor(self):
+        if self._escritor is not None:
+            self._escritor[1].close()
+            self._escritor = None
+
+    def _cerrar_archivos(self):
+        self._cerrar_escritor()
+        for particion in self._particiones.values():
+            particion.cerrar()
+
+    def close(self):
+        with self._lock:
+            self._cerrar_archivos()
+
+    # ---- Lectura ----
+
+    def all(self):
+        return list(self.iter_all())
+
+    def snapshot(self):
+        return self.all()
+
+    def get(self, record_id):
+        self._ensure_loaded()
+        with self._lock:
+            return self._leer(record_id)
+
+    def get_many(self, ids):
+        self._ensure_loaded()
+        with self._lock:
+            return [r for r in map(self._leer, ids) if r is not None]
+
+    def find_one(self, campo, valor):
+        return next((r for r in self.iter_all() if r.get(campo) == valor), None)
+
+    def count(self):
+        self._ensure_loaded()
+        return self._cantidad
+
+    def filtrar(self, desde=None, hasta=None, cursor=None, limit=None):
+        """
+        Pedidos creados en el rango inclusivo [desde, hasta] (AAAA-MM-DD),
+        ordenados por id y paginados. Solo se leen las particiones de esos meses.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            pedidos = []
+            for registro_id in self._ids_vigentes(self._codigos_en_fechas(desde, hasta), cursor):
+                pedido = self._leer(registro_id)
+                if en_fechas(pedido, desde, hasta):
+                    pedidos.append(pedido)
+                    if limit is not None and len(pedidos) >= limit:
+                        break
+            return pedidos
+
+    def page(self, cursor=None, limit=None):
+        return self.filtrar(cursor=cursor, limit=limit)
+
+    def iter_filtrar(self, desde=None, hasta=None, chunk=500):
+        """Recorre los pedidos del rango de fechas en bloques de tamaño fijo"""
+        cursor = None
+        while True:
+            bloque = self.filtrar(desde, hasta, cursor, chunk)
+            yield from bloque
+            if len(bloque) < chunk:
+                return
+            cursor = bloque[-1]['id']
+
+    # ---- Estadísticas ----
+
+    def _consultar(self, consulta, *args):
+        self._ensure_loaded()
+        with self._lock:
+            return consulta(*args)
+
+    def resumen_ventas(self):
+        """Totales de ventas y pedidos por estado"""
+        return self._consultar(self.estadisticas.resumen)
+
+    def ventas_por_dia(self, desde=None, hasta=None):
+        """Totales por día en el rango inclusivo [desde, hasta] (AAAA-MM-DD)"""
+        return self._consultar(self.estadisticas.por_dia, desde, hasta)
+
+    def ventas_por_producto(self):
+        return self._consultar(self.estadisticas.por_producto)
+
+    def ventas_por_categoria(self):
+        return self._consultar(self.estadisticas.por_categoria)
+
+    def top_productos(self, n=10, por='unidades'):
+        """Los n productos más vendidos por unidades o por ingresos"""
+        return self._consultar(self.estadisticas.top, n, por)
+
+    def reconstruir_estadisticas(self):
+        """
+        Recalcula las estadísticas desde los pedidos guardados. Retorna las
+        secciones en que los agregados incrementales no coincidían.
+        """
+        with self._escritura():
+            antes = self.estadisticas.exportar()
+            self.estadisticas.rebuild(map(self._leer, self._ids_vigentes()))
+            return diferencias(antes, self.estadisticas.exportar())
@@ -0,0 +1,79 @@
+"""
+Hash de contraseñas con sal (PBKDF2-HMAC-SHA256)
+
+El cálculo del hash es deliberadamente costoso, así que se ejecuta en un
+grupo acotado de hilos: como mucho `max_workers` hashes a la vez y
+`max_pending` en espera. Si la cola está llena se rechaza la petición en
+lugar de acaparar los hilos del servidor.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ALGORITMO = 'pbkdf2_sha256'
+
+
+class HasherSaturado(Exception):
+    """No hay capacidad en el grupo de hilos de hash"""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_password(password, iterations):
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f"{ALGORITMO}${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password, stored, iterations):
+    """
+    Retorna (valida, necesita_rehash). Las contraseñas guardadas en texto
+    plano por versiones anteriores se aceptan y se marcan para rehash.
+    """
+    partes = stored.split('$')
+    if len(partes) != 4 or partes[0] != ALGORITMO:
+        valida = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+        return valida, valida
+
+    _, iteraciones, salt, digest = partes
+    calculado = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                                    base64.b64decode(salt), int(iteraciones))
+    valida = hmac.compare_digest(calculado, base64.b64decode(digest))
+    return valida, valida and int(iteraciones) != iterations
+
+
+class PasswordHasher:
+    """Hash y verificación de contraseñas en un grupo acotado de hilos"""
+
+    def __init__(self, iterations=200_000, max_workers=2, max_pending=32, timeout=10.0):
+        self.iterations = iterations
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='password-hash')
+        self._cupos = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _run(self, fn, *args):
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise HasherSaturado("Demasiadas operaciones de contraseña en curso")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._cupos.release()
+            raise
+        # El cupo se libera cuando el hash termina, aunque el llamador deje de esperar
+        future.add_done_callback(lambda _: self._cupos.release())
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.iterations)
+
+    def verify(self, password, stored):
+        return self._run(verify_password, password, stored, self.iterations)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,624 @@
+"""
+Capa de repositorios en memoria con persistencia diferida (write-behind)
+
+Cada colección (productos, pedidos, usuarios) se carga una sola vez desde
+su archivo JSON y las lecturas se sirven desde memoria. Las mutaciones
+marcan la colección como pendiente y un hilo escritor en segundo plano
+la vuelca a disco por lotes.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from itertools import islice
+
+from config import JSON_INDENT
+from facets import BUCKETS_DEFECTO, ColumnasProductos
+from indexes import ProductIndex, normalizar_categoria
+from locks import FileLock
+from metrics import record_io
+from search import SearchIndex, texto_cambio
+from serializers import dump, loads
+
+FSYNC_POLICIES = ('always', 'shutdown', 'never')
+
+log = logging.getLogger('tienda.repositorio')
+
+
+def read_json(file_path):
+    """Lee un archivo JSON y retorna los datos"""
+    nombre = os.path.basename(file_path)
+    inicio = time.perf_counter()
+    try:
+        with open(file_path, 'rb') as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        return []
+    leido = time.perf_counter()
+    record_io('read', nombre, leido - inicio, len(contenido))
+    datos = loads(contenido)
+    record_io('parse', nombre, time.perf_counter() - leido, len(contenido))
+    return datos
+
+
+def write_json(file_path, data, fsync=False, indent=JSON_INDENT):
+    """Escribe datos en un archivo JSON de forma atómica (compacto por defecto)"""
+    tmp_path = f"{file_path}.tmp"
+    inicio = time.perf_counter()
+    with open(tmp_path, 'wb') as f:
+        nbytes = dump(data, f, indent)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    # Serialización y escritura van intercaladas en json.dump: se miden juntas
+    record_io('write', os.path.basename(file_path), time.perf_counter() - inicio, nbytes)
+
+
+class Repository:
+    """
+    Colección de registros con id, indexada por id y servida desde memoria.
+
+    Con shared=True la colección puede usarse desde varios procesos: cada
+    mutación toma un bloqueo de archivo exclusivo, recarga los datos si
+    otro proceso los cambió y escribe a disco antes de soltarlo (sin
+    escritor diferido), y las lecturas recargan si el archivo cambió.
+    """
+
+    def __init__(self, file_path, writer=None, shared=False, fsync_policy='always'):
+        self.file_path = file_path
+        self._writer = writer
+        self.fsync_policy = fsync_policy
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{file_path}.lock") if shared else None
+        # Contadores del archivo de bloqueo en la última carga o escritura
+        self._contadores = None
+        self._by_id = None
+        self._ids = []
+        self._max_id = 0
+        # Versión de la colección: aumenta con cada mutación
+        self._version = 0
+        self.last_modified = time.time()
+        self._batch_depth = 0
+        self._batch_dirty = False
+
+    def _cargada(self):
+        """La colección ya se leyó del disco"""
+        return self._by_id is not None
+
+    def _ensure_loaded(self):
+        if not self._cargada():
+            with self._lock:
+                if not self._cargada():
+                    if self._file_lock is None:
+                        self._load()
+                    else:
+                        with self._file_lock.shared():
+                            self._load()
+        elif self._file_lock is not None and self._desactualizado():
+            with self._lock, self._file_lock.shared():
+                if self._desactualizado():
+                    self._refrescar()
+
+    @contextmanager
+    def _escritura(self):
+        """
+        Sección de mutación. En modo compartido se ejecuta con el bloqueo
+        exclusivo entre procesos y sobre los datos más recientes del disco.
+        """
+        with self._lock:
+            if self._file_lock is None:
+                self._ensure_loaded()
+                yield
+                return
+            with self._file_lock:
+                if not self._cargada():
+                    self._load()
+                elif self._desactualizado():
+                    self._refrescar()
+                yield
+
+    def _desactualizado(self):
+        """Otro proceso escribió la colección desde la última carga"""
+        return self._file_lock.read_counters() != self._contadores
+
+    def _refrescar(self):
+        self._load()
+        self._bump_version()
+
+    def _load(self):
+        if self._file_lock is not None:
+            self._contadores = self._file_lock.read_counters()
+        self._set_records(read_json(self.file_path))
+
+    def _avanzar_contadores(self, nueva_epoca=False):
+        """Anuncia una escritura a los demás procesos (con el bloqueo exclusivo)"""
+        generacion, epoca = self._file_lock.read_counters() or (0, 0)
+        self._contadores = (generacion + 1, epoca + 1 if nueva_epoca else epoca)
+        self._file_lock.write_counters(*self._contadores)
+
+    def _persistir(self):
+        """Escritura síncrona del modo compartido, con el bloqueo exclusivo tomado"""
+        write_json(self.file_path, self.snapshot(), fsync=self.fsync_policy == 'always')
+        self._avanzar_contadores(nueva_epoca=True)
+
+    def _set_records(self, registros):
+        self._by_id = {r['id']: r for r in registros}
+        self._ids = sorted(self._by_id)
+        self._max_id = self._ids[-1] if self._ids else 0
+
+    def reload(self):
+        """Descarta el contenido en memoria y vuelve a leer el archivo"""
+        with self._lock:
+            self._refrescar()
+
+    @property
+    def version(self):
+        # En modo compartido, una escritura de otro proceso también cuenta
+        if self._file_lock is not None:
+            self._ensure_loaded()
+        return self._version
+
+    def _bump_version(self):
+        self._version += 1
+        self.last_modified = time.time()
+
+    def _changed(self):
+        self._bump_version()
+        if self._batch_depth:
+            self._batch_dirty = True
+        else:
+            self._guardar()
+
+    def _guardar(self):
+        if self._writer is not None:
+            self._writer.schedule(self)
+        elif self._file_lock is not None:
+            self._persistir()
+
+    @contextmanager
+    def batch(self):
+        """Agrupa varias mutaciones en una sola escritura a disco"""
+        with self._escritura():
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._batch_dirty:
+                    self._batch_dirty = False
+                    self._guardar()
+
+    def all(self):
+        """Lista de todos los registros en orden de inserción"""
+        self._ensure_loaded()
+        return list(self._by_id.values())
+
+    def get(self, record_id):
+        self._ensure_loaded()
+        return self._by_id.get(record_id)
+
+    def get_many(self, ids):
+        """Registros existentes de la lista de ids, en el mismo orden"""
+        self._ensure_loaded()
+        return [r for r in map(self._by_id.get, ids) if r is not None]
+
+    def find_one(self, campo, valor):
+        """Primer registro cuyo campo tiene el valor dado, o None"""
+        self._ensure_loaded()
+        return next((r for r in self._by_id.values() if r.get(campo) == valor), None)
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self._by_id)
+
+    def page(self, cursor=None, limit=None):
+        """Registros con id mayor que `cursor`, ordenados por id"""
+        self._ensure_loaded()
+        with self._lock:
+            inicio = bisect_right(self._ids, cursor) if cursor is not None else 0
+            fin = inicio + limit if limit is not None else len(self._ids)
+            return [self._by_id[i] for i in self._ids[inicio:fin]]
+
+    def iter_all(self, chunk=500):
+        """Recorre todos los registros por id en bloques de tamaño fijo"""
+        cursor = None
+        while True:
+            bloque = self.page(cursor, chunk)
+            yield from bloque
+            if len(bloque) < chunk:
+                return
+            cursor = bloque[-1]['id']
+
+    def create(self, data):
+        """Asigna un nuevo id de forma atómica y guarda el registro"""
+        with self._escritura():
+            registro = {"id": self._max_id + 1, **data}
+            return self.insert(registro)
+
+    def insert(self, registro):
+        """Guarda un registro que ya trae su id"""
+        with self._escritura():
+            if registro['id'] not in self._by_id:
+                insort(self._ids, registro['id'])
+            self._by_id[registro['id']] = registro
+            self._max_id = max(self._max_id, registro['id'])
+            self._changed()
+        return registro
+
+    def update(self, record_id, cambios):
+        """
+        Aplica cambios sobre un registro y retorna la nueva versión,
+        o None si no existe. Los registros nunca se modifican en sitio.
+        """
+        with self._escritura():
+            actual = self._by_id.get(record_id)
+            if actual is None:
+                return None
+            nuevo = {**actual, **cambios}
+            self._by_id[record_id] = nuevo
+            self._changed()
+        return nuevo
+
+    def compare_and_swap(self, cambios):
+        """
+        Aplica los pares (esperado, nuevo) solo si cada registro sigue
+        siendo exactamente `esperado`. Como los registros nunca se
+        modifican en sitio, basta con comparar identidades.
+        """
+        with self._escritura():
+            if any(self._by_id.get(esperado['id']) is not esperado
+                   for esperado, _ in cambios):
+                return False
+            with self.batch():
+                for _, nuevo in cambios:
+                    self.insert(nuevo)
+        return True
+
+    def delete(self, record_id):
+        """Elimina un registro; retorna False si no existía"""
+        with self._escritura():
+            if self._by_id.pop(record_id, None) is None:
+                return False
+            del self._ids[bisect_left(self._ids, record_id)]
+            self._changed()
+        return True
+
+    def reset(self, registros):
+        """Reemplaza todo el contenido de la colección"""
+        with self._escritura():
+            self._set_records(registros)
+            self._changed()
+
+    def snapshot(self):
+        """Copia de la lista de registros para volcar a disco"""
+        with self._lock:
+            return list(self._by_id.values())
+
+    def close(self):
+        pass
+
+
+class ProductRepository(Repository):
+    """
+    Repositorio de productos con índices secundarios por categoría y
+    precio, un índice de texto sobre nombre y descripción y columnas
+    numéricas para las facetas, mantenidos en cada alta, cambio o baja.
+    Con `cambios` (un ChangeLog), cada mutación se anota además en el
+    registro de cambios del catálogo.
+
+    Las claves de los índices se calculan antes de modificar la colección:
+    un producto que no se puede indexar se rechaza con ValueError sin dejar
+    los datos y los índices desalineados.
+    """
+
+    def __init__(self, file_path, writer=None, shared=False, fsync_policy='always',
+                 cambios=None):
+        super().__init__(file_path, writer, shared, fsync_policy)
+        self.index = ProductIndex()
+        self.busqueda = SearchIndex()
+        self.columnas = ColumnasProductos()
+        self.cambios = cambios
+        # Ids cargados del archivo que no se pudieron indexar por categoría
+        self._no_indexados = set()
+
+    @staticmethod
+    def _validar(producto):
+        """Comprueba que el producto se puede indexar; lanza ValueError si no"""
+        normalizar_categoria(producto.get('categoria'))
+
+    def _load(self):
+        super()._load()
+        self._reindex()
+
+    def _reindex(self):
+        # Un archivo editado a mano puede traer productos sin categoría válida:
+        # se cargan igual, pero quedan fuera de los índices de categoría y
+        # precio y de las facetas hasta que se corrijan
+        self._no_indexados = set()
+        indexables = []
+        for producto in self._by_id.values():
+            try:
+                self._validar(producto)
+            except ValueError as e:
+                log.warning("Producto %s sin indexar: %s", producto['id'], e)
+                self._no_indexados.add(producto['id'])
+            else:
+                indexables.append(producto)
+        self.index.clear()
+        for producto in indexables:
+            self.index.add(producto)
+        self.busqueda.rebuild(self._by_id.values())
+        self.columnas.rebuild(indexables)
+
+    def _indexado(self, producto):
+        return producto is not None and producto['id'] not in self._no_indexados
+
+    def insert(self, registro):
+        self._validar(registro)
+        with self._escritura():
+            anterior = self._by_id.get(registro['id'])
+            # Las reservas de stock reemplazan el registro sin tocar el texto
+            texto = anterior is None or texto_cambio(anterior, registro)
+            if anterior is not None and texto:
+                self.busqueda.remove(anterior)
+            super().insert(registro)
+            self._indexar(anterior, registro)
+            if texto:
+                self.busqueda.add(registro)
+            # Dentro de la sección de escritura: el orden de las secuencias
+            # es el orden real de las mutaciones, también entre procesos
+            if self.cambios is not None:
+                self.cambios.registrar('upsert', registro['id'], registro)
+        return registro
+
+    def update(self, record_id, cambios):
+        with self._escritura():
+            anterior = self._by_id.get(record_id)
+            if anterior is None:
+                return None
+            self._validar({**anterior, **cambios})
+            nuevo = super().update(record_id, cambios)
+            self._indexar(anterior, nuevo)
+            if texto_cambio(anterior, nuevo):
+                self.busqueda.remove(anterior)
+                self.busqueda.add(nuevo)
+            if self.cambios is not None:
+                self.cambios.registrar('upsert', record_id, nuevo)
+        return nuevo
+
+    def _indexar(self, anterior, nuevo):
+        """Actualiza los índices de categoría y precio y las facetas con `nuevo` ya validado"""
+        if self._indexado(anterior):
+            self.index.update(anterior, nuevo)
+        else:
+            self.index.add(nuevo)
+            self._no_indexados.discard(nuevo['id'])
+        self.columnas.put(nuevo)
+
+    def delete(self, record_id):
+        with self._escritura():
+            anterior = self._by_id.get(record_id)
+            indexado = self._indexado(anterior)
+            if not super().delete(record_id):
+                return False
+            if indexado:
+                self.index.remove(anterior)
+                self.columnas.remove(record_id)
+            self._no_indexados.discard(record_id)
+            self.busqueda.remove(anterior)
+            if self.cambios is not None:
+                self.cambios.registrar('delete', record_id)
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Lote de mutaciones; las entradas del registro de cambios también se anexan juntas"""
+        with super().batch():
+            if self.cambios is None:
+                yield self
+                return
+            with self.cambios.batch():
+                yield self
+
+    def reset(self, registros):
+        with self._escritura():
+            super().reset(registros)
+            self._reindex()
+            if self.cambios is not None:
+                self.cambios.reiniciar()
+
+    def cambios_desde(self, since, limit):
+        """Cambios del catálogo posteriores a la secuencia `since` (ver ChangeLog.desde)"""
+        return self.cambios.desde(since, limit)
+
+    def filtrar(self, categoria=None, min_precio=None, max_precio=None,
+                cursor=None, limit=None):
+        """Productos que cumplen los filtros, ordenados por id y paginados"""
+        self._ensure_loaded()
+        with self._lock:
+            ids = self.index.query(categoria, min_precio, max_precio)
+            if ids is None:
+                return self.page(cursor, limit)
+            inicio = bisect_right(ids, cursor) if cursor is not None else 0
+            fin = inicio + limit if limit is not None else len(ids)
+            return [self._by_id[i] for i in ids[inicio:fin]]
+
+    def ordenar(self, campo, descendente=False, categoria=None, min_precio=None,
+                max_precio=None, limit=None):
+        """
+        Productos filtrados ordenados por precio, rating o stock (empates
+        por id; los que no tienen el campo, al final), hasta `limit`
+        """
+        self._ensure_loaded()
+        with self._lock:
+            ids = self.index.ordenados(campo, descendente, categoria, min_precio, max_precio)
+            return [self._by_id[i] for i in islice(ids, limit)]
+
+    def facetas(self, categoria=None, min_precio=None, max_precio=None,
+                buckets=BUCKETS_DEFECTO):
+        """Conteos por categoría, histogramas de precio y rating y disponibilidad"""
+        self._ensure_loaded()
+        with self._lock:
+            return self.columnas.facetas(categoria, min_precio, max_precio, buckets)
+
+    def buscar(self, q, limit=20, prefijo=True):
+        """
+        Productos que contienen todos los términos de `q`, ordenados por
+        relevancia. Retorna ([(producto, relevancia)], total de coincidencias).
+        """
+        self._ensure_loaded()
+        with self._lock:
+            mejores, total = self.busqueda.search(q, limit, prefijo)
+            return [(self._by_id[pid], puntos) for pid, puntos in mejores], total
+
+    def iter_filtrar(self, categoria=None, min_precio=None, max_precio=None, chunk=500):
+        """Recorre los productos filtrados sin copiar los registros de antemano"""
+        self._ensure_loaded()
+        with self._lock:
+            ids = self.index.query(categoria, min_precio, max_precio)
+        if ids is None:
+            yield from self.iter_all(chunk)
+            return
+        for inicio in range(0, len(ids), chunk):
+            with self._lock:
+                bloque = [self._by_id.get(i) for i in ids[inicio:inicio + chunk]]
+            yield from (p for p in bloque if p is not None)
+
+
+class UserRepository(Repository):
+    """Repositorio de usuarios con índice único por email"""
+
+    def __init__(self, file_path, writer=None, shared=False, fsync_policy='always'):
+        super().__init__(file_path, writer, shared, fsync_policy)
+        self._por_email = {}
+
+    def _set_records(self, registros):
+        super()._set_records(registros)
+        self._por_email = {u['email']: u['id'] for u in self._by_id.values()}
+
+    def find_one(self, campo, valor):
+        if campo != 'email':
+            return super().find_one(campo, valor)
+        self._ensure_loaded()
+        with self._lock:
+            usuario_id = self._por_email.get(valor)
+            return self._by_id.get(usuario_id) if usuario_id is not None else None
+
+    def create_unique(self, data):
+        """Crea el usuario solo si su email no está registrado; si no, retorna None"""
+        with self._escritura():
+            if data['email'] in self._por_email:
+                return None
+            return self.create(data)
+
+    def insert(self, registro):
+        with self._escritura():
+            anterior = self._by_id.get(registro['id'])
+            if anterior is not None:
+                self._por_email.pop(anterior['email'], None)
+            super().insert(registro)
+            self._por_email[registro['email']] = registro['id']
+        return registro
+
+    def update(self, record_id, cambios):
+        with self._escritura():
+            anterior = self._by_id.get(record_id)
+            nuevo = super().update(record_id, cambios)
+            if nuevo is not None:
+                self._por_email.pop(anterior['email'], None)
+                self._por_email[nuevo['email']] = record_id
+        return nuevo
+
+    def delete(self, record_id):
+        with self._escritura():
+            anterior = self._by_id.get(record_id)
+            if not super().delete(record_id):
+                return False
+            self._por_email.pop(anterior['email'], None)
+        return True
+
+
+class WriteBehindWriter:
+    """
+    Hilo escritor que vuelca a disco los repositorios modificados.
+    Escribe cada `interval` segundos o en cuanto se acumulan `max_batch`
+    mutaciones pendientes.
+    """
+
+    def __init__(self, interval=0.5, max_batch=100, fsync_policy='always'):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync inválida: {fsync_policy}")
+        self.interval = interval
+        self.max_batch = max_batch
+        self.fsync_policy = fsync_policy
+        self._dirty = set()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run,
+                                                name='write-behind', daemon=True)
+                self._thread.start()
+
+    def schedule(self, repo):
+        """Marca un repositorio como pendiente de escritura"""
+        with self._lock:
+            self._dirty.add(repo)
+            self._pending += 1
+            if self._pending >= self.max_batch:
+                self._wakeup.set()
+        if self._thread is None:
+            self.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Los repositorios sin escribir siguen pendientes: se reintenta
+                # en el siguiente ciclo sin detener el hilo
+                log.exception("Error en la escritura diferida")
+
+    def flush(self, fsync=None):
+        """
+        Escribe ahora todos los repositorios pendientes. Si alguno falla
+        (disco lleno, permisos), se intentan los demás, los fallidos vuelven
+        a quedar pendientes y se relanza el primer error.
+        """
+        if fsync is None:
+            fsync = self.fsync_policy == 'always'
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                self._pending = 0
+            fallidos = []
+            error = None
+            for repo in dirty:
+                try:
+                    write_json(repo.file_path, repo.snapshot(), fsync=fsync)
+                except Exception as e:
+                    fallidos.append(repo)
+                    error = error or e
+            if fallidos:
+                with self._lock:
+                    self._dirty.update(fallidos)
+                raise error
+
+    def close(self):
+        """Detiene el hilo escritor y vuelca las escrituras pendientes"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush(fsync=self.fsync_policy != 'never')
@@ -0,0 +1,109 @@
+"""
+Utilidades de respuesta compartidas por los endpoints de lectura:
+paginación por cursor, proyección de campos (?fields=) y respuestas
+JSON en streaming
+"""
+from flask import Response, request, stream_with_context
+
+from serializers import dumps_str
+
+# Tamaño de bloque al recorrer una colección para streaming
+STREAM_CHUNK = 500
+# Bytes acumulados antes de enviar un fragmento al cliente
+STREAM_BUFFER = 64 * 1024
+
+
+def leer_paginacion():
+    """
+    Lee `limit` y `cursor` del query string. El cursor es el id del último
+    registro recibido; la página siguiente empieza en el id posterior.
+    Lanza ValueError si los valores no son válidos.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    limit = int(limit) if limit not in (None, '') else None
+    cursor = int(cursor) if cursor not in (None, '') else None
+    if limit is not None and limit <= 0:
+        raise ValueError("limit debe ser un entero positivo")
+    return cursor, limit
+
+
+def cortar_pagina(registros, limit):
+    """
+    Recibe hasta limit + 1 registros y retorna la página junto con el
+    next_cursor (None si no hay más registros)
+    """
+    if limit is None or len(registros) <= limit:
+        return registros, None
+    pagina = registros[:limit]
+    return pagina, pagina[-1]['id']
+
+
+def leer_campos():
+    """
+    Lee `fields` del query string: campos separados por comas, con puntos
+    para los anidados (ej. id,nombre,items.nombre). Retorna el árbol de
+    campos {campo: subárbol o None para el valor completo}, o None si no
+    se pidió proyección. Lanza ValueError si la lista no es válida.
+    """
+    valor = request.args.get('fields')
+    if valor is None:
+        return None
+    arbol = {}
+    for ruta in valor.split(','):
+        partes = ruta.strip().split('.')
+        if not all(partes):
+            raise ValueError(f"Campo inválido en fields: {ruta!r}")
+        nodo = arbol
+        for parte in partes[:-1]:
+            hijo = nodo.get(parte, {})
+            if hijo is None:
+                # Ya se pidió el valor completo de este campo
+                break
+            nodo = nodo.setdefault(parte, hijo)
+        else:
+            nodo[partes[-1]] = None
+    return arbol
+
+
+def proyectar(valor, arbol):
+    """
+    Copia de `valor` con solo los campos de `arbol`. En las listas se
+    proyecta cada elemento, así items.nombre toma el nombre de cada item.
+    Los campos que no existen se omiten.
+    """
+    if arbol is None:
+        return valor
+    if isinstance(valor, dict):
+        return {campo: proyectar(valor[campo], sub)
+                for campo, sub in arbol.items() if campo in valor}
+    if isinstance(valor, list):
+        return [proyectar(elemento, arbol) for elemento in valor]
+    return valor
+
+
+def quiere_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def stream_json_array(clave, registros):
+    """
+    Respuesta que genera {"success": true, "<clave>": [...], "count": N}
+    de forma incremental a partir de un iterable de registros
+    """
+    def generar():
+        buffer = [f'{{"success": true, "{clave}": [']
+        tamano = 0
+        count = 0
+        for registro in registros:
+            parte = dumps_str(registro)
+            buffer.append(',' + parte if count else parte)
+            tamano += len(parte)
+            count += 1
+            if tamano >= STREAM_BUFFER:
+                yield ''.join(buffer)
+                buffer, tamano = [], 0
+        buffer.append(f'], "count": {count}}}')
+        yield ''.join(buffer)
+
+    return Response(stream_with_context(generar()), mimetype='application/json')
@@ -0,0 +1,190 @@
+"""
+Búsqueda de texto completo sobre nombre y descripción de los productos
+
+Índice invertido en memoria: cada término apunta a los productos que lo
+contienen con un peso (las apariciones en el nombre valen más que en la
+descripción). Los textos se normalizan sin tildes ni mayúsculas, así
+"cancelación" y "CANCELACION" producen el mismo término. El índice se
+actualiza de forma incremental en cada alta, cambio o baja.
+"""
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+PESO_NOMBRE = 3
+PESO_DESCRIPCION = 1
+# Máximo de términos del vocabulario en que se expande un prefijo
+MAX_EXPANSION_PREFIJO = 200
+# Términos nuevos acumulados antes de fusionarlos con el vocabulario ordenado
+MAX_VOCABULARIO_PENDIENTE = 1024
+
+STOPWORDS = frozenset("""
+a al con de del el en es la las lo los o para por que se sin su sus un una
+unos unas y
+""".split())
+
+_TOKEN = re.compile(r'\w+')
+
+
+def normalizar(texto):
+    """Minúsculas y sin diacríticos: 'Cancelación' -> 'cancelacion'"""
+    descompuesto = unicodedata.normalize('NFKD', texto.casefold())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    """Términos normalizados de un texto, sin palabras vacías"""
+    if not texto:
+        return []
+    return [t for t in _TOKEN.findall(normalizar(str(texto))) if t not in STOPWORDS]
+
+
+def terminos_consulta(q):
+    """
+    Términos de una consulta. El último término se conserva aunque sea
+    una palabra vacía, porque puede ser el prefijo de una palabra a medias.
+    """
+    tokens = _TOKEN.findall(normalizar(q))
+    if not tokens:
+        return []
+    return [t for t in tokens[:-1] if t not in STOPWORDS] + tokens[-1:]
+
+
+def _pesos(producto):
+    pesos = {}
+    for termino in tokenizar(producto.get('nombre')):
+        pesos[termino] = pesos.get(termino, 0) + PESO_NOMBRE
+    for termino in tokenizar(producto.get('descripcion')):
+        pesos[termino] = pesos.get(termino, 0) + PESO_DESCRIPCION
+    return pesos
+
+
+def texto_cambio(anterior, nuevo):
+    return (anterior.get('nombre') != nuevo.get('nombre') or
+            anterior.get('descripcion') != nuevo.get('descripcion'))
+
+
+class SearchIndex:
+    """Índice invertido término -> {id de producto: peso}"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._postings = {}
+        # Vocabulario ordenado para expandir prefijos con búsqueda binaria.
+        # Los términos nuevos van a una lista pequeña que se fusiona por
+        # tandas, para no desplazar todo el vocabulario en cada alta; los
+        # términos eliminados se descartan al expandir y al fusionar.
+        self._vocabulario = []
+        self._pendientes = []
+        self._documentos = 0
+
+    def rebuild(self, productos):
+        """Reconstruye el índice completo ordenando el vocabulario una sola vez"""
+        self.clear()
+        for producto in productos:
+            for termino, peso in _pesos(producto).items():
+                self._postings.setdefault(termino, {})[producto['id']] = peso
+            self._documentos += 1
+        self._vocabulario = sorted(self._postings)
+
+    def add(self, producto):
+        for termino, peso in _pesos(producto).items():
+            posting = self._postings.get(termino)
+            if posting is None:
+                posting = self._postings[termino] = {}
+                insort(self._pendientes, termino)
+            posting[producto['id']] = peso
+        self._documentos += 1
+        if len(self._pendientes) > MAX_VOCABULARIO_PENDIENTE:
+            self._fusionar_vocabulario()
+
+    def remove(self, producto):
+        for termino in _pesos(producto):
+            posting = self._postings.get(termino)
+            if posting is None:
+                continue
+            posting.pop(producto['id'], None)
+            if not posting:
+                del self._postings[termino]
+        self._documentos -= 1
+
+    def _fusionar_vocabulario(self):
+        vigentes = (t for t in heapq.merge(self._vocabulario, self._pendientes)
+                    if t in self._postings)
+        vocabulario = []
+        for termino in vigentes:
+            # Un término borrado y vuelto a añadir puede estar en ambas listas
+            if not vocabulario or vocabulario[-1] != termino:
+                vocabulario.append(termino)
+        self._vocabulario = vocabulario
+        self._pendientes = []
+
+    def _idf(self, posting):
+        return math.log(1 + (self._documentos - len(posting) + 0.5) / (len(posting) + 0.5))
+
+    def _expandir(self, prefijo):
+        terminos = set()
+        for vocabulario in (self._vocabulario, self._pendientes):
+            i = bisect_left(vocabulario, prefijo)
+            encontrados = 0
+            while (i < len(vocabulario) and encontrados < MAX_EXPANSION_PREFIJO
+                   and vocabulario[i].startswith(prefijo)):
+                if vocabulario[i] in self._postings:
+                    terminos.add(vocabulario[i])
+                    encontrados += 1
+                i += 1
+        return sorted(terminos)[:MAX_EXPANSION_PREFIJO]
+
+    def search(self, q, limit=20, prefijo=True):
+        """
+        Retorna [(id, relevancia)] de los productos que contienen todos los
+        términos de la consulta, de mayor a menor relevancia. Con prefijo,
+        el último término también coincide con las palabras que empiezan por él.
+        """
+        terminos = terminos_consulta(q)
+        if not terminos:
+            return [], 0
+
+        # Cada término se resuelve como una lista de (posting, idf)
+        grupos = []
+        for n, termino in enumerate(terminos):
+            if prefijo and n == len(terminos) - 1:
+                expansion = self._expandir(termino)
+            else:
+                expansion = [termino] if termino in self._postings else []
+            if not expansion:
+                return [], 0
+            grupos.append([(self._postings[t], self._idf(self._postings[t]))
+                           for t in expansion])
+
+        # Empezar por el término con menos coincidencias y filtrar con los demás
+        grupos.sort(key=lambda g: sum(len(p) for p, _ in g))
+        puntos = {}
+        for posting, idf in grupos[0]:
+            if not puntos:
+                puntos = {pid: peso * idf for pid, peso in posting.items()}
+                continue
+            for pid, peso in posting.items():
+                puntos[pid] = max(puntos.get(pid, 0.0), peso * idf)
+        for grupo in grupos[1:]:
+            if len(grupo) == 1:
+                # Término exacto: intersección directa con un solo posting
+                (posting, idf), = grupo
+                puntos = {pid: acumulado + posting[pid] * idf
+                          for pid, acumulado in puntos.items() if pid in posting}
+            else:
+                siguientes = {}
+                for pid, acumulado in puntos.items():
+                    mejor = max((p[pid] * idf for p, idf in grupo if pid in p), default=None)
+                    if mejor is not None:
+                        siguientes[pid] = acumulado + mejor
+                puntos = siguientes
+            if not puntos:
+                return [], 0
+
+        mejores = heapq.nlargest(limit, puntos.items(), key=lambda x: (x[1], -x[0]))
+        return mejores, len(puntos)
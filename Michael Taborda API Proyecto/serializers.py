@@ -0,0 +1,117 @@
+"""
+Capa de serialización de la API
+
+- JSON: usa orjson si está instalado y, si no, el módulo json estándar.
+  Los archivos de datos se escriben compactos salvo que se configure
+  una sangría (TIENDA_JSON_INDENT).
+- MessagePack: las respuestas se envían en MessagePack a los clientes que
+  lo piden con `Accept: application/msgpack` (requiere el paquete msgpack).
+"""
+import json
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Sin orjson: módulo json estándar
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Sin msgpack: siempre se responde en JSON
+    msgpack = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+# Tipo de contenido de cada formato de respuesta
+MIMETYPES = {'json': 'application/json', 'msgpack': 'application/msgpack'}
+
+
+def dumps(obj, indent=None):
+    """Serializa a bytes UTF-8 en JSON compacto (o con sangría de 2 espacios)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=indent, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps_str(obj):
+    """Igual que dumps pero retorna str, para construir texto JSON a mano"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def dump(obj, f, indent=None):
+    """Escribe obj como JSON en un archivo binario sin construir todo el texto
+    en memoria cuando se usa el módulo estándar"""
+    if orjson is not None:
+        return f.write(dumps(obj, indent))
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=indent,
+                               separators=None if indent else (',', ':'))
+    escritos = 0
+    for parte in encoder.iterencode(obj):
+        escritos += f.write(parte.encode('utf-8'))
+    return escritos
+
+
+def loads(data):
+    """Deserializa JSON desde str o bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def quiere_msgpack():
+    """El cliente prefiere MessagePack a JSON según su cabecera Accept"""
+    if msgpack is None or not has_request_context():
+        return False
+    aceptados = request.accept_mimetypes
+    mejor = aceptados.best_match(['application/json', *MSGPACK_MIMETYPES])
+    return mejor in MSGPACK_MIMETYPES
+
+
+def formato_respuesta():
+    """Identificador del formato negociado, para claves de caché y ETags"""
+    return 'msgpack' if quiere_msgpack() else 'json'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask con orjson cuando está disponible y negociación
+    de MessagePack en jsonify()
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.keys() - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        opciones = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=opciones).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def dumps_msgpack(self, obj):
+        return msgpack.packb(obj, default=self.default)
+
+    def response(self, *args, **kwargs):
+        if not quiere_msgpack():
+            resp = super().response(*args, **kwargs)
+        else:
+            obj = self._prepare_response_obj(args, kwargs)
+            resp = self._app.response_class(self.dumps_msgpack(obj),
+                                            mimetype='application/msgpack')
+        resp.vary.add('Accept')
+        return resp
+
+
+def init_app(app):
+    """Instala el proveedor JSON (orjson y MessagePack) en la aplicación"""
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,853 @@
+"""
+Backend de almacenamiento SQLite (modo WAL)
+
+Ofrece la misma interfaz que los repositorios en memoria de repository.py,
+de modo que los endpoints no cambian al seleccionar este backend. Cada
+registro se guarda como JSON en la columna `data`; los campos por los que
+se consulta se copian a columnas indexadas.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from changelog import (MARGEN_RECORTE, OP_DELETE, OP_INICIO, OP_UPSERT, formato_cambio,
+                       requiere_resync)
+from analytics import (CRITERIOS_TOP, aportes, diferencias, fila_categoria, fila_dia,
+                       fila_producto, resumen)
+from facets import (BUCKETS_DEFECTO, RATING_MAXIMO, factor_intervalo, histograma_precio,
+                    respuesta)
+from indexes import normalizar_categoria
+from metrics import record_io
+from partitions import dia_siguiente
+from search import PESO_DESCRIPCION, PESO_NOMBRE, terminos_consulta
+from serializers import dumps_str, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS productos (
+    id INTEGER PRIMARY KEY,
+    categoria TEXT NOT NULL,
+    precio REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_productos_categoria ON productos (categoria);
+CREATE INDEX IF NOT EXISTS idx_productos_precio ON productos (precio);
+
+-- Listados ordenados y top-k por precio, rating y stock, globales y por categoría
+CREATE INDEX IF NOT EXISTS idx_productos_categoria_precio ON productos (categoria, precio);
+CREATE INDEX IF NOT EXISTS idx_productos_rating ON productos (json_extract(data, '$.rating'));
+CREATE INDEX IF NOT EXISTS idx_productos_categoria_rating
+    ON productos (categoria, json_extract(data, '$.rating'));
+CREATE INDEX IF NOT EXISTS idx_productos_stock ON productos (json_extract(data, '$.stock'));
+CREATE INDEX IF NOT EXISTS idx_productos_categoria_stock
+    ON productos (categoria, json_extract(data, '$.stock'));
+
+-- Índice de texto completo sin tildes, mantenido por triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+    nombre, descripcion, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS productos_fts_insert AFTER INSERT ON productos BEGIN
+    INSERT OR REPLACE INTO productos_fts (rowid, nombre, descripcion)
+    VALUES (new.id, json_extract(new.data, '$.nombre'), json_extract(new.data, '$.descripcion'));
+END;
+CREATE TRIGGER IF NOT EXISTS productos_fts_delete AFTER DELETE ON productos BEGIN
+    DELETE FROM productos_fts WHERE rowid = old.id;
+END;
+
+-- Registro de cambios del catálogo; una marca 'inicio' indica desde qué
+-- secuencia el historial está completo
+CREATE TABLE IF NOT EXISTS productos_cambios (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    producto_id INTEGER,
+    data TEXT,
+    fecha TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+-- Listados por rango de fechas (desde/hasta) sin recorrer todo el historial
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha
+    ON pedidos (json_extract(data, '$.fecha_creacion'));
+
+-- Estadísticas de ventas, actualizadas en la misma transacción que los pedidos
+CREATE TABLE IF NOT EXISTS ventas_dia (
+    fecha TEXT PRIMARY KEY,
+    pedidos INTEGER NOT NULL,
+    unidades INTEGER NOT NULL,
+    ingresos REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ventas_producto (
+    producto_id INTEGER PRIMARY KEY,
+    nombre TEXT,
+    categoria TEXT,
+    pedidos INTEGER NOT NULL,
+    unidades INTEGER NOT NULL,
+    ingresos REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ventas_producto_unidades
+    ON ventas_producto (unidades DESC, producto_id);
+CREATE INDEX IF NOT EXISTS idx_ventas_producto_ingresos
+    ON ventas_producto (ingresos DESC, producto_id);
+CREATE TABLE IF NOT EXISTS ventas_categoria (
+    categoria TEXT PRIMARY KEY,
+    pedidos INTEGER NOT NULL,
+    unidades INTEGER NOT NULL,
+    ingresos REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ventas_categoria_nombre (
+    categoria TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    pedidos INTEGER NOT NULL,
+    PRIMARY KEY (categoria, nombre)
+);
+CREATE TABLE IF NOT EXISTS ventas_estado (
+    estado TEXT PRIMARY KEY,
+    pedidos INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios (email);
+
+CREATE TABLE IF NOT EXISTS idempotencia (
+    id INTEGER PRIMARY KEY,
+    clave TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_idempotencia_clave ON idempotencia (clave);
+
+-- Versión de cada tabla, compartida por todos los procesos que usan la base
+CREATE TABLE IF NOT EXISTS versiones (
+    tabla TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    modificado REAL NOT NULL
+);
+
+-- Último id asignado por create() en cada tabla: los ids de registros
+-- borrados no se vuelven a usar
+CREATE TABLE IF NOT EXISTS secuencias (
+    tabla TEXT PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL
+);
+"""
+
+
+class SqliteDatabase:
+    """
+    Conexiones SQLite por hilo. Cada hilo del servidor WSGI obtiene su
+    propia conexión, así ninguna conexión se comparte entre hilos.
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Transacción de escritura: BEGIN IMMEDIATE ... COMMIT/ROLLBACK"""
+        conn = self.connection()
+        if conn.in_transaction:
+            # Transacción anidada: la exterior decide el COMMIT
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        inicio = time.perf_counter()
+        conn.execute('COMMIT')
+        record_io('commit', os.path.basename(self.path), time.perf_counter() - inicio, 0)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class SqliteRepository:
+    """Colección de registros con id guardada en una tabla SQLite"""
+
+    # Columnas indexadas (además de id) y cómo se obtienen del registro
+    columns = {}
+
+    def __init__(self, database, table):
+        self.database = database
+        self.table = table
+        with database.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO versiones (tabla, version, modificado) "
+                         "VALUES (?, 0, ?)", (table, time.time()))
+            # Bases anteriores a la tabla de secuencias: se parte del mayor id actual
+            conn.execute("INSERT OR IGNORE INTO secuencias (tabla, ultimo_id) "
+                         f"SELECT ?, COALESCE(MAX(id), 0) FROM {table}", (table,))
+
+    def _estado_version(self):
+        return self.database.connection().execute(
+            "SELECT version, modificado FROM versiones WHERE tabla = ?",
+            (self.table,)).fetchone()
+
+    @property
+    def version(self):
+        """Versión de la colección: aumenta con cada mutación de cualquier proceso"""
+        return self._estado_version()[0]
+
+    @property
+    def last_modified(self):
+        return self._estado_version()[1]
+
+    def _bump_version(self, conn):
+        """Se llama dentro de la transacción de escritura"""
+        conn.execute("UPDATE versiones SET version = version + 1, modificado = ? "
+                     "WHERE tabla = ?", (time.time(), self.table))
+
+    def _row_values(self, registro):
+        return [extraer(registro) for extraer in self.columns.values()]
+
+    @staticmethod
+    def _decode(row):
+        return {"id": row[0], **loads(row[1])}
+
+    @staticmethod
+    def _encode(registro):
+        return dumps_str({k: v for k, v in registro.items() if k != 'id'})
+
+    def _query(self, where='', params=(), limit=-1, orden='id'):
+        sql = f"SELECT id, data FROM {self.table} {where} ORDER BY {orden} LIMIT {int(limit)}"
+        inicio = time.perf_counter()
+        rows = self.database.connection().execute(sql, params).fetchall()
+        leido = time.perf_counter()
+        nbytes = sum(len(row[1]) for row in rows)
+        record_io('read', self.table, leido - inicio, nbytes)
+        registros = [self._decode(row) for row in rows]
+        record_io('parse', self.table, time.perf_counter() - leido, nbytes)
+        return registros
+
+    def all(self):
+        """Lista de todos los registros ordenados por id"""
+        return self._query()
+
+    def get(self, record_id):
+        row = self.database.connection().execute(
+            f"SELECT id, data FROM {self.table} WHERE id = ?", (record_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def get_many(self, ids, bloque=500):
+        """Registros existentes de la lista de ids, en el mismo orden"""
+        encontrados = {}
+        ids = list(ids)
+        for inicio in range(0, len(ids), bloque):
+            parte = ids[inicio:inicio + bloque]
+            marcas = ', '.join('?' * len(parte))
+            for registro in self._query(f"WHERE id IN ({marcas})", parte):
+                encontrados[registro['id']] = registro
+        return [encontrados[i] for i in ids if i in encontrados]
+
+    def batch(self):
+        """Agrupa varias mutaciones en una sola transacción"""
+        return self.database.transaction()
+
+    def find_one(self, campo, valor):
+        """Primer registro cuyo campo indexado tiene el valor dado, o None"""
+        if campo not in self.columns:
+            raise ValueError(f"{campo} no es una columna indexada de {self.table}")
+        registros = self._query(f"WHERE {campo} = ?", (valor,), limit=1)
+        return registros[0] if registros else None
+
+    def count(self):
+        return self.database.connection().execute(
+            f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _keyset(self, condiciones, params, cursor, limit):
+        """Consulta paginada por id (keyset) sobre las condiciones dadas"""
+        condiciones, params = list(condiciones), list(params)
+        if cursor is not None:
+            condiciones.append("id > ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        return self._query(where, params, limit if limit is not None else -1)
+
+    def page(self, cursor=None, limit=None):
+        """Registros con id mayor que `cursor`, ordenados por id"""
+        return self._keyset([], [], cursor, limit)
+
+    def _iter_keyset(self, condiciones, params, chunk):
+        cursor = None
+        while True:
+            bloque = self._keyset(condiciones, params, cursor, chunk)
+            yield from bloque
+            if len(bloque) < chunk:
+                return
+            cursor = bloque[-1]['id']
+
+    def iter_all(self, chunk=500):
+        """Recorre todos los registros por id en bloques de tamaño fijo"""
+        return self._iter_keyset([], [], chunk)
+
+    def create(self, data):
+        """Asigna un nuevo id de forma atómica y guarda el registro"""
+        with self.database.transaction() as conn:
+            # También por encima de los ids guardados con insert() o reset()
+            conn.execute(
+                "UPDATE secuencias SET ultimo_id = MAX(ultimo_id, "
+                f"(SELECT COALESCE(MAX(id), 0) FROM {self.table})) + 1 WHERE tabla = ?",
+                (self.table,))
+            nuevo_id = conn.execute("SELECT ultimo_id FROM secuencias WHERE tabla = ?",
+                                    (self.table,)).fetchone()[0]
+            return self.insert({"id": nuevo_id, **data})
+
+    def _escribir(self, conn, registro):
+        nombres = ', '.join(['id', *self.columns, 'data'])
+        marcas = ', '.join('?' * (len(self.columns) + 2))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} ({nombres}) VALUES ({marcas})",
+            [registro['id'], *self._row_values(registro), self._encode(registro)])
+
+    def insert(self, registro):
+        """Guarda un registro que ya trae su id"""
+        with self.database.transaction() as conn:
+            self._escribir(conn, registro)
+            self._bump_version(conn)
+        return registro
+
+    def update(self, record_id, cambios):
+        """Aplica cambios sobre un registro y retorna la nueva versión, o None"""
+        with self.database.transaction():
+            actual = self.get(record_id)
+            if actual is None:
+                return None
+            nuevo = {**actual, **cambios}
+            self.insert(nuevo)
+        return nuevo
+
+    def compare_and_swap(self, cambios):
+        """Aplica los pares (esperado, nuevo) solo si nadie los modificó antes"""
+        with self.database.transaction():
+            if any(self.get(esperado['id']) != esperado for esperado, _ in cambios):
+                return False
+            for _, nuevo in cambios:
+                self.insert(nuevo)
+        return True
+
+    def delete(self, record_id):
+        """Elimina un registro; retorna False si no existía"""
+        with self.database.transaction() as conn:
+            cursor = conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (record_id,))
+            if cursor.rowcount == 0:
+                return False
+            self._bump_version(conn)
+        return True
+
+    def reset(self, registros):
+        """Reemplaza todo el contenido de la tabla"""
+        with self.database.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            for registro in registros:
+                self._escribir(conn, registro)
+            self._bump_version(conn)
+
+    def reload(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SqliteProductRepository(SqliteRepository):
+    """
+    Productos con filtros resueltos por los índices de categoría y precio.
+    Cada escritura se anota en productos_cambios en la misma transacción.
+    """
+
+    columns = {
+        # Misma normalización (casefold) que los índices en memoria
+        'categoria': lambda p: normalizar_categoria(p['categoria']),
+        'precio': lambda p: p['precio'],
+    }
+
+    def __init__(self, database, max_cambios=10000):
+        super().__init__(database, 'productos')
+        self.max_cambios = max_cambios
+        self._sincronizar_fts()
+        self._normalizar_categorias()
+
+    def _sincronizar_fts(self):
+        """Reconstruye el índice de texto de bases creadas antes de existir"""
+        with self.database.transaction() as conn:
+            productos = conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+            indexados = conn.execute("SELECT COUNT(*) FROM productos_fts").fetchone()[0]
+            if productos != indexados:
+                conn.execute("DELETE FROM productos_fts")
+                conn.execute(
+                    "INSERT INTO productos_fts (rowid, nombre, descripcion) "
+                    "SELECT id, json_extract(data, '$.nombre'), "
+                    "json_extract(data, '$.descripcion') FROM productos")
+
+    def _normalizar_categorias(self):
+        """Bases que guardaban la categoría con lower(): se pasa a casefold()"""
+        with self.database.transaction() as conn:
+            filas = conn.execute(
+                "SELECT DISTINCT json_extract(data, '$.categoria'), categoria "
+                "FROM productos").fetchall()
+            conn.executemany(
+                "UPDATE productos SET categoria = ? "
+                "WHERE categoria = ? AND json_extract(data, '$.categoria') = ?",
+                [(normalizar_categoria(nombre), clave, nombre) for nombre, clave in filas
+                 if isinstance(nombre, str) and normalizar_categoria(nombre) != clave])
+
+    def _registrar_cambio(self, conn, op, producto_id, producto=None):
+        conn.execute("INSERT INTO productos_cambios (op, producto_id, data, fecha) "
+                     "VALUES (?, ?, ?, ?)",
+                     (op, producto_id, dumps_str(producto) if producto is not None else None,
+                      datetime.now().isoformat()))
+        # Dos subconsultas: SQLite solo resuelve MIN o MAX con el índice
+        # cuando son la única columna; juntos recorrerían toda la tabla
+        primera, ultima = conn.execute(
+            "SELECT (SELECT MIN(seq) FROM productos_cambios), "
+            "(SELECT MAX(seq) FROM productos_cambios)").fetchone()
+        if ultima - primera > self.max_cambios * MARGEN_RECORTE:
+            # Se conservan las últimas max_cambios entradas tras una marca de inicio
+            corte = ultima - self.max_cambios
+            conn.execute("DELETE FROM productos_cambios WHERE seq <= ?", (corte,))
+            conn.execute("INSERT INTO productos_cambios (seq, op) VALUES (?, ?)",
+                         (corte, OP_INICIO))
+
+    def _escribir(self, conn, registro):
+        super()._escribir(conn, registro)
+        self._registrar_cambio(conn, OP_UPSERT, registro['id'], registro)
+
+    def delete(self, record_id):
+        with self.database.transaction() as conn:
+            if not super().delete(record_id):
+                return False
+            self._registrar_cambio(conn, OP_DELETE, record_id)
+        return True
+
+    def reset(self, registros):
+        with self.database.transaction() as conn:
+            super().reset(registros)
+            # Historial descartado: todos los clientes deberán resincronizar
+            siguiente = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM productos_cambios").fetchone()[0]
+            conn.execute("DELETE FROM productos_cambios")
+            conn.execute("INSERT INTO productos_cambios (seq, op) VALUES (?, ?)",
+                         (siguiente, OP_INICIO))
+
+    def cambios_desde(self, since, limit):
+        """Retorna (resync, cambios, ultima) como ChangeLog.desde"""
+        conn = self.database.connection()
+        filas = []
+        if since is not None:
+            filas = conn.execute(
+                "SELECT seq, op, producto_id, data, fecha FROM productos_cambios "
+                "WHERE seq > ? ORDER BY seq LIMIT ?", (since, int(limit))).fetchall()
+        # Los límites se leen después de los cambios sin abrir una transacción:
+        # la marca de inicio y la última secuencia solo crecen, así que si
+        # ahora `since` sigue dentro del historial, las filas leídas están completas
+        ultima = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM productos_cambios").fetchone()[0]
+        primera = conn.execute(
+            "SELECT seq, op FROM productos_cambios ORDER BY seq LIMIT 1").fetchone()
+        base = primera[0] if primera is not None and primera[1] == OP_INICIO else 0
+        if requiere_resync(since, base, ultima):
+            return True, [], ultima
+        return False, [formato_cambio(seq, op, producto_id,
+                                      loads(data) if data is not None else None, fecha)
+                       for seq, op, producto_id, data, fecha in filas], ultima
+
+    def buscar(self, q, limit=20, prefijo=True):
+        """
+        Productos que contienen todos los términos de `q`, ordenados por
+        relevancia (BM25). Retorna ([(producto, relevancia)], total de coincidencias).
+        """
+        terminos = terminos_consulta(q)
+        if not terminos:
+            return [], 0
+        # Cada término va entre comillas: la consulta no puede inyectar operadores FTS
+        consulta = ' '.join(f'"{t}"' for t in terminos)
+        if prefijo:
+            consulta += '*'
+        conn = self.database.connection()
+        total = conn.execute("SELECT COUNT(*) FROM productos_fts WHERE productos_fts MATCH ?",
+                             (consulta,)).fetchone()[0]
+        filas = conn.execute(
+            "SELECT p.id, p.data, -bm25(productos_fts, ?, ?) AS relevancia "
+            "FROM productos_fts JOIN productos p ON p.id = productos_fts.rowid "
+            "WHERE productos_fts MATCH ? "
+            "ORDER BY relevancia DESC, p.id LIMIT ?",
+            (PESO_NOMBRE, PESO_DESCRIPCION, consulta, int(limit))).fetchall()
+        return [(self._decode(fila), fila[2]) for fila in filas], total
+
+    # Expresión SQL de cada campo de ordenación; deben coincidir con las de
+    # los índices del esquema para que SQLite los use
+    EXPRESIONES_ORDEN = {
+        'precio': 'precio',
+        'rating': "json_extract(data, '$.rating')",
+        'stock': "json_extract(data, '$.stock')",
+    }
+
+    def ordenar(self, campo, descendente=False, categoria=None, min_precio=None,
+                max_precio=None, limit=None):
+        """
+        Productos filtrados ordenados por precio, rating o stock (empates
+        por id; los que no tienen el campo, al final), hasta `limit`
+        """
+        expresion = self.EXPRESIONES_ORDEN[campo]
+        numerico = f"typeof({expresion}) IN ('integer', 'real')"
+        condiciones, params = self._condiciones(categoria, min_precio, max_precio)
+        where = ' AND '.join(condiciones + [numerico])
+        productos = self._query(f"WHERE {where}", params,
+                                limit if limit is not None else -1,
+                                orden=f"{expresion} {'DESC' if descendente else 'ASC'}, id")
+        if limit is None or len(productos) < limit:
+            where = ' AND '.join(condiciones + [f"NOT {numerico}"])
+            resto = limit - len(productos) if limit is not None else -1
+            productos += self._query(f"WHERE {where}", params, resto)
+        return productos
+
+    def facetas(self, categoria=None, min_precio=None, max_precio=None,
+                buckets=BUCKETS_DEFECTO):
+        """
+        Facetas como ColumnasProductos.facetas, agregadas en SQL con los
+        índices de categoría y precio y la misma fórmula de intervalos
+        """
+        conn = self.database.connection()
+        rating = self.EXPRESIONES_ORDEN['rating']
+        stock = self.EXPRESIONES_ORDEN['stock']
+        numerico = "typeof({}) IN ('integer', 'real')"
+
+        def where(condiciones):
+            return f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+        por_precio, params_precio = self._condiciones(None, min_precio, max_precio)
+        por_categoria, params_categoria = self._condiciones(categoria, None, None)
+        todas = por_precio + por_categoria
+        params = params_precio + params_categoria
+
+        # Nombre de cada categoría: el primero en orden alfabético entre sus variantes
+        categorias = dict(conn.execute(
+            f"SELECT MIN(json_extract(data, '$.categoria')), COUNT(*) FROM productos "
+            f"{where(por_precio)} GROUP BY categoria", params_precio))
+
+        condiciones = por_categoria + [numerico.format('precio')]
+        minimo, maximo, con_precio = conn.execute(
+            f"SELECT MIN(precio), MAX(precio), COUNT(*) FROM productos {where(condiciones)}",
+            params_categoria).fetchone()
+        if not con_precio:
+            faceta_precio = histograma_precio(None, None, [])
+        elif minimo == maximo:
+            faceta_precio = histograma_precio(float(minimo), float(maximo), [con_precio])
+        else:
+            minimo, maximo = float(minimo), float(maximo)
+            por_intervalo = [0] * buckets
+            for i, n in conn.execute(
+                    f"SELECT MIN(CAST((precio - ?) * ? AS INTEGER), ?) AS i, COUNT(*) "
+                    f"FROM productos {where(condiciones)} GROUP BY i",
+                    [minimo, factor_intervalo(minimo, maximo, buckets), buckets - 1,
+                     *params_categoria]):
+                por_intervalo[i] = n
+            faceta_precio = histograma_precio(minimo, maximo, por_intervalo)
+
+        total, en_stock, con_rating = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM({stock} > 0), 0), "
+            f"COALESCE(SUM({numerico.format(rating)}), 0) FROM productos {where(todas)}",
+            params).fetchone()
+        por_rating = [0] * RATING_MAXIMO
+        for i, n in conn.execute(
+                f"SELECT MIN(MAX(CAST({rating} AS INTEGER), 0), ?) AS i, COUNT(*) "
+                f"FROM productos {where(todas + [numerico.format(rating)])} GROUP BY i",
+                [RATING_MAXIMO - 1, *params]):
+            por_rating[i] = n
+
+        return respuesta(total, categorias, faceta_precio, por_rating,
+                         total - con_rating, en_stock)
+
+    def _condiciones(self, categoria, min_precio, max_precio):
+        condiciones, params = [], []
+        if categoria:
+            condiciones.append("categoria = ?")
+            params.append(normalizar_categoria(categoria))
+        if min_precio is not None:
+            condiciones.append("precio >= ?")
+            params.append(min_precio)
+        if max_precio is not None:
+            condiciones.append("precio <= ?")
+            params.append(max_precio)
+        return condiciones, params
+
+    def filtrar(self, categoria=None, min_precio=None, max_precio=None,
+                cursor=None, limit=None):
+        """Productos que cumplen los filtros, ordenados por id y paginados"""
+        condiciones, params = self._condiciones(categoria, min_precio, max_precio)
+        return self._keyset(condiciones, params, cursor, limit)
+
+    def iter_filtrar(self, categoria=None, min_precio=None, max_precio=None, chunk=500):
+        """Recorre los productos filtrados en bloques de tamaño fijo"""
+        condiciones, params = self._condiciones(categoria, min_precio, max_precio)
+        return self._iter_keyset(condiciones, params, chunk)
+
+
+class SqliteOrderRepository(SqliteRepository):
+    """Pedidos con estadísticas de ventas en tablas de agregados"""
+
+    TABLAS_VENTAS = ('ventas_dia', 'ventas_producto', 'ventas_categoria',
+                     'ventas_categoria_nombre', 'ventas_estado')
+
+    def __init__(self, database):
+        super().__init__(database, 'pedidos')
+        self._sincronizar_estadisticas()
+
+    def _sincronizar_estadisticas(self):
+        """Calcula los agregados de bases creadas antes de existir"""
+        with self.database.transaction() as conn:
+            pedidos = conn.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+            contados = conn.execute(
+                "SELECT COALESCE(SUM(pedidos), 0) FROM ventas_estado").fetchone()[0]
+            # Bases anteriores a guardar los nombres de las categorías
+            sin_nombres = conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM ventas_categoria) AND "
+                "NOT EXISTS (SELECT 1 FROM ventas_categoria_nombre)").fetchone()[0]
+            if pedidos != contados or sin_nombres:
+                self._recalcular(conn)
+
+    def _recalcular(self, conn):
+        for tabla in self.TABLAS_VENTAS:
+            conn.execute(f"DELETE FROM {tabla}")
+        for pedido in self._iter_keyset([], [], 500):
+            self._acumular(conn, pedido, 1)
+
+    def _acumular(self, conn, pedido, signo):
+        """Suma (signo=1) o resta (signo=-1) la contribución de un pedido"""
+        aporte = aportes(pedido)
+        conn.execute(
+            "INSERT INTO ventas_estado (estado, pedidos) VALUES (?, ?) "
+            "ON CONFLICT (estado) DO UPDATE SET pedidos = pedidos + excluded.pedidos",
+            (aporte.estado, signo))
+        conn.execute("DELETE FROM ventas_estado WHERE estado IS ? AND pedidos <= 0",
+                     (aporte.estado,))
+        if not aporte.venta:
+            return
+
+        suma = ("pedidos = pedidos + excluded.pedidos, "
+                "unidades = unidades + excluded.unidades, "
+                "ingresos = ingresos + excluded.ingresos")
+        conn.execute(
+            "INSERT INTO ventas_dia (fecha, pedidos, unidades, ingresos) VALUES (?, ?, ?, ?) "
+            f"ON CONFLICT (fecha) DO UPDATE SET {suma}",
+            (aporte.dia, signo, signo * aporte.unidades, signo * aporte.ingresos))
+        conn.executemany(
+            "INSERT INTO ventas_categoria (categoria, pedidos, unidades, ingresos) "
+            f"VALUES (?, ?, ?, ?) ON CONFLICT (categoria) DO UPDATE SET {suma}",
+            [(categoria, signo, signo * unidades, signo * ingresos)
+             for categoria, (unidades, ingresos) in aporte.categorias.items()])
+        conn.executemany(
+            "INSERT INTO ventas_categoria_nombre (categoria, nombre, pedidos) VALUES (?, ?, ?) "
+            "ON CONFLICT (categoria, nombre) DO UPDATE SET pedidos = pedidos + excluded.pedidos",
+            [(categoria, nombre, signo)
+             for categoria, nombres in aporte.nombres.items() for nombre in nombres])
+        conn.executemany(
+            "DELETE FROM ventas_categoria_nombre WHERE categoria = ? AND nombre = ? "
+            "AND pedidos <= 0",
+            [(categoria, nombre)
+             for categoria, nombres in aporte.nombres.items() for nombre in nombres])
+        # El nombre y la categoría son los del pedido más reciente
+        conn.executemany(
+            "INSERT INTO ventas_producto "
+            "(producto_id, nombre, categoria, pedidos, unidades, ingresos) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (producto_id) DO UPDATE SET "
+            "nombre = CASE WHEN excluded.pedidos > 0 THEN excluded.nombre ELSE nombre END, "
+            "categoria = CASE WHEN excluded.pedidos > 0 THEN excluded.categoria "
+            f"ELSE categoria END, {suma}",
+            [(pid, nombre, categoria, signo, signo * unidades, signo * ingresos)
+             for pid, (nombre, categoria, unidades, ingresos) in aporte.productos.items()])
+        conn.execute("DELETE FROM ventas_dia WHERE fecha = ? AND pedidos <= 0", (aporte.dia,))
+        for tabla, columna, claves in (('ventas_categoria', 'categoria', aporte.categorias),
+                                       ('ventas_producto', 'producto_id', aporte.productos)):
+            conn.executemany(f"DELETE FROM {tabla} WHERE {columna} = ? AND pedidos <= 0",
+                             [(clave,) for clave in claves])
+
+    def _escribir(self, conn, registro):
+        anterior = conn.execute("SELECT id, data FROM pedidos WHERE id = ?",
+                                (registro['id'],)).fetchone()
+        if anterior is not None:
+            self._acumular(conn, self._decode(anterior), -1)
+        super()._escribir(conn, registro)
+        self._acumular(conn, registro, 1)
+
+    def delete(self, record_id):
+        with self.database.transaction():
+            anterior = self.get(record_id)
+            if not super().delete(record_id):
+                return False
+            self._acumular(self.database.connection(), anterior, -1)
+        return True
+
+    def reset(self, registros):
+        with self.database.transaction() as conn:
+            for tabla in self.TABLAS_VENTAS:
+                conn.execute(f"DELETE FROM {tabla}")
+            super().reset(registros)
+
+    def _condiciones_fecha(self, desde, hasta):
+        # Las fechas ISO se comparan como texto; hasta es inclusivo
+        condiciones, params = [], []
+        if desde is not None:
+            condiciones.append("json_extract(data, '$.fecha_creacion') >= ?")
+            params.append(desde)
+        if hasta is not None:
+            condiciones.append("json_extract(data, '$.fecha_creacion') < ?")
+            params.append(dia_siguiente(hasta))
+        return condiciones, params
+
+    def filtrar(self, desde=None, hasta=None, cursor=None, limit=None):
+        """Pedidos creados en el rango inclusivo [desde, hasta] (AAAA-MM-DD), por id"""
+        condiciones, params = self._condiciones_fecha(desde, hasta)
+        return self._keyset(condiciones, params, cursor, limit)
+
+    def iter_filtrar(self, desde=None, hasta=None, chunk=500):
+        """Recorre los pedidos del rango de fechas en bloques de tamaño fijo"""
+        condiciones, params = self._condiciones_fecha(desde, hasta)
+        return self._iter_keyset(condiciones, params, chunk)
+
+    def resumen_ventas(self):
+        """Totales de ventas y pedidos por estado"""
+        conn = self.database.connection()
+        por_estado = dict(conn.execute("SELECT estado, pedidos FROM ventas_estado"))
+        unidades, ingresos = conn.execute(
+            "SELECT COALESCE(SUM(unidades), 0), COALESCE(SUM(ingresos), 0.0) "
+            "FROM ventas_categoria").fetchone()
+        return resumen(por_estado, unidades, ingresos)
+
+    def ventas_por_dia(self, desde=None, hasta=None):
+        """Totales por día en el rango inclusivo [desde, hasta] (AAAA-MM-DD)"""
+        condiciones, params = [], []
+        if desde:
+            condiciones.append("fecha >= ?")
+            params.append(desde)
+        if hasta:
+            condiciones.append("fecha <= ?")
+            params.append(hasta)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        filas = self.database.connection().execute(
+            f"SELECT fecha, pedidos, unidades, ingresos FROM ventas_dia {where} "
+            "ORDER BY fecha", params)
+        return [fila_dia(*fila) for fila in filas]
+
+    def ventas_por_producto(self):
+        filas = self.database.connection().execute(
+            "SELECT producto_id, nombre, categoria, pedidos, unidades, ingresos "
+            "FROM ventas_producto ORDER BY producto_id")
+        return [fila_producto(*fila) for fila in filas]
+
+    def ventas_por_categoria(self):
+        """Totales por categoría; el nombre es la primera variante en orden alfabético"""
+        filas = self.database.connection().execute(
+            "SELECT COALESCE((SELECT MIN(n.nombre) FROM ventas_categoria_nombre n "
+            "WHERE n.categoria = c.categoria), c.categoria), pedidos, unidades, ingresos "
+            "FROM ventas_categoria c ORDER BY c.categoria")
+        return [fila_categoria(*fila) for fila in filas]
+
+    def top_productos(self, n=10, por='unidades'):
+        """Los n productos más vendidos por unidades o por ingresos"""
+        if por not in CRITERIOS_TOP:
+            raise ValueError(f"Criterio de ranking inválido: {por}")
+        filas = self.database.connection().execute(
+            "SELECT producto_id, nombre, categoria, pedidos, unidades, ingresos "
+            f"FROM ventas_producto ORDER BY {por} DESC, producto_id LIMIT ?", (int(n),))
+        return [fila_producto(*fila) for fila in filas]
+
+    def _exportar(self):
+        return {
+            "resumen": self.resumen_ventas(),
+            "dias": self.ventas_por_dia(),
+            "productos": self.ventas_por_producto(),
+            "categorias": self.ventas_por_categoria()
+        }
+
+    def reconstruir_estadisticas(self):
+        """
+        Recalcula las estadísticas desde los pedidos guardados. Retorna las
+        secciones en que los agregados incrementales no coincidían.
+        """
+        with self.database.transaction() as conn:
+            antes = self._exportar()
+            self._recalcular(conn)
+            return diferencias(antes, self._exportar())
+
+
+class SqliteUserRepository(SqliteRepository):
+    """Usuarios con búsqueda por email resuelta por índice único"""
+
+    columns = {'email': lambda u: u['email']}
+
+    def __init__(self, database):
+        super().__init__(database, 'usuarios')
+
+    def create_unique(self, data):
+        """Crea el usuario solo si su email no está registrado; si no, retorna None"""
+        with self.database.transaction():
+            if self.find_one('email', data['email']) is not None:
+                return None
+            return self.create(data)
+
+
+class SqliteIdempotencyRepository(SqliteRepository):
+    """Claves de idempotencia con índice único por clave"""
+
+    columns = {'clave': lambda r: r['clave']}
+
+    def __init__(self, database):
+        super().__init__(database, 'idempotencia')
+
+    def reservar(self, data, vigente):
+        """
+        Crea el registro de `data['clave']` salvo que ya exista uno para el
+        que vigente(registro) sea verdadero. Retorna (registro, creado).
+        """
+        with self.database.transaction():
+            actual = self.find_one('clave', data['clave'])
+            if actual is not None:
+                if vigente(actual):
+                    return actual, False
+                self.delete(actual['id'])
+            return self.create(data), True
+
+
+def migrate_from_json(database, colecciones):
+    """
+    Importa en una sola transacción las colecciones JSON existentes.
+    `colecciones` asocia cada repositorio SQLite destino con su lista de
+    registros. Retorna cuántos registros se importaron por tabla.
+    """
+    importados = {}
+    with database.transaction():
+        for repo, registros in colecciones.items():
+            repo.reset(registros)
+            importados[repo.table] = len(registros)
+    return importados
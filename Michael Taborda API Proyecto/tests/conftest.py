@@ -0,0 +1,31 @@
+"""
+Configuración de las pruebas. Los módulos de la API están junto a APP.py
+y leen su configuración de TIENDA_* al importarse (config.py), así que el
+entorno se prepara aquí, antes de que las pruebas importen nada.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Datos en un directorio temporal y sin límites de tasa ni de concurrencia
+os.environ['TIENDA_DATA_DIR'] = tempfile.mkdtemp(prefix='tienda-pruebas-')
+os.environ.setdefault('TIENDA_STORAGE', 'json')
+os.environ.pop('TIENDA_RATE_LIMITS', None)
+os.environ.pop('TIENDA_MAX_CONCURRENT', None)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """Módulo APP con los datos de ejemplo cargados"""
+    import APP
+    APP.init_database()
+    return APP
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,32 @@
+"""Los Server-Sent Events nunca se comprimen; el resto del texto sí"""
+from flask import Flask, Response
+
+import compression
+
+
+def _app():
+    app = Flask(__name__)
+    compression.init_app(app, min_size=0)
+
+    @app.route('/eventos')
+    def eventos():
+        return Response(iter(["retry: 3000\n\n", ": ping\n\n"]), mimetype='text/event-stream')
+
+    @app.route('/csv')
+    def csv():
+        return Response(iter(["a,b\n", "1,2\n"]), mimetype='text/csv')
+
+    return app
+
+
+def test_event_stream_sin_comprimir():
+    r = _app().test_client().get('/eventos', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in r.headers
+    assert r.get_data(as_text=True) == "retry: 3000\n\n: ping\n\n"
+
+
+def test_csv_en_streaming_comprimido():
+    r = _app().test_client().get('/csv', headers={'Accept-Encoding': 'gzip'})
+
+    assert r.headers['Content-Encoding'] == 'gzip'
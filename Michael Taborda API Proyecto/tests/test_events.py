@@ -0,0 +1,67 @@
+"""
+Reconexión al stream de productos: con Last-Event-ID se reciben los
+cambios perdidos y, si ya no están en el registro, un evento 'resync'
+"""
+import json
+
+import pytest
+
+from changelog import ChangeLog
+from events import Broker, EventosCatalogo
+from repository import ProductRepository
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    cambios = ChangeLog(str(tmp_path / 'cambios.json'), str(tmp_path / 'cambios.journal'),
+                        max_entries=5)
+    repo = ProductRepository(str(tmp_path / 'products.json'), cambios=cambios)
+    eventos = EventosCatalogo(repo, Broker())
+    yield repo, eventos
+    eventos.close()
+
+
+def _eventos(mensajes):
+    """(evento, id, datos) de cada mensaje SSE"""
+    salida = []
+    for mensaje in mensajes:
+        campos = dict(linea.split(': ', 1) for linea in mensaje.strip().splitlines())
+        salida.append((campos['event'], campos.get('id'), json.loads(campos['data'])))
+    return salida
+
+
+def test_reconexion_recibe_los_cambios_perdidos(catalogo):
+    repo, eventos = catalogo
+    a = repo.create({"nombre": "A", "precio": 1.0, "categoria": "Hogar", "stock": 1})
+    b = repo.create({"nombre": "B", "precio": 2.0, "categoria": "Ropa", "stock": 1})
+    _, _, desde = repo.cambios_desde(None, 0)
+
+    repo.update(a['id'], {"precio": 1.5})
+    repo.update(b['id'], {"stock": 7})
+    repo.delete(a['id'])
+
+    suscripcion = eventos.suscribir(categoria='hogar', desde=desde)
+    recibidos = _eventos(suscripcion.esperar(0))
+    eventos.cancelar(suscripcion)
+
+    # El cambio y la baja de A se fusionan en el último estado; B es de otra categoría
+    assert [(evento, datos['id']) for evento, _, datos in recibidos] == [('eliminado', a['id'])]
+    assert recibidos[0][1] == str(desde + 3)
+
+
+def test_reconexion_sin_historial_pide_resync(catalogo):
+    repo, eventos = catalogo
+    producto = repo.create({"nombre": "A", "precio": 1.0, "categoria": "Hogar", "stock": 100})
+    for stock in range(10):
+        repo.update(producto['id'], {"stock": stock})
+
+    suscripcion = eventos.suscribir(desde=1)
+    recibidos = _eventos(suscripcion.esperar(0))
+    eventos.cancelar(suscripcion)
+
+    assert [evento for evento, _, _ in recibidos] == ['resync']
+
+
+def test_last_event_id_invalido(client):
+    r = client.get('/api/productos/stream', headers={'Last-Event-ID': 'abc'})
+    assert r.status_code == 400
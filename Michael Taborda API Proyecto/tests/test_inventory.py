@@ -0,0 +1,101 @@
+"""
+Reservas de stock concurrentes: nunca se vende más de lo que hay y el
+stock final coincide con las reservas o pedidos que tuvieron éxito
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from inventory import Inventario, StockInsuficiente
+from repository import ProductRepository
+
+HILOS = 16
+INTENTOS_POR_HILO = 10
+STOCK_INICIAL = 50
+
+
+def _en_paralelo(funcion):
+    """Ejecuta funcion() HILOS × INTENTOS_POR_HILO veces arrancando todos los hilos a la vez"""
+    salida = threading.Barrier(HILOS)
+
+    def hilo(_):
+        salida.wait()
+        return [funcion() for _ in range(INTENTOS_POR_HILO)]
+
+    with ThreadPoolExecutor(HILOS) as pool:
+        return [r for resultados in pool.map(hilo, range(HILOS)) for r in resultados]
+
+
+def test_reservar_concurrente_sin_sobreventa(tmp_path):
+    repo = ProductRepository(str(tmp_path / 'products.json'))
+    a = repo.create({"nombre": "A", "precio": 1.0, "categoria": "X", "stock": STOCK_INICIAL})
+    b = repo.create({"nombre": "B", "precio": 2.0, "categoria": "X", "stock": STOCK_INICIAL})
+    inventario = Inventario(repo, max_reintentos=10000)
+
+    def reservar():
+        try:
+            # Cada reserva toca dos productos: deben descontarse juntos
+            inventario.reservar([(a['id'], 1), (b['id'], 2)]).commit()
+            return True
+        except StockInsuficiente:
+            return False
+
+    exitos = sum(_en_paralelo(reservar))
+
+    assert exitos == STOCK_INICIAL // 2
+    assert repo.get(a['id'])['stock'] == STOCK_INICIAL - exitos
+    assert repo.get(b['id'])['stock'] == STOCK_INICIAL - 2 * exitos
+
+
+def test_release_devuelve_el_stock(tmp_path):
+    repo = ProductRepository(str(tmp_path / 'products.json'))
+    producto = repo.create({"nombre": "A", "precio": 1.0, "categoria": "X", "stock": 5})
+    inventario = Inventario(repo)
+
+    reserva = inventario.reservar([(producto['id'], 2), (producto['id'], 3)])
+    assert repo.get(producto['id'])['stock'] == 0
+    with pytest.raises(StockInsuficiente):
+        inventario.reservar([(producto['id'], 1)])
+
+    reserva.release()
+    reserva.release()
+    assert repo.get(producto['id'])['stock'] == 5
+
+
+def test_pedidos_concurrentes_sin_sobreventa(app_module):
+    app = app_module.app
+    respuesta = app.test_client().post('/api/productos', json={
+        "nombre": "Concurrente", "precio": 10, "categoria": "Pruebas",
+        "stock": STOCK_INICIAL})
+    producto_id = respuesta.get_json()['producto']['id']
+    pedidos_antes = app_module.pedidos_repo.count()
+
+    def pedir():
+        # Un cliente por petición: el de Flask no es seguro entre hilos
+        r = app.test_client().post('/api/pedidos', json={
+            "items": [{"producto_id": producto_id, "cantidad": 1}]})
+        return r.status_code
+
+    estados = _en_paralelo(pedir)
+
+    creados = estados.count(201)
+    assert creados == STOCK_INICIAL
+    assert estados.count(400) == HILOS * INTENTOS_POR_HILO - creados
+    producto = app.test_client().get(f'/api/productos/{producto_id}').get_json()['producto']
+    assert producto['stock'] == 0
+    assert app_module.pedidos_repo.count() - pedidos_antes == creados
+
+
+def test_conflicto_de_inventario_responde_503(app_module, client, monkeypatch):
+    respuesta = client.post('/api/productos', json={
+        "nombre": "Disputado", "precio": 1, "categoria": "Pruebas", "stock": 1})
+    producto_id = respuesta.get_json()['producto']['id']
+    # Sin reintentos, la reserva se rinde como tras agotarlos por contención
+    monkeypatch.setattr(app_module.inventario, 'max_reintentos', 0)
+
+    r = client.post('/api/pedidos', json={"items": [{"producto_id": producto_id, "cantidad": 1}]})
+
+    assert r.status_code == 503
+    assert r.headers['Retry-After'] == '1'
+    assert client.get(f'/api/productos/{producto_id}').get_json()['producto']['stock'] == 1
@@ -0,0 +1,84 @@
+"""
+Repositorios: la escritura diferida no pierde cambios pendientes si falla
+una escritura, y el backend SQLite no reutiliza ids y normaliza las
+categorías igual que los índices en memoria
+"""
+import time
+
+import pytest
+
+import repository
+from repository import ProductRepository, WriteBehindWriter, read_json
+from sqlite_storage import SqliteDatabase, SqliteProductRepository
+
+
+def test_flush_fallido_mantiene_pendientes(tmp_path, monkeypatch):
+    writer = WriteBehindWriter(interval=60)
+    repo = ProductRepository(str(tmp_path / 'products.json'), writer)
+    repo.create({"nombre": "A", "precio": 1.0, "categoria": "X", "stock": 1})
+
+    escribir = repository.write_json
+
+    def disco_lleno(*args, **kwargs):
+        raise OSError(28, "No queda espacio en el dispositivo")
+
+    monkeypatch.setattr(repository, 'write_json', disco_lleno)
+    with pytest.raises(OSError):
+        writer.flush()
+    assert read_json(repo.file_path) == []
+
+    monkeypatch.setattr(repository, 'write_json', escribir)
+    writer.flush()
+    assert [p['nombre'] for p in read_json(repo.file_path)] == ['A']
+    writer.close()
+
+
+def test_hilo_escritor_sobrevive_a_un_error(tmp_path, monkeypatch):
+    writer = WriteBehindWriter(interval=0.01)
+    repo = ProductRepository(str(tmp_path / 'products.json'), writer)
+    escribir = repository.write_json
+    fallos = []
+
+    def falla_una_vez(*args, **kwargs):
+        if not fallos:
+            fallos.append(1)
+            raise PermissionError("Permiso denegado")
+        escribir(*args, **kwargs)
+
+    monkeypatch.setattr(repository, 'write_json', falla_una_vez)
+    repo.create({"nombre": "A", "precio": 1.0, "categoria": "X", "stock": 1})
+    limite = time.monotonic() + 5
+    while not read_json(repo.file_path) and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert writer._thread.is_alive()
+    assert fallos and [p['nombre'] for p in read_json(repo.file_path)] == ['A']
+    writer.close()
+
+
+def test_sqlite_no_reutiliza_ids(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'tienda.db'))
+    repo = SqliteProductRepository(database)
+    datos = {"nombre": "A", "precio": 1.0, "categoria": "X", "stock": 1}
+
+    primero = repo.create(datos)
+    segundo = repo.create(datos)
+    repo.delete(segundo['id'])
+    tercero = repo.create(datos)
+
+    assert tercero['id'] == segundo['id'] + 1 > primero['id']
+    database.close()
+
+
+def test_sqlite_categoria_con_casefold(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'tienda.db'))
+    repo = SqliteProductRepository(database)
+    repo.create({"nombre": "A", "precio": 1.0, "categoria": "Straße", "stock": 1})
+    # Fila guardada como lo hacían las versiones que normalizaban con lower()
+    database.connection().execute("UPDATE productos SET categoria = 'straße'")
+
+    assert repo.filtrar('STRASSE') == []
+    repo = SqliteProductRepository(database)
+
+    assert [p['nombre'] for p in repo.filtrar('STRASSE')] == ['A']
+    assert [p['nombre'] for p in repo.filtrar('straße')] == ['A']
+    database.close()
@@ -0,0 +1,41 @@
+"""Negociación de MessagePack con y sin las métricas instaladas"""
+import pytest
+from flask import Flask, jsonify
+
+import metrics
+import serializers
+
+
+def _app(con_metricas):
+    app = Flask(__name__)
+    serializers.init_app(app)
+    if con_metricas:
+        metrics.init_app(app)
+
+    @app.route('/dato')
+    def dato():
+        return jsonify({"ok": True})
+
+    return app
+
+
+@pytest.mark.parametrize('con_metricas', [False, True])
+def test_msgpack_no_depende_de_las_metricas(con_metricas):
+    if serializers.msgpack is None:
+        pytest.skip("msgpack no está instalado")
+    app = _app(con_metricas)
+
+    r = app.test_client().get('/dato', headers={'Accept': 'application/msgpack'})
+
+    assert r.mimetype == 'application/msgpack'
+    assert serializers.msgpack.unpackb(r.data) == {"ok": True}
+    assert isinstance(app.json, serializers.FastJSONProvider)
+
+
+def test_metricas_miden_la_serializacion():
+    app = _app(con_metricas=True)
+    antes = metrics.SERIALIZATION_SECONDS._values.get((), [None, 0.0, 0])[2]
+
+    assert app.test_client().get('/dato').get_json() == {"ok": True}
+
+    assert metrics.SERIALIZATION_SECONDS._values[()][2] > antes
@@ -0,0 +1,12 @@
+"""
+Punto de entrada WSGI para producción
+
+    TIENDA_WORKERS=4 gunicorn -c gunicorn.conf.py wsgi:app
+
+Cada proceso worker importa este módulo por separado, así que los
+repositorios, hilos y conexiones se crean después del fork.
+"""
+from APP import app, init_database
+
+# Solo el primer worker que arranque sobre un directorio vacío siembra datos
+init_database()